@@ -1,319 +1,4252 @@
 import datetime
-from flask import Flask, render_template, redirect, url_for, flash, request
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+import click
+from flask import Flask, render_template, redirect, url_for, flash, request, abort, jsonify, make_response, session, Response, send_file, stream_with_context
+from markupsafe import Markup, escape
+from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user, user_logged_in, user_loaded_from_cookie
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.utils import safe_join, secure_filename
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, MultipleFileField
 from flask_mail import Message, Mail
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField, TextAreaField, FloatField
-from wtforms.validators import InputRequired, Length, DataRequired, Email
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField, TextAreaField, FloatField, IntegerField, DateField
+from wtforms.validators import InputRequired, Length, DataRequired, Email, NumberRange, Optional, URL
 from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from bs4 import BeautifulSoup, SoupStrainer
 
 from openai import OpenAI
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 import json
 import argparse
+import mimetypes
+import bisect
+import csv
+import functools
+import gzip
+import hashlib
+import html
+import http.client
+import io
+import ipaddress
+import itertools
+import math
+import posixpath
+import re
+import signal
+import socket
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+import urllib.robotparser
+import uuid
+import zipfile
+from collections import Counter, OrderedDict, defaultdict, deque
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urldefrag, urlencode, urljoin, urlsplit, urlunsplit
+
+
+import os
+
+app = Flask(__name__)
+
+load_dotenv()
+
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///database.db')
+app.config['SECRET_KEY'] = 'QPEunVzlmptwr73MfPz44w=='
+api_token = os.getenv("API_TOKEN")
+log_config_id = os.getenv("CONFIG_ID")
+
+app.config["MAIL_SERVER"] = "smtp.gmail.com"
+app.config["MAIL_PORT"] = 465
+app.config["MAIL_USE_SSL"] = True
+app.config["MAIL_USERNAME"] = os.getenv("MAIL_USERNAME")  # Replace with your email address
+app.config["MAIL_PASSWORD"] = os.getenv("MAIL_PASSWORD") # Replace with your email password
+
+
+mail = Mail(app)
+
+client = OpenAI()
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+
+db = SQLAlchemy(app)
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # The web workers and the job worker write to the same SQLite file; WAL
+    # lets readers carry on while a job commits a batch.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+login_manager = LoginManager(app)
+login_manager.login_view = 'login'
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(20), unique=True, nullable=True)
+    first_name = db.Column(db.String(20), nullable=True)
+    last_name = db.Column(db.String(20), nullable=True)
+    password = db.Column(db.String(20), nullable=False)
+    email = db.Column(db.String(100), nullable=False)
+    # Set when the account is deleted; the purge job removes the rest later.
+    deactivated_at = db.Column(db.DateTime, nullable=True)
+    # Tombstones at or below this seq have been swept, see /api/sync.
+    sync_floor = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+     
+    flash_card_sets = db.relationship('FlashCardSet', backref='user', lazy=True)
+
+
+class FlashCardSet(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    set_title = db.Column(db.String(255), nullable=False)
+    set_description = db.Column(db.String(255), nullable=False)
+    # Stamped by the database clock. The INSERT asks for CURRENT_TIMESTAMP as
+    # well as the column default because databases created before these
+    # columns were timestamps have no DEFAULT, and SQLite cannot add one.
+    set_creation_date = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now(), index=True)
+    set_modified_date = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now(),
+                                  onupdate=db.func.now())
+
+    # Maintained by the counter triggers; see repair_set_counters().
+    card_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    due_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_due_at = db.Column(db.DateTime, nullable=True)
+    last_practiced_at = db.Column(db.DateTime, nullable=True)
+
+    # AUTOINCREMENT so a deleted set's id, which clients know from its
+    # tombstone, is never handed to a new set.
+    __table_args__ = (
+        db.Index('ix_flash_card_set_user_modified', 'user_id', 'set_modified_date'),
+        {'sqlite_autoincrement': True},
+    )
+
+    flashcard_entries = db.relationship('FlashCardEntry', backref='flashcard_set', lazy=True)
+
+class FlashCardEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(255), nullable=False)
+    definition = db.Column(db.String(255), nullable=False)
+
+    flashcard_set_id = db.Column(db.Integer, db.ForeignKey('flash_card_set.id'), nullable=False, index=True)
+
+    source_url = db.Column(db.String(2048), nullable=True)
+    source_start = db.Column(db.Float, nullable=True)
+    minhash = db.Column(db.LargeBinary, nullable=True)
+    due_at = db.Column(db.DateTime, nullable=True)
+    interval = db.Column(db.Float, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_flash_card_entry_unhashed', 'flashcard_set_id', sqlite_where=db.text('minhash IS NULL')),
+        {'sqlite_autoincrement': True},
+    )
+
+class FlashCardReview(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    flashcard_set_id = db.Column(db.Integer, db.ForeignKey('flash_card_set.id'), nullable=False, index=True)
+    entry_id = db.Column(db.Integer, db.ForeignKey('flash_card_entry.id'), nullable=False, index=True)
+    grade = db.Column(db.Integer, nullable=False)
+    reviewed_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    # Lets clients replay a queue of offline reviews without double counting.
+    client_id = db.Column(db.String(64), nullable=True, unique=True)
+
+class CardLshBucket(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    band_hash = db.Column(db.BigInteger, nullable=False)
+    entry_id = db.Column(db.Integer, db.ForeignKey('flash_card_entry.id'), nullable=False, index=True)
+
+    __table_args__ = (db.Index('ix_card_lsh_bucket_lookup', 'user_id', 'band_hash'),)
+
+class CardDuplicate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    entry_id = db.Column(db.Integer, db.ForeignKey('flash_card_entry.id'), nullable=False)
+    duplicate_id = db.Column(db.Integer, db.ForeignKey('flash_card_entry.id'), nullable=False, index=True)
+    similarity = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('entry_id', 'duplicate_id'),)
+
+class ChangeLog(db.Model):
+    # One row per set or entry, holding its latest change; written by the
+    # change log triggers. AUTOINCREMENT keeps seq from ever being reused.
+    seq = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    set_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    object_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'object_id'),
+        db.Index('ix_change_log_user_seq', 'user_id', 'seq'),
+        db.Index('ix_change_log_set_seq', 'set_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    flashcard_set_id = db.Column(db.Integer, db.ForeignKey('flash_card_set.id'), nullable=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    leased_by = db.Column(db.String(100), nullable=True)
+    leased_until = db.Column(db.DateTime, nullable=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    flashcard_set = db.relationship('FlashCardSet')
+
+    __table_args__ = (db.Index('ix_job_claim', 'status', 'priority', 'run_after'),)
+
+
+def upgrade_schema():
+    # db.create_all() only creates missing tables, so add any columns and
+    # indexes that were introduced after an existing database was created.
+    inspector = db.inspect(db.engine)
+    added = set()
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                connection.execute(db.text(ddl))
+                added.add((table.name, column.name))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        if db.engine.dialect.name == 'sqlite':
+            for table, kind in ((FlashCardSet.__table__, 'set'), (FlashCardEntry.__table__, 'entry')):
+                upgrade_autoincrement(connection, table, kind)
+    return added
+
+
+def upgrade_autoincrement(connection, table, kind):
+    # SQLite only honours AUTOINCREMENT from CREATE TABLE, so tables created
+    # without it are rebuilt. Ids are copied across, and the sequence starts
+    # past every id the change log has a tombstone for. The old table's
+    # triggers go with it and are recreated by the setup functions at startup.
+    sql = connection.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                             {'name': table.name}).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return
+    old = f'{table.name}_old'
+    existing = {row[1] for row in connection.execute(db.text(f'PRAGMA table_info({table.name})'))}
+    columns = ', '.join(column.name for column in table.columns if column.name in existing)
+    triggers = connection.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = :name"),
+                                  {'name': table.name}).scalars().all()
+    for trigger in triggers:
+        connection.execute(db.text(f'DROP TRIGGER {trigger}'))
+    # Legacy renames leave the views and other tables' triggers pointing at
+    # the original name, which the rebuilt table takes over.
+    connection.execute(db.text('PRAGMA legacy_alter_table = ON'))
+    connection.execute(db.text(f'ALTER TABLE {table.name} RENAME TO {old}'))
+    indexes = connection.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"),
+                                 {'name': old}).scalars().all()
+    for index in indexes:
+        connection.execute(db.text(f'DROP INDEX {index}'))
+    table.create(connection)
+    connection.execute(db.text(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}'))
+    connection.execute(db.text(f'DROP TABLE {old}'))
+    connection.execute(db.text('PRAGMA legacy_alter_table = OFF'))
+    connection.execute(db.text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': table.name})
+    connection.execute(db.text(f"""
+        INSERT INTO sqlite_sequence (name, seq) SELECT :name, MAX(
+            COALESCE((SELECT MAX(id) FROM {table.name}), 0),
+            COALESCE((SELECT MAX(object_id) FROM change_log WHERE kind = :kind), 0))
+    """), {'name': table.name, 'kind': kind})
+
+
+# Full-text search. Entries and sets are mirrored into FTS5 tables by
+# triggers, so every write path (ORM, bulk inserts, jobs) keeps them in sync.
+# Each row also carries an "owner" token (u<user id>) which queries AND with
+# the search terms; FTS then intersects the posting lists itself instead of
+# ranking every user's matches and filtering afterwards. The tables use the
+# *_search views as external content, so text is not stored twice and
+# snippet()/highlight() read it back from the base tables.
+
+SEARCH_SCHEMA = [
+    """CREATE VIEW IF NOT EXISTS flash_card_entry_search AS
+        SELECT flash_card_entry.id AS id, 'u' || flash_card_set.user_id AS owner,
+               flash_card_entry.term AS term, flash_card_entry.definition AS definition
+        FROM flash_card_entry JOIN flash_card_set ON flash_card_set.id = flash_card_entry.flashcard_set_id""",
+    """CREATE VIEW IF NOT EXISTS flash_card_set_search AS
+        SELECT id, 'u' || user_id AS owner, set_title, set_description FROM flash_card_set""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS flash_card_entry_fts USING fts5(
+        owner, term, definition, content='flash_card_entry_search', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS flash_card_set_fts USING fts5(
+        owner, set_title, set_description, content='flash_card_set_search', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_fts_insert AFTER INSERT ON flash_card_entry BEGIN
+        INSERT INTO flash_card_entry_fts(rowid, owner, term, definition) VALUES (
+            new.id, (SELECT 'u' || user_id FROM flash_card_set WHERE id = new.flashcard_set_id), new.term, new.definition);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_fts_delete AFTER DELETE ON flash_card_entry BEGIN
+        INSERT INTO flash_card_entry_fts(flash_card_entry_fts, rowid, owner, term, definition) VALUES (
+            'delete', old.id, (SELECT 'u' || user_id FROM flash_card_set WHERE id = old.flashcard_set_id), old.term, old.definition);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_fts_update AFTER UPDATE OF term, definition ON flash_card_entry BEGIN
+        INSERT INTO flash_card_entry_fts(flash_card_entry_fts, rowid, owner, term, definition) VALUES (
+            'delete', old.id, (SELECT 'u' || user_id FROM flash_card_set WHERE id = old.flashcard_set_id), old.term, old.definition);
+        INSERT INTO flash_card_entry_fts(rowid, owner, term, definition) VALUES (
+            new.id, (SELECT 'u' || user_id FROM flash_card_set WHERE id = new.flashcard_set_id), new.term, new.definition);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_set_fts_insert AFTER INSERT ON flash_card_set BEGIN
+        INSERT INTO flash_card_set_fts(rowid, owner, set_title, set_description) VALUES (
+            new.id, 'u' || new.user_id, new.set_title, new.set_description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_set_fts_delete AFTER DELETE ON flash_card_set BEGIN
+        INSERT INTO flash_card_set_fts(flash_card_set_fts, rowid, owner, set_title, set_description) VALUES (
+            'delete', old.id, 'u' || old.user_id, old.set_title, old.set_description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_set_fts_update AFTER UPDATE OF set_title, set_description ON flash_card_set BEGIN
+        INSERT INTO flash_card_set_fts(flash_card_set_fts, rowid, owner, set_title, set_description) VALUES (
+            'delete', old.id, 'u' || old.user_id, old.set_title, old.set_description);
+        INSERT INTO flash_card_set_fts(rowid, owner, set_title, set_description) VALUES (
+            new.id, 'u' || new.user_id, new.set_title, new.set_description);
+    END""",
+]
+
+
+def setup_search_index():
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as connection:
+        existing = {row[0] for row in connection.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        for statement in SEARCH_SCHEMA:
+            connection.execute(db.text(statement))
+        # Index rows written before the search tables existed.
+        for table in ('flash_card_entry_fts', 'flash_card_set_fts'):
+            if table not in existing:
+                connection.execute(db.text(f"INSERT INTO {table}({table}) VALUES ('rebuild')"))
+
+
+# Editing a card invalidates its MinHash signature and deleting it drops its
+# LSH buckets and duplicate pairs. Triggers catch bulk query deletes too.
+
+DEDUP_SCHEMA = [
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_dedup_update AFTER UPDATE OF term, definition ON flash_card_entry BEGIN
+        UPDATE flash_card_entry SET minhash = NULL WHERE id = new.id;
+        DELETE FROM card_lsh_bucket WHERE entry_id = old.id;
+        DELETE FROM card_duplicate WHERE entry_id = old.id OR duplicate_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_dedup_delete AFTER DELETE ON flash_card_entry BEGIN
+        DELETE FROM card_lsh_bucket WHERE entry_id = old.id;
+        DELETE FROM card_duplicate WHERE entry_id = old.id OR duplicate_id = old.id;
+    END""",
+]
+
+
+def apply_sqlite_schema(statements):
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.execute(db.text(statement))
+    return True
+
+
+def setup_dedup_triggers():
+    apply_sqlite_schema(DEDUP_SCHEMA)
+
+
+# Deck counters. card_count, due_count and last_practiced_at live on the set
+# so the deck list never aggregates entries. Triggers keep them in step with
+# every insert, delete, reschedule and review in the same transaction. A card
+# is due when it has never been scheduled or its due_at has passed; because
+# cards also become due just by time passing, next_due_at records the
+# earliest future due_at and sets whose next_due_at has passed are
+# recounted before they are shown.
+
+ENTRY_IS_DUE = "({0}.due_at IS NULL OR {0}.due_at <= datetime('now'))"
+ENTRY_NEXT_DUE = (
+    "CASE WHEN {0}.due_at > datetime('now') AND (next_due_at IS NULL OR {0}.due_at < next_due_at) "
+    "THEN {0}.due_at ELSE next_due_at END"
+)
+
+COUNTER_SCHEMA = [
+    f"""CREATE TRIGGER IF NOT EXISTS flash_card_entry_counters_insert AFTER INSERT ON flash_card_entry BEGIN
+        UPDATE flash_card_set SET card_count = card_count + 1, due_count = due_count + {ENTRY_IS_DUE.format('new')},
+            next_due_at = {ENTRY_NEXT_DUE.format('new')}
+        WHERE id = new.flashcard_set_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flash_card_entry_counters_delete AFTER DELETE ON flash_card_entry BEGIN
+        UPDATE flash_card_set SET card_count = max(card_count - 1, 0), due_count = max(due_count - {ENTRY_IS_DUE.format('old')}, 0)
+        WHERE id = old.flashcard_set_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flash_card_entry_counters_update AFTER UPDATE OF due_at ON flash_card_entry BEGIN
+        UPDATE flash_card_set SET due_count = max(due_count + {ENTRY_IS_DUE.format('new')} - {ENTRY_IS_DUE.format('old')}, 0),
+            next_due_at = {ENTRY_NEXT_DUE.format('new')}
+        WHERE id = new.flashcard_set_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_review_counters_insert AFTER INSERT ON flash_card_review BEGIN
+        UPDATE flash_card_set SET last_practiced_at = max(coalesce(last_practiced_at, ''), new.reviewed_at)
+        WHERE id = new.flashcard_set_id;
+    END""",
+]
+
+
+def setup_set_counters(added):
+    if not apply_sqlite_schema(COUNTER_SCHEMA):
+        return
+    # Sets that existed before the counters did start out at zero.
+    if ('flash_card_set', 'card_count') in added:
+        repair_set_counters()
+
+
+def repair_set_counters(set_ids=None):
+    now = datetime.datetime.utcnow()
+    is_due = db.or_(FlashCardEntry.due_at.is_(None), FlashCardEntry.due_at <= now)
+    query = db.select(
+        FlashCardEntry.flashcard_set_id,
+        db.func.count(),
+        db.func.sum(db.case((is_due, 1), else_=0)),
+        db.func.min(db.case((is_due, None), else_=FlashCardEntry.due_at)),
+        db.select(db.func.max(FlashCardReview.reviewed_at))
+        .where(FlashCardReview.flashcard_set_id == FlashCardEntry.flashcard_set_id).scalar_subquery(),
+    ).group_by(FlashCardEntry.flashcard_set_id)
+    if set_ids is not None:
+        query = query.where(FlashCardEntry.flashcard_set_id.in_(set_ids))
+    counted = {row[0]: row[1:] for row in db.session.execute(query)}
+
+    targets = db.select(FlashCardSet.id)
+    if set_ids is not None:
+        targets = targets.where(FlashCardSet.id.in_(set_ids))
+    rows = []
+    for set_id in db.session.execute(targets).scalars():
+        card_count, due_count, next_due_at, last_practiced_at = counted.get(set_id, (0, 0, None, None))
+        rows.append({'set_id': set_id, 'card_count': card_count, 'due_count': due_count or 0,
+                     'next_due_at': next_due_at, 'last_practiced_at': last_practiced_at})
+    if rows:
+        # Repairing counters is not an edit, so keep set_modified_date as is.
+        db.session.execute(
+            db.update(FlashCardSet.__table__).where(FlashCardSet.__table__.c.id == db.bindparam('set_id')).values(
+                card_count=db.bindparam('card_count'), due_count=db.bindparam('due_count'),
+                next_due_at=db.bindparam('next_due_at'),
+                # Old reviews are swept, so never move last_practiced_at back to NULL.
+                last_practiced_at=db.func.coalesce(db.bindparam('last_practiced_at'),
+                                                   FlashCardSet.__table__.c.last_practiced_at),
+                set_modified_date=FlashCardSet.__table__.c.set_modified_date),
+            rows)
+    db.session.commit()
+    return len(rows)
+
+
+# Adding, editing or removing a card also counts as modifying its set, on
+# every write path, so "recently modified" and sync can trust the column.
+
+MODIFIED_SCHEMA = [
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_touch_insert AFTER INSERT ON flash_card_entry BEGIN
+        UPDATE flash_card_set SET set_modified_date = CURRENT_TIMESTAMP WHERE id = new.flashcard_set_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_touch_update AFTER UPDATE OF term, definition, source_url, source_start ON flash_card_entry BEGIN
+        UPDATE flash_card_set SET set_modified_date = CURRENT_TIMESTAMP WHERE id = new.flashcard_set_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_entry_touch_delete AFTER DELETE ON flash_card_entry BEGIN
+        UPDATE flash_card_set SET set_modified_date = CURRENT_TIMESTAMP WHERE id = old.flashcard_set_id;
+    END""",
+]
+
+
+# Change log for delta sync. Every insert, edit and delete of a set or entry
+# replaces that object's row in change_log with a fresh seq, so the table
+# holds exactly one row per object (a tombstone once it is deleted) and a
+# client that last saw seq N only needs rows with seq > N. SQLite serialises
+# writers, so a seq is never committed after a larger one is visible.
+# MAX(seq) per user or per set doubles as a cheap version number.
+
+ENTRY_OWNER = "(SELECT user_id FROM flash_card_set WHERE id = {0}.flashcard_set_id)"
+
+CHANGE_LOG_SCHEMA = [
+    """CREATE TRIGGER IF NOT EXISTS flash_card_set_log_insert AFTER INSERT ON flash_card_set BEGIN
+        INSERT OR REPLACE INTO change_log (user_id, set_id, kind, object_id, op) VALUES (new.user_id, new.id, 'set', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS flash_card_set_log_update AFTER UPDATE OF set_title, set_description ON flash_card_set BEGIN
+        INSERT OR REPLACE INTO change_log (user_id, set_id, kind, object_id, op) VALUES (new.user_id, new.id, 'set', new.id, 'upsert');
+    END""",
+    # The set's entry tombstones stay in the log: a client that only saw the
+    # set tombstone could otherwise keep entries whose deletes were dropped.
+    """CREATE TRIGGER IF NOT EXISTS flash_card_set_log_delete AFTER DELETE ON flash_card_set BEGIN
+        INSERT OR REPLACE INTO change_log (user_id, set_id, kind, object_id, op) VALUES (old.user_id, old.id, 'set', old.id, 'delete');
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flash_card_entry_log_insert AFTER INSERT ON flash_card_entry BEGIN
+        INSERT OR REPLACE INTO change_log (user_id, set_id, kind, object_id, op)
+        VALUES ({ENTRY_OWNER.format('new')}, new.flashcard_set_id, 'entry', new.id, 'upsert');
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flash_card_entry_log_update
+        AFTER UPDATE OF term, definition, source_url, source_start, due_at, interval ON flash_card_entry BEGIN
+        INSERT OR REPLACE INTO change_log (user_id, set_id, kind, object_id, op)
+        VALUES ({ENTRY_OWNER.format('new')}, new.flashcard_set_id, 'entry', new.id, 'upsert');
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS flash_card_entry_log_delete AFTER DELETE ON flash_card_entry
+        WHEN {ENTRY_OWNER.format('old')} IS NOT NULL BEGIN
+        INSERT OR REPLACE INTO change_log (user_id, set_id, kind, object_id, op)
+        VALUES ({ENTRY_OWNER.format('old')}, old.flashcard_set_id, 'entry', old.id, 'delete');
+    END""",
+]
+
+SYNC_PAGE_SIZE = 1000
+
+
+def setup_change_log():
+    if not apply_sqlite_schema(CHANGE_LOG_SCHEMA):
+        return
+    # Sets and entries written before the log existed start out as upserts.
+    if db.session.execute(db.select(ChangeLog.seq).limit(1)).first() is None:
+        db.session.execute(db.text("""
+            INSERT INTO change_log (user_id, set_id, kind, object_id, op)
+            SELECT user_id, id, 'set', id, 'upsert' FROM flash_card_set
+        """))
+        db.session.execute(db.text("""
+            INSERT INTO change_log (user_id, set_id, kind, object_id, op)
+            SELECT flash_card_set.user_id, flash_card_entry.flashcard_set_id, 'entry', flash_card_entry.id, 'upsert'
+            FROM flash_card_entry JOIN flash_card_set ON flash_card_set.id = flash_card_entry.flashcard_set_id
+        """))
+        db.session.commit()
+
+
+def user_version(user_id):
+    return db.session.execute(db.select(db.func.max(ChangeLog.seq)).where(ChangeLog.user_id == user_id)).scalar() or 0
+
+
+def set_version(set_id):
+    return db.session.execute(db.select(db.func.max(ChangeLog.seq)).where(ChangeLog.set_id == set_id)).scalar() or 0
+
+
+def deck_list_version(user_id):
+    # Every edit reaches the change log. Due counts also grow as time passes,
+    # and only ever shrink through logged reviews or deletes, so their sum
+    # tells whether refresh_due_counts moved any of them.
+    due = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(FlashCardSet.due_count), 0)).where(FlashCardSet.user_id == user_id)
+    ).scalar()
+    return f'{user_version(user_id)}.{due}'
+
+
+# Conditional GET. Pages decorated with conditional_page get a weak ETag made
+# from the version counters they are rendered from, plus the code, template
+# and asset versions, so a revisit whose ETag still matches is answered with
+# 304 before the view queries or renders anything. A version function that
+# returns None, for a missing or foreign set, leaves the request to the view.
+
+page_salt = {}
+
+
+def page_version_salt():
+    if 'salt' not in page_salt or app.debug:
+        template_folder = os.path.join(app.root_path, app.template_folder)
+        stamps = [os.stat(__file__).st_mtime_ns] + [
+            (name, os.stat(os.path.join(template_folder, name)).st_mtime_ns) for name in sorted(os.listdir(template_folder))]
+        page_salt['salt'] = repr((stamps, sorted(asset_manifest()['files'].items())))
+    return page_salt['salt']
+
+
+def conditional_page(version):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            parts = version(**kwargs) if request.method == 'GET' else None
+            # Pending flash messages have to be rendered, so never skip those.
+            if parts is None or session.get('_flashes'):
+                return view(**kwargs)
+            etag = hashlib.blake2b(repr((request.endpoint, current_user.id, htmx_request(), parts,
+                                         page_version_salt())).encode(), digest_size=10).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('HX-Request')
+            return response
+        return wrapper
+    return decorator
+
+
+# Partial updates. Deck rows are created, renamed and deleted by htmx, which
+# sends HX-Request and swaps the returned fragment in place of the row. Any
+# flash messages ride along and are swapped out of band into the page's
+# message area. Without JavaScript the same routes redirect as before.
+
+def htmx_request():
+    return request.headers.get('HX-Request') == 'true'
+
+
+def htmx_fragment(template=None, **context):
+    # No template swaps the target out for nothing, e.g. a deleted row.
+    fragment = render_template(template, **context) if template else ''
+    response = make_response(fragment + render_template('flash_messages.html', oob=True))
+    response.vary.add('HX-Request')
+    return response
+
+
+def owned_set_version(set_id):
+    owner = db.session.execute(db.select(FlashCardSet.user_id).where(FlashCardSet.id == set_id)).scalar()
+    return set_version(set_id) if owner is not None and owner == current_user.id else None
+
+
+def edit_page_version(set_id):
+    version = owned_set_version(set_id)
+    # The form's CSRF token expires, so a page older than half its lifetime
+    # is rendered again rather than revalidated.
+    csrf_window = (app.config.get('WTF_CSRF_TIME_LIMIT') or 3600) // 2
+    return None if version is None else (version, int(time.time() // csrf_window))
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+def set_sync_payload(flash_card_set):
+    return {
+        'id': flash_card_set.id,
+        'set_title': flash_card_set.set_title,
+        'set_description': flash_card_set.set_description,
+        'set_creation_date': isoformat(flash_card_set.set_creation_date),
+        'set_modified_date': isoformat(flash_card_set.set_modified_date),
+    }
+
+
+def entry_sync_payload(entry):
+    return {
+        'id': entry.id,
+        'flashcard_set_id': entry.flashcard_set_id,
+        'term': entry.term,
+        'definition': entry.definition,
+        'source_url': entry.source_url,
+        'source_start': entry.source_start,
+        'due_at': isoformat(entry.due_at),
+        'interval': entry.interval,
+    }
+
+
+def parse_sync_token(token):
+    # "<seq>" or, for tokens issued below the sync floor, "<seq>.<floor>".
+    seq, _, floor = (token or '0').partition('.')
+    return int(seq), int(floor or 0)
+
+
+def sync_changes(user_id, since=0, limit=SYNC_PAGE_SIZE, floor_seen=0):
+    # Tombstones older than the retention window are swept; a client whose
+    # token predates the sweep may have missed deletions and starts over.
+    # Tokens below the floor carry the floor they were issued under, so a
+    # pass that began after the sweep can keep paging.
+    floor = db.session.execute(db.select(User.sync_floor).where(User.id == user_id)).scalar() or 0
+    reset = 0 < since < floor and floor_seen < floor
+    if reset:
+        since = 0
+    changes = db.session.execute(
+        db.select(ChangeLog.seq, ChangeLog.kind, ChangeLog.object_id, ChangeLog.op)
+        .where(ChangeLog.user_id == user_id, ChangeLog.seq > since)
+        .order_by(ChangeLog.seq).limit(limit + 1)
+    ).all()
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    upserts = {'set': [], 'entry': []}
+    deleted = {'set': [], 'entry': []}
+    for seq, kind, object_id, op in changes:
+        (deleted if op == 'delete' else upserts)[kind].append(object_id)
+
+    sets = FlashCardSet.query.filter(FlashCardSet.id.in_(upserts['set']), FlashCardSet.user_id == user_id).all() \
+        if upserts['set'] else []
+    entries = FlashCardEntry.query.filter(FlashCardEntry.id.in_(upserts['entry'])).all() if upserts['entry'] else []
+    token = changes[-1][0] if changes else since
+    return {
+        'token': str(token) if token >= floor else f'{token}.{floor}',
+        'reset': reset,
+        'more': more,
+        'sets': [set_sync_payload(flash_card_set) for flash_card_set in sets],
+        'entries': [entry_sync_payload(entry) for entry in entries],
+        'deleted': {'sets': deleted['set'], 'entries': deleted['entry']},
+    }
+
+
+def refresh_due_counts(user_id):
+    # Recount only the sets where a scheduled card has become due since the
+    # counters were last touched.
+    stale = db.session.execute(
+        db.select(FlashCardSet.id).where(FlashCardSet.user_id == user_id,
+                                          FlashCardSet.next_due_at <= datetime.datetime.utcnow())
+    ).scalars().all()
+    if stale:
+        repair_set_counters(stale)
+
+
+with app.app_context():
+    db.create_all()
+    added_columns = upgrade_schema()
+    setup_search_index()
+    setup_dedup_triggers()
+    setup_set_counters(added_columns)
+    apply_sqlite_schema(MODIFIED_SCHEMA)
+    setup_change_log()
+
+@login_manager.user_loader
+def load_user(user_id):
+    user = User.query.get(int(user_id))
+    if user is None or user.deactivated_at is not None:
+        return None
+    return user
+
+
+
+class AccountDeleteForm(FlaskForm):
+    password = PasswordField('Password', validators=[InputRequired()])
+    submit = SubmitField('Delete my account')
+
+class LoginForm(FlaskForm):
+    email = StringField('Email', validators=[InputRequired(), Length(min=4, max=100)])
+    password = PasswordField('Password', validators=[InputRequired(), Length(min=8, max=64)])
+
+class RegistrationForm(FlaskForm):
+    email = StringField('Email', validators=[InputRequired(), Length(min=4, max=100)])
+    password = PasswordField('Password', validators=[InputRequired(), Length(min=8, max=64)])
+
+class FlashCardSetForm(FlaskForm):
+    set_title = StringField('Set Title', validators=[DataRequired(), Length(max=255)])
+    set_description = StringField('Set Description', validators=[InputRequired(), Length(max=255)])
+    submit = SubmitField('Create Set')
+
+class FlashCardSetEditForm(FlaskForm):
+    set_title = StringField('Set Title', validators=[InputRequired()])
+    set_description = StringField('Set Description', validators=[InputRequired()])
+    submit = SubmitField('Update Set')
+
+class FlashCardEntryForm(FlaskForm):
+    flashcard_set_id = StringField('FlashCardSet ID', validators=[InputRequired()])
+    term = StringField('Term', validators=[InputRequired()])
+    definition = StringField('Definition', validators=[InputRequired()])
+    submit = SubmitField('Save Entry')
+
+class FlashCardTextForm(FlaskForm):
+    set_title = StringField('Set Title', validators=[InputRequired()])
+    set_description = StringField('Set Description', validators=[InputRequired()])
+    text = TextAreaField('Text', validators=[InputRequired()])
+    max_cards = IntegerField('Number of Cards', default=20, validators=[Optional(), NumberRange(min=1, max=200)])
+    refine_with_ai = BooleanField('Refine with AI')
+    submit = SubmitField('Generate Cards')
+
+class FlashCardImportForm(FlaskForm):
+    set_title = StringField('Set Title', validators=[InputRequired()])
+    set_description = StringField('Set Description', validators=[InputRequired()])
+    terms = TextAreaField('Terms')
+    file = FileField('File')
+    submit = SubmitField('Import Cards')
+
+class FlashCardWebForm(FlaskForm):
+    url = StringField('Web Page URL', validators=[InputRequired(), URL(require_tld=False)])
+    set_title = StringField('Set Title')
+    set_description = StringField('Set Description')
+    max_cards = IntegerField('Number of Cards', default=20, validators=[Optional(), NumberRange(min=1, max=200)])
+    crawl = BooleanField('Follow links on this site')
+    max_pages = IntegerField('Maximum Pages', default=10, validators=[Optional(), NumberRange(min=1, max=200)])
+    max_depth = IntegerField('Link Depth', default=1, validators=[Optional(), NumberRange(min=0, max=5)])
+    submit = SubmitField('Generate Cards')
+
+class FlashCardCaptionForm(FlaskForm):
+    set_title = StringField('Set Title', validators=[InputRequired()])
+    set_description = StringField('Set Description')
+    video_url = StringField('Video URL', validators=[Optional(), URL(require_tld=False)])
+    caption_url = StringField('Caption File URL', validators=[Optional(), URL(require_tld=False)])
+    files = MultipleFileField('Caption Files')
+    cards_per_window = IntegerField('Cards per Window', default=5, validators=[Optional(), NumberRange(min=1, max=20)])
+    submit = SubmitField('Generate Cards')
+
+class FlashCardSocialForm(FlaskForm):
+    set_title = StringField('Set Title', validators=[InputRequired()])
+    set_description = StringField('Set Description')
+    file = FileField('Export File')
+    hashtag = StringField('Hashtag')
+    thread = StringField('Thread or Post ID')
+    date_from = DateField('From', validators=[Optional()])
+    date_to = DateField('To', validators=[Optional()])
+    max_cards = IntegerField('Number of Cards', default=50, validators=[Optional(), NumberRange(min=1, max=1000)])
+    submit = SubmitField('Generate Cards')
+
+class ContactUsForm(FlaskForm):
+    name = StringField("Name", validators=[DataRequired()])
+    email = StringField("Email", validators=[DataRequired()])
+    message = TextAreaField("Message", validators=[DataRequired()])
+    submit = SubmitField("Send")
+
+# Offline card generation: split the text into sentences, rank key phrases
+# with RAKE weighted by TF-IDF across sentences, then pick the sentence that
+# best reads as a definition for each phrase. Everything is built in a single
+# pass over the text into counters and phrase -> sentence postings, so large
+# pastes never rescan the whole text per candidate.
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each either etc few for from further had has
+have having he her here hers herself him himself his how however i if in into is it its itself just least
+less let like many may me might more most much must my myself no nor not now of off often on once only
+or other otherwise our ours ourselves out over own per rather same several she should since so some such
+than that the their theirs them themselves then there these they this those though through thus to too
+under until up upon us used using very via was we were what when where whether which while who whom
+whose why will with within without would yet you your yours yourself yourselves
+called known means refers defined describes include includes including consists
+""".split())
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(\[])')
+PHRASE_SPLIT_RE = re.compile(r"[^A-Za-z0-9'\- ]+")
+WORD_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9'\-]*")
+DEFINITION_CUE_RE = re.compile(
+    r"(?:\s*,)?\s+(?:is defined as|is known as|is called|refers to|consists of|means|describes|"
+    r"is|are|was|were)\s+", re.I)
+DEFINITION_SUBJECT_RE = re.compile(
+    r"(?:(?:the|a|an)\s+)?([A-Za-z0-9][A-Za-z0-9'\- ]{1,60}?)" + DEFINITION_CUE_RE.pattern, re.I)
+
+MAX_PHRASE_WORDS = 4
+MAX_FIELD_LENGTH = 255
+
+
+def split_sentences(text):
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = ' '.join(paragraph.split())
+        if not paragraph:
+            continue
+        for sentence in SENTENCE_SPLIT_RE.split(paragraph):
+            sentence = sentence.strip()
+            if len(sentence) > 2:
+                yield sentence
+
+
+def candidate_phrases(sentence):
+    for chunk in PHRASE_SPLIT_RE.split(sentence):
+        phrase = []
+        for word in WORD_RE.findall(chunk):
+            if word.lower() in STOPWORDS:
+                if phrase:
+                    yield phrase
+                phrase = []
+            else:
+                phrase.append(word)
+        if phrase:
+            yield phrase
+
+
+def truncate_field(value):
+    value = value.strip()
+    if len(value) <= MAX_FIELD_LENGTH:
+        return value
+    return value[:MAX_FIELD_LENGTH - 3].rstrip() + '...'
+
+
+def definition_from_sentence(phrase, sentence):
+    match = re.search(r'\b' + re.escape(phrase) + r'\b', sentence, re.I)
+    if match:
+        cue = DEFINITION_CUE_RE.match(sentence, match.end())
+        if cue and match.start() < 40:
+            definition = sentence[cue.end():].rstrip('.')
+            return truncate_field(definition[:1].upper() + definition[1:])
+    return truncate_field(sentence)
+
+
+def extract_flash_cards(text, max_cards=20):
+    # text is either a string or an iterable of already split sentences; each
+    # card records the index of the sentence its definition came from.
+    if isinstance(text, str):
+        text = split_sentences(text)
+    sentences = []
+    word_freq = Counter()
+    word_degree = Counter()
+    sentence_freq = Counter()
+    phrase_counts = Counter()
+    phrase_postings = defaultdict(list)
+    phrase_display = {}
+    defined = Counter()
+
+    for index, sentence in enumerate(text):
+        sentences.append(sentence)
+        subject = DEFINITION_SUBJECT_RE.match(sentence)
+        if subject and len(subject.group(1).split()) <= MAX_PHRASE_WORDS:
+            key = subject.group(1).lower()
+            defined[key] += 1
+            phrase_postings[key].append(index)
+            phrase_display.setdefault(key, subject.group(1))
+        seen_words = set()
+        for words in candidate_phrases(sentence):
+            lowered = [word.lower() for word in words]
+            for word in lowered:
+                word_freq[word] += 1
+                word_degree[word] += len(lowered)
+                seen_words.add(word)
+            if len(words) > MAX_PHRASE_WORDS or all(word.isdigit() for word in words):
+                continue
+            key = ' '.join(lowered)
+            phrase_counts[key] += 1
+            postings = phrase_postings[key]
+            if postings[-1:] != [index]:
+                postings.append(index)
+            phrase_display.setdefault(key, ' '.join(words))
+        sentence_freq.update(seen_words)
+
+    if not sentences:
+        return []
+
+    total = len(sentences)
+    word_scores = {}
+    for word, freq in word_freq.items():
+        idf = math.log((1 + total) / (1 + sentence_freq[word])) + 1
+        word_scores[word] = (word_degree[word] / freq) * idf
+
+    def phrase_score(key):
+        score = sum(word_scores.get(word, 0) for word in key.split())
+        score *= math.log(2 + phrase_counts[key] + defined[key])
+        # Phrases the text explicitly defines ("X is ...") make the best cards.
+        return (defined[key] > 0, score)
+
+    ranked = sorted(phrase_postings, key=phrase_score, reverse=True)
+
+    cards = []
+    used_sentences = set()
+    used_words = set()
+    for key in ranked:
+        if len(cards) >= max_cards:
+            break
+        if len(key) < 3 or key in used_words:
+            continue
+        best_index = None
+        best_score = None
+        for index in phrase_postings[key]:
+            sentence = sentences[index]
+            if index in used_sentences or len(sentence.split()) < 4:
+                continue
+            position = sentence.lower().find(key)
+            score = -abs(len(sentence) - 120) / 120.0 - position / 80.0
+            if DEFINITION_CUE_RE.match(sentence, position + len(key)):
+                score += 2
+            if best_score is None or score > best_score:
+                best_index, best_score = index, score
+        if best_index is None:
+            continue
+        used_sentences.add(best_index)
+        used_words.update(key.split())
+        term = phrase_display[key]
+        cards.append({
+            'term': truncate_field(term[:1].upper() + term[1:]),
+            'definition': definition_from_sentence(key, sentences[best_index]),
+            'sentence_index': best_index,
+        })
+    return cards
+
+
+def refine_flash_cards_with_ai(cards):
+    # Optional pass over the locally generated cards; on any failure the
+    # offline cards are returned unchanged.
+    try:
+        response = client.chat.completions.create(
+            model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            messages=[
+                {"role": "system", "content": "You improve study flashcards. Reply only with a JSON array of "
+                                              "objects with 'term' and 'definition' keys, in the same order."},
+                {"role": "user", "content": json.dumps([
+                    {'term': card['term'], 'definition': card['definition']} for card in cards
+                ])},
+            ],
+        )
+        refined = json.loads(response.choices[0].message.content)
+        return [
+            {'term': truncate_field(card['term']), 'definition': truncate_field(card['definition'])}
+            for card in refined if card.get('term') and card.get('definition')
+        ] or cards
+    except Exception as e:
+        print("AI refinement failed", e)
+        return cards
+
+
+# Bulk term/definition import. Input is consumed line by line so an uploaded
+# glossary is never held in memory; the delimiter is guessed from the first
+# lines and entries are written in batches, one short transaction each.
+
+IMPORT_SAMPLE_LINES = 50
+IMPORT_BATCH_SIZE = 1000
+IMPORT_COLUMNS = ('term', 'definition', 'source_url', 'source_start')
+DASH_SEPARATOR_RE = re.compile(r'\s+[-\u2013\u2014:]\s+')
+
+
+def sniff_delimiter(sample_lines):
+    lines = [line for line in sample_lines if line.strip()]
+    if not lines:
+        return '\t'
+
+    def share(test):
+        return sum(1 for line in lines if test(line)) / len(lines)
+
+    if share(lambda line: '\t' in line) >= 0.9:
+        return '\t'
+    if share(lambda line: DASH_SEPARATOR_RE.search(line)) >= 0.9:
+        return None
+    try:
+        return csv.Sniffer().sniff(''.join(lines), delimiters=',;|').delimiter
+    except csv.Error:
+        return None
+
+
+def parse_flash_card_rows(lines):
+    lines = iter(lines)
+    head = list(itertools.islice(lines, IMPORT_SAMPLE_LINES))
+    delimiter = sniff_delimiter(head)
+    lines = itertools.chain(head, lines)
+    if delimiter is None:
+        rows = (DASH_SEPARATOR_RE.split(line.strip(), 1) for line in lines)
+    else:
+        rows = csv.reader(lines, delimiter=delimiter)
+
+    for row in rows:
+        if len(row) < 2:
+            continue
+        term, definition = row[0].strip(), row[1].strip()
+        if not term or not definition:
+            continue
+        if term.lower() == 'term' and definition.lower() == 'definition':
+            continue
+        yield truncate_field(term), truncate_field(definition)
+
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_flash_card_rows(flashcard_set_id, rows, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    # rows are (term, definition) tuples, optionally followed by
+    # (source_url, source_start) when the card links back to its source.
+    imported = 0
+    for batch in iter_batches(rows, batch_size):
+        db.session.execute(db.insert(FlashCardEntry), [
+            dict(zip(IMPORT_COLUMNS, row), flashcard_set_id=flashcard_set_id) for row in batch
+        ])
+        db.session.commit()
+        imported += len(batch)
+        if progress:
+            progress(imported)
+    return imported
+
+
+# Web page ingestion. Raw responses are kept gzip-compressed under
+# instance/web_cache next to a small JSON record of their validators, so a
+# repeat fetch is either served from disk (while fresh) or revalidated with
+# If-None-Match / If-Modified-Since and answered by a 304.
+
+WEB_CACHE_DIR = os.path.join(app.instance_path, 'web_cache')
+WEB_CACHE_FRESH_SECONDS = 300
+WEB_FETCH_TIMEOUT = 15
+WEB_MAX_BYTES = 5 * 1024 * 1024
+WEB_USER_AGENT = 'CardBase/1.0 (+flashcard generator)'
+
+# Networks outside the public internet that fetches may still reach, e.g.
+# WEB_ALLOWED_NETWORKS="10.20.0.0/16" for an intranet wiki.
+WEB_ALLOWED_NETWORKS = [ipaddress.ip_network(network) for network in os.getenv('WEB_ALLOWED_NETWORKS', '').split()]
+
+CONTENT_TAGS = ['h1', 'h2', 'h3', 'h4', 'p', 'li', 'dt', 'dd', 'blockquote', 'pre']
+BOILERPLATE_TAGS = ['nav', 'aside', 'footer', 'header', 'form', 'script', 'style', 'noscript', 'svg']
+BOILERPLATE_RE = re.compile(
+    r'nav|menu|footer|header|sidebar|breadcrumb|cookie|banner|comment|share|social|related|advert|promo|subscribe',
+    re.I)
+
+
+def web_cache_paths(url):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    base = os.path.join(WEB_CACHE_DIR, key[:2], key)
+    return base + '.json', base + '.html.gz'
+
+
+def read_web_cache(url):
+    meta_path, body_path = web_cache_paths(url)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with gzip.open(body_path, 'rb') as f:
+            return meta, f.read()
+    except (OSError, ValueError):
+        return None, None
+
+
+def write_web_cache(url, meta, body):
+    meta_path, body_path = web_cache_paths(url)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    # Write to temporary names first so readers never see half a file.
+    with gzip.open(body_path + '.tmp', 'wb', compresslevel=6) as f:
+        f.write(body)
+    os.replace(body_path + '.tmp', body_path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+# Users choose the URLs we fetch, so every connection resolves its host and
+# refuses anything but public addresses: loopback, private ranges, link-local
+# (cloud metadata at 169.254.169.254) and so on. The check runs when the
+# socket is opened, so each redirect hop is checked too and a DNS answer
+# cannot change between the check and the connection. The opener only
+# speaks http and https and ignores proxy settings.
+
+def public_addresses(host, port):
+    addresses = []
+    for family, _, _, _, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if getattr(address, 'ipv4_mapped', None):
+            address = address.ipv4_mapped
+        if not any(address in network for network in WEB_ALLOWED_NETWORKS) and (
+                not address.is_global or address.is_multicast):
+            raise ValueError(f"{host} is not a public address.")
+        addresses.append((family, sockaddr))
+    return addresses
+
+
+def check_public_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError("Only http and https URLs can be fetched.")
+    public_addresses(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+
+
+def public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    error = None
+    for family, sockaddr in public_addresses(*address):
+        try:
+            return socket.create_connection(sockaddr[:2], timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error or OSError(f"Could not connect to {address[0]}.")
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+def build_web_opener():
+    opener = urllib.request.OpenerDirector()
+    for handler in (urllib.request.UnknownHandler(), PublicHTTPHandler(), PublicHTTPSHandler(),
+                    urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPRedirectHandler(),
+                    urllib.request.HTTPErrorProcessor()):
+        opener.add_handler(handler)
+    return opener
+
+
+web_opener = build_web_opener()
+
+
+def fetch_web_page(url):
+    check_public_url(url)
+    meta, body = read_web_cache(url)
+    if meta and time.time() - meta['checked_at'] < WEB_CACHE_FRESH_SECONDS:
+        return meta, body
+
+    fetch_request = urllib.request.Request(url, headers={
+        'User-Agent': WEB_USER_AGENT,
+        'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.5',
+    })
+    if meta:
+        if meta.get('etag'):
+            fetch_request.add_header('If-None-Match', meta['etag'])
+        if meta.get('last_modified'):
+            fetch_request.add_header('If-Modified-Since', meta['last_modified'])
+
+    try:
+        with web_opener.open(fetch_request, timeout=WEB_FETCH_TIMEOUT) as response:
+            body = response.read(WEB_MAX_BYTES + 1)
+            if len(body) > WEB_MAX_BYTES:
+                raise ValueError("The page is too large to import.")
+            meta = {
+                'url': url,
+                'final_url': response.geturl(),
+                'content_type': response.headers.get_content_type(),
+                'charset': response.headers.get_content_charset(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or meta is None:
+            raise
+    meta['checked_at'] = time.time()
+    write_web_cache(url, meta, body)
+    return meta, body
+
+
+def block_text(tag):
+    text = ' '.join(tag.get_text(' ', strip=True).split())
+    if not text:
+        return ''
+    link_text = sum(len(a.get_text(strip=True)) for a in tag.find_all('a'))
+    if link_text > 0.5 * len(text):
+        return ''
+    if tag.name not in ('h1', 'h2', 'h3', 'h4') and len(text) < 40:
+        return ''
+    return text
+
+
+def is_boilerplate(tag):
+    marker = ' '.join(tag.get('class') or []) + ' ' + (tag.get('id') or '')
+    return BOILERPLATE_RE.search(marker) is not None
+
+
+def extract_main_text(html, charset=None):
+    # SoupStrainer keeps the parser from building a tree for anything outside
+    # the elements we ask for; the full document is never materialised.
+    title = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('title'), from_encoding=charset)
+    title = title.title.get_text(strip=True) if title.title else ''
+
+    main = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer(['main', 'article']), from_encoding=charset)
+    for tag in main.find_all(BOILERPLATE_TAGS):
+        tag.decompose()
+    blocks = [block_text(tag) for tag in main.find_all(CONTENT_TAGS)]
+    blocks = [text for text in blocks if text]
+
+    if sum(len(text) for text in blocks) < 200:
+        content = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer(CONTENT_TAGS), from_encoding=charset)
+        blocks = []
+        for tag in content.find_all(CONTENT_TAGS):
+            if tag.find_parent(CONTENT_TAGS) is None and not is_boilerplate(tag):
+                text = block_text(tag)
+                if text:
+                    blocks.append(text)
+
+    return title, '\n\n'.join(blocks)
+
+
+# Site crawling for docs sites and sitemaps. A small thread pool fetches
+# pages (through the same web cache) while the caller consumes extracted text
+# as each page completes. Every host gets its own politeness delay and
+# robots.txt check, and the crawl stops at the page, depth or byte budget.
+# Pages and robots.txt both go through web_opener, so a crawl never reaches
+# a non-public address.
+
+CRAWL_MAX_WORKERS = 4
+CRAWL_HOST_DELAY = 1.0
+CRAWL_MAX_BYTES = 20 * 1024 * 1024
+CRAWL_SKIP_EXTENSIONS = ('.pdf', '.zip', '.gz', '.tar', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp',
+                         '.mp3', '.mp4', '.mov', '.avi', '.css', '.js', '.ico', '.woff', '.woff2', '.exe', '.dmg')
+SITEMAP_LOC_RE = re.compile(rb'<loc>\s*([^<\s]+)\s*</loc>', re.I)
+
+
+def canonicalize_url(url, base=None):
+    if base:
+        url = urljoin(base, url)
+    url = urldefrag(url.strip())[0]
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if scheme not in ('http', 'https') or not host:
+        return None
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    netloc = host if port is None or (scheme, port) in (('http', 80), ('https', 443)) else f'{host}:{port}'
+    path = parts.path or '/'
+    if path != '/':
+        path = posixpath.normpath(path) + ('/' if path.endswith('/') else '')
+        path = path.replace('//', '/')
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_')
+    ))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class HostRateLimiter:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RobotsCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parsers = {}
+
+    def allowed(self, url):
+        parts = urlsplit(url)
+        root = f'{parts.scheme}://{parts.netloc}'
+        with self.lock:
+            parser = self.parsers.get(root)
+        if parser is None:
+            parser = urllib.robotparser.RobotFileParser(root + '/robots.txt')
+            try:
+                robots_request = urllib.request.Request(root + '/robots.txt', headers={'User-Agent': WEB_USER_AGENT})
+                with web_opener.open(robots_request, timeout=WEB_FETCH_TIMEOUT) as response:
+                    parser.parse(response.read(512 * 1024).decode('utf-8', 'replace').splitlines())
+            except (urllib.error.URLError, OSError, ValueError):
+                parser.allow_all = True
+            with self.lock:
+                self.parsers[root] = parser
+        return parser.can_fetch(WEB_USER_AGENT, url)
+
+
+def is_sitemap(url, meta):
+    return url.endswith('.xml') or meta.get('content_type') in ('application/xml', 'text/xml')
+
+
+def extract_links(html, base_url, charset=None):
+    links = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('a', href=True), from_encoding=charset)
+    for anchor in links.find_all('a', href=True):
+        if anchor.get('rel') and 'nofollow' in anchor['rel']:
+            continue
+        yield anchor['href']
+
+
+def crawl_site(start_url, max_pages=10, max_depth=1, max_bytes=CRAWL_MAX_BYTES,
+               workers=CRAWL_MAX_WORKERS, host_delay=CRAWL_HOST_DELAY):
+    start_url = canonicalize_url(start_url)
+    if start_url is None:
+        return
+    try:
+        check_public_url(start_url)
+    except (ValueError, OSError) as e:
+        print("Crawl refused", start_url, e)
+        return
+    allowed_host = urlsplit(start_url).netloc
+    limiter = HostRateLimiter(host_delay)
+    robots = RobotsCache()
+
+    def fetch(url):
+        if not robots.allowed(url):
+            raise ValueError("Disallowed by robots.txt")
+        limiter.wait(urlsplit(url).netloc)
+        return fetch_web_page(url)
+
+    seen = {start_url}
+    queue = deque([(start_url, 0)])
+    pending = {}
+    pages = 0
+    bytes_used = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queue or pending:
+            while queue and len(pending) < workers and pages + len(pending) < max_pages and bytes_used < max_bytes:
+                url, depth = queue.popleft()
+                pending[pool.submit(fetch, url)] = (url, depth)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, depth = pending.pop(future)
+                try:
+                    meta, body = future.result()
+                except (urllib.error.URLError, ValueError, OSError) as e:
+                    print("Crawl fetch failed", url, e)
+                    continue
+
+                bytes_used += len(body)
+                if is_sitemap(url, meta):
+                    # Sitemap entries are seeds, they don't count as a level of depth.
+                    links, next_depth = (loc.decode('utf-8', 'replace') for loc in SITEMAP_LOC_RE.findall(body)), depth
+                else:
+                    pages += 1
+                    title, text = extract_main_text(body, meta.get('charset'))
+                    yield url, title, text
+                    if depth >= max_depth:
+                        continue
+                    links, next_depth = extract_links(body, url, meta.get('charset')), depth + 1
+
+                for link in links:
+                    link = canonicalize_url(link, base=url)
+                    if (link is None or link in seen or urlsplit(link).netloc != allowed_host
+                            or urlsplit(link).path.lower().endswith(CRAWL_SKIP_EXTENSIONS)):
+                        continue
+                    seen.add(link)
+                    queue.append((link, next_depth))
+
+
+# Caption (WebVTT / SRT) ingestion. Cues are parsed one line at a time,
+# merged into sentences that remember when they were spoken, and grouped into
+# fixed-size windows; each window is turned into cards and written before the
+# next one is read, so memory stays bounded however long the transcript is.
+
+CAPTION_TIME_RE = re.compile(
+    r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{1,3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{1,3})')
+CAPTION_TAG_RE = re.compile(r'<[^>]*>|\{\\[^}]*\}')
+CAPTION_WINDOW_SENTENCES = 40
+CAPTION_MAX_SENTENCE_SECONDS = 20
+CAPTION_MAX_SENTENCE_LENGTH = 300
+
+
+def caption_seconds(hours, minutes, seconds, millis):
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis.ljust(3, '0')) / 1000.0
+
+
+def parse_captions(lines):
+    # WebVTT and SRT share the same shape: a timing line, text lines, then a
+    # blank line. Header, NOTE/STYLE blocks and SRT cue numbers have no timing
+    # line and are skipped.
+    start = end = None
+    text_lines = []
+    previous_lines = ()
+    for line in lines:
+        line = line.strip().lstrip('\ufeff')
+        timing = CAPTION_TIME_RE.search(line)
+        if timing:
+            if start is not None and text_lines:
+                yield start, end, ' '.join(text_lines)
+                previous_lines = tuple(text_lines)
+            start = caption_seconds(*timing.groups()[:4])
+            end = caption_seconds(*timing.groups()[4:])
+            text_lines = []
+        elif not line:
+            if start is not None and text_lines:
+                yield start, end, ' '.join(text_lines)
+                previous_lines = tuple(text_lines)
+            start = None
+            text_lines = []
+        elif start is not None:
+            text = ' '.join(html.unescape(CAPTION_TAG_RE.sub('', line)).split())
+            # Auto-generated captions repeat the previous cue's line as they roll.
+            if text and text not in previous_lines:
+                text_lines.append(text)
+    if start is not None and text_lines:
+        yield start, end, ' '.join(text_lines)
+
+
+def caption_sentences(cues):
+    buffer = ''
+    buffer_start = None
+    for start, end, text in cues:
+        if buffer_start is None:
+            buffer_start = start
+        buffer = f'{buffer} {text}'.strip()
+        parts = SENTENCE_SPLIT_RE.split(buffer)
+        if not buffer.endswith(('.', '!', '?')):
+            buffer = parts.pop()
+        else:
+            buffer = ''
+        for sentence in parts:
+            yield buffer_start, sentence
+        if parts:
+            buffer_start = start if buffer else None
+        # Unpunctuated auto captions are cut into pseudo-sentences by time and length.
+        if buffer and (end - buffer_start > CAPTION_MAX_SENTENCE_SECONDS or len(buffer) > CAPTION_MAX_SENTENCE_LENGTH):
+            yield buffer_start, buffer + '.'
+            buffer = ''
+            buffer_start = None
+    if buffer:
+        yield buffer_start, buffer
+
+
+def caption_backlink(video_url, seconds):
+    if not video_url:
+        return None
+    seconds = int(seconds)
+    parts = urlsplit(video_url)
+    host = (parts.hostname or '').lower()
+    if host.endswith('youtube.com') or host == 'youtu.be':
+        query = [(key, value) for key, value in parse_qsl(parts.query) if key != 't']
+        query.append(('t', f'{seconds}s'))
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, f't={seconds}'))
+
+
+def caption_flash_cards(lines, video_url=None, cards_per_window=5):
+    for window in iter_batches(caption_sentences(parse_captions(lines)), CAPTION_WINDOW_SENTENCES):
+        starts = [start for start, sentence in window]
+        for card in extract_flash_cards([sentence for start, sentence in window], max_cards=cards_per_window):
+            start = starts[card['sentence_index']]
+            yield card['term'], card['definition'], caption_backlink(video_url, start), start
+
+
+def format_timestamp(seconds):
+    seconds = int(seconds or 0)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes}:{seconds:02d}'
+
+
+# Social archive ingestion (Twitter/X, Mastodon and generic JSON or JSONL
+# dumps). Records are decoded one at a time from a rolling buffer, so only
+# the current record and the MinHash signatures of the posts already kept
+# are ever held in memory. Reposts and lightly edited copies of a post are
+# dropped when their estimated similarity to a kept post reaches
+# SOCIAL_DUPLICATE_THRESHOLD, using the same signatures and LSH bands as the
+# card dedup below.
+
+JSON_READ_SIZE = 64 * 1024
+JSON_MAX_RECORD_BYTES = 16 * 1024 * 1024
+JSON_CONTAINER_KEYS = ('orderedItems', 'items', 'data', 'posts', 'tweets', 'bookmarks')
+JSON_CONTAINER_RE = re.compile(r'"(?:%s)"\s*:\s*\[' % '|'.join(JSON_CONTAINER_KEYS))
+SOCIAL_WINDOW_POSTS = 50
+SOCIAL_DUPLICATE_THRESHOLD = 0.7
+SOCIAL_TEXT_KEYS = ('full_text', 'text', 'content', 'body', 'note')
+SOCIAL_DATE_KEYS = ('created_at', 'published', 'date', 'timestamp', 'time')
+SOCIAL_WRAPPER_KEYS = ('tweet', 'bookmark', 'post', 'status', 'object')
+HASHTAG_RE = re.compile(r'#(\w+)')
+URL_RE = re.compile(r'https?://\S+')
+MENTION_RE = re.compile(r'@\w+')
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def iter_json_records(stream):
+    # Accepts JSON Lines, a top-level array, a JavaScript assignment of an
+    # array (Twitter archives) or an object wrapping the array (Mastodon).
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    position = None
+    while position is None:
+        chunk = stream.read(JSON_READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+        starts = [i for i in (buffer.find('['), buffer.find('{')) if i >= 0]
+        if starts:
+            position = min(starts)
+        elif eof:
+            return
+        elif len(buffer) > JSON_MAX_RECORD_BYTES:
+            raise ValueError("This export does not contain any JSON.")
+    in_array = buffer[position:position + 1] == '['
+    if in_array:
+        position += 1
+    elif not eof:
+        # A wrapper object too big for the first chunk is entered at its array.
+        try:
+            decoder.raw_decode(buffer, position)
+        except ValueError:
+            container = JSON_CONTAINER_RE.search(buffer, position)
+            if container:
+                position, in_array = container.end(), True
+
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if in_array and buffer[position:position + 1] == ']':
+            return
+        if position < len(buffer):
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                container = None
+                if isinstance(record, dict) and not any(key in record for key in SOCIAL_TEXT_KEYS):
+                    container = next((record[key] for key in JSON_CONTAINER_KEYS if isinstance(record.get(key), list)), None)
+                if container is not None:
+                    yield from container
+                else:
+                    yield record
+                continue
+        elif eof:
+            return
+        # Need more input: drop what has been consumed and read the next chunk.
+        buffer = buffer[position:]
+        position = 0
+        if len(buffer) > JSON_MAX_RECORD_BYTES:
+            raise ValueError("A record in this export is too large to import.")
+        chunk = stream.read(JSON_READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+def parse_post_date(value):
+    if isinstance(value, (int, float)):
+        return datetime.datetime.utcfromtimestamp(value / 1000 if value > 1e11 else value)
+    if not isinstance(value, str):
+        return None
+    for parse in (lambda v: datetime.datetime.fromisoformat(v.replace('Z', '+00:00')),
+                  lambda v: datetime.datetime.strptime(v, '%a %b %d %H:%M:%S %z %Y')):
+        try:
+            parsed = parse(value)
+        except ValueError:
+            continue
+        if parsed.tzinfo:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return parsed
+    return None
+
+
+def normalize_post(record):
+    while isinstance(record, dict):
+        wrapped = next((record[key] for key in SOCIAL_WRAPPER_KEYS if isinstance(record.get(key), dict)), None)
+        if wrapped is None or any(record.get(key) for key in SOCIAL_TEXT_KEYS):
+            break
+        record = wrapped
+    if not isinstance(record, dict):
+        return None
+    text = next((record[key] for key in SOCIAL_TEXT_KEYS if isinstance(record.get(key), str) and record[key]), None)
+    if not text:
+        return None
+    text = ' '.join(html.unescape(re.sub(r'<br\s*/?>|</p>', '\n', text).replace('<', ' <')).split())
+    text = re.sub(r'\s*<[^>]*>\s*', ' ', text).strip()
+    post_id = str(record.get('id_str') or record.get('id') or '') or None
+    reply_to = record.get('in_reply_to_status_id_str') or record.get('in_reply_to_status_id') or record.get('inReplyTo')
+    url = record.get('url') or record.get('uri')
+    if not isinstance(url, str):
+        url = f'https://twitter.com/i/web/status/{post_id}' if record.get('id_str') else None
+    return {
+        'id': post_id,
+        'text': text,
+        'created_at': parse_post_date(next((record[key] for key in SOCIAL_DATE_KEYS if record.get(key)), None)),
+        'hashtags': {tag.lower() for tag in HASHTAG_RE.findall(text)},
+        'thread': str(record.get('conversation_id') or record.get('thread_id') or record.get('conversation') or '') or None,
+        'reply_to': str(reply_to) if reply_to else None,
+        'url': url,
+    }
+
+
+def post_signature(text):
+    text = MENTION_RE.sub(' ', URL_RE.sub(' ', text.lower()))
+    text = re.sub(r'^rt\b', ' ', text.strip())
+    return minhash_signature(word_shingles(NON_WORD_RE.sub(' ', text).split()))
+
+
+def filter_posts(records, hashtag=None, thread=None, since=None, until=None):
+    hashtag = hashtag.lstrip('#').lower() if hashtag else None
+    thread_ids = {thread} if thread else None
+    kept = []
+    buckets = defaultdict(list)
+    for record in records:
+        post = normalize_post(record)
+        if post is None:
+            continue
+        if hashtag and hashtag not in post['hashtags']:
+            continue
+        if thread_ids is not None:
+            # Replies join the thread once the post they answer is in it.
+            if post['thread'] in thread_ids or post['id'] in thread_ids or post['reply_to'] in thread_ids:
+                thread_ids.add(post['id'])
+            else:
+                continue
+        if (since or until) and post['created_at'] is None:
+            continue
+        if since and post['created_at'].date() < since:
+            continue
+        if until and post['created_at'].date() > until:
+            continue
+        signature = post_signature(post['text'])
+        if signature is not None:
+            bands = lsh_band_hashes(signature)
+            candidates = {index for band_hash in bands for index in buckets.get(band_hash, ())[:DEDUP_MAX_BUCKET_CANDIDATES]}
+            if any(minhash_similarity(signature, kept[index]) >= SOCIAL_DUPLICATE_THRESHOLD for index in candidates):
+                continue
+            for band_hash in bands:
+                buckets[band_hash].append(len(kept))
+            kept.append(signature)
+        yield post
+
+
+def social_flash_cards(posts, cards_per_window=5):
+    for window in iter_batches(posts, SOCIAL_WINDOW_POSTS):
+        sentences = []
+        sources = []
+        for post in window:
+            for sentence in split_sentences(post['text']):
+                sentences.append(sentence)
+                sources.append(post['url'])
+        for card in extract_flash_cards(sentences, max_cards=cards_per_window):
+            yield card['term'], card['definition'], sources[card['sentence_index']]
+
+
+# Background jobs. Long-running ingestion is queued in the job table and run
+# by `flask worker` processes instead of the web workers. A worker claims a
+# job with a conditional UPDATE, which is atomic in SQLite, and holds it
+# under a lease that is extended whenever the job reports progress; if the
+# worker dies the lease runs out and another worker picks the job up again.
+# Failures are retried with exponential backoff up to max_attempts.
+
+JOB_LEASE_SECONDS = 300
+JOB_RETRY_DELAY = 30
+JOB_PROGRESS_INTERVAL = 1.0
+JOB_UPLOAD_DIR = os.path.join(app.instance_path, 'uploads')
+JOB_SOURCE_DIR = os.path.join(app.instance_path, 'sources')
+JOB_HANDLERS = {}
+
+
+class JobFailed(Exception):
+    # Raised by a handler for errors that retrying will not fix.
+    pass
+
+
+class JobLeaseLost(Exception):
+    pass
+
+
+def job_handler(kind):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue_job(kind, payload, user_id=None, flashcard_set_id=None, priority=0, max_attempts=3):
+    job = Job(kind=kind, payload=json.dumps(payload), user_id=user_id, flashcard_set_id=flashcard_set_id,
+              priority=priority, max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def save_job_upload(upload):
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    extension = os.path.splitext(secure_filename(upload.filename or ''))[1]
+    path = os.path.join(JOB_UPLOAD_DIR, uuid.uuid4().hex + extension)
+    upload.save(path)
+    return path
+
+
+def save_job_text(text):
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(JOB_UPLOAD_DIR, uuid.uuid4().hex + '.txt')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    return path
+
+
+def remove_job_files(payload):
+    for path in payload.get('paths', []):
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(JOB_UPLOAD_DIR):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def keep_job_files(job_id, user_id, payload):
+    # A finished import keeps its uploaded files, named <user>-<job>-<n>, so
+    # the account export can hand them back.
+    kept = []
+    for number, path in enumerate(payload.get('paths', [])):
+        if user_id is None or os.path.dirname(os.path.abspath(path)) != os.path.abspath(JOB_UPLOAD_DIR):
+            continue
+        os.makedirs(JOB_SOURCE_DIR, exist_ok=True)
+        kept_path = os.path.join(JOB_SOURCE_DIR, f'{user_id}-{job_id}-{number}{os.path.splitext(path)[1]}')
+        try:
+            os.replace(path, kept_path)
+        except FileNotFoundError:
+            continue
+        kept.append(kept_path)
+    return kept
+
+
+def discard_empty_set(flashcard_set_id):
+    if flashcard_set_id and not FlashCardEntry.query.filter_by(flashcard_set_id=flashcard_set_id).first():
+        FlashCardSet.query.filter_by(id=flashcard_set_id).delete()
+        db.session.commit()
+
+
+def claim_job(worker_id, lease_seconds=JOB_LEASE_SECONDS):
+    while True:
+        now = datetime.datetime.utcnow()
+        claimable = db.or_(
+            db.and_(Job.status == 'queued', Job.run_after <= now),
+            # A running job whose lease has expired belonged to a worker that died.
+            db.and_(Job.status == 'running', Job.leased_until < now),
+        )
+        job_id = db.session.execute(
+            db.select(Job.id).where(claimable).order_by(Job.priority.desc(), Job.id).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.commit()
+            return None
+
+        claimed = db.session.execute(
+            db.update(Job).where(Job.id == job_id, claimable).values(
+                status='running', leased_by=worker_id, attempts=Job.attempts + 1,
+                leased_until=now + datetime.timedelta(seconds=lease_seconds), updated_at=now)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            continue
+
+        job = db.session.get(Job, job_id)
+        if job.attempts > job.max_attempts:
+            job.status = 'failed'
+            job.error = job.error or "The job's lease expired too many times."
+            job.leased_by = job.leased_until = None
+            db.session.commit()
+            remove_job_files(json.loads(job.payload))
+            discard_empty_set(job.flashcard_set_id)
+            continue
+        return job
+
+
+class JobContext:
+    def __init__(self, job, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        self.job = job
+        self.job_id = job.id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.payload = json.loads(job.payload)
+        self.last_report = 0
+
+    def update(self, **values):
+        now = datetime.datetime.utcnow()
+        values.update(updated_at=now, leased_until=now + datetime.timedelta(seconds=self.lease_seconds))
+        updated = db.session.execute(
+            db.update(Job).where(Job.id == self.job_id, Job.leased_by == self.worker_id, Job.status == 'running')
+            .values(**values)
+        ).rowcount
+        db.session.commit()
+        if not updated:
+            raise JobLeaseLost(f"Job {self.job_id} is no longer leased by {self.worker_id}")
+
+    def progress(self, count, total=None, force=False):
+        # Also renews the lease. Calls closer together than
+        # JOB_PROGRESS_INTERVAL are dropped so a fast job doesn't write per row.
+        now = time.monotonic()
+        if not force and now - self.last_report < JOB_PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        values = {'progress': count}
+        if total is not None:
+            values['total'] = total
+        self.update(**values)
+
+
+def run_job(job, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+    context = JobContext(job, worker_id, lease_seconds)
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise JobFailed(f"Unknown job kind {job.kind}")
+        result = handler(context)
+    except JobLeaseLost as e:
+        db.session.rollback()
+        print(e)
+        return
+    except Exception as e:
+        db.session.rollback()
+        if not isinstance(e, JobFailed):
+            traceback.print_exc()
+        job = db.session.get(Job, context.job_id)
+        retry = not isinstance(e, JobFailed) and job.attempts < job.max_attempts
+        values = {'error': str(e) or repr(e), 'leased_by': None, 'leased_until': None}
+        if retry:
+            delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            values.update(status='queued', run_after=datetime.datetime.utcnow() + datetime.timedelta(seconds=delay))
+        else:
+            values.update(status='failed')
+        db.session.execute(db.update(Job).where(Job.id == context.job_id, Job.leased_by == worker_id).values(**values))
+        db.session.commit()
+        if not retry:
+            remove_job_files(context.payload)
+            discard_empty_set(job.flashcard_set_id)
+        return
+
+    values = {'status': 'done', 'result': json.dumps(result or {}), 'leased_by': None, 'leased_until': None,
+              'updated_at': datetime.datetime.utcnow()}
+    if result and 'created' in result:
+        values['progress'] = result['created']
+    kept = keep_job_files(context.job_id, job.user_id, context.payload)
+    if kept:
+        values['payload'] = json.dumps(dict(context.payload, paths=kept))
+    db.session.execute(db.update(Job).where(Job.id == context.job_id, Job.leased_by == worker_id).values(**values))
+    db.session.commit()
+    remove_job_files(context.payload)
+
+
+@app.cli.command("worker")
+@click.option("--lease", default=JOB_LEASE_SECONDS, help="Seconds a job stays leased without progress.")
+@click.option("--poll-interval", default=1.0, help="Seconds to wait when the queue is empty.")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+def worker_command(lease, poll_interval, burst):
+    """Run queued ingestion jobs."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    print("Worker", worker_id, "started")
+    while not stopping:
+        job = claim_job(worker_id, lease)
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        print("Running job", job.id, job.kind)
+        run_job(job, worker_id, lease)
+        db.session.remove()
+    print("Worker", worker_id, "stopped")
+
+
+def restart_job_set(context):
+    # A retried job starts its set over so cards are not added twice.
+    if context.job.attempts > 1 and context.job.flashcard_set_id:
+        FlashCardEntry.query.filter_by(flashcard_set_id=context.job.flashcard_set_id).delete()
+        db.session.commit()
+
+
+def finish_job_set(context, created, empty_message):
+    if not created:
+        discard_empty_set(context.job.flashcard_set_id)
+        return {'created': 0, 'message': empty_message}
+    enqueue_dedup_job(context.job.user_id)
+    return {'created': created}
+
+
+@job_handler('import_terms')
+def import_terms_job(context):
+    restart_job_set(context)
+    with open(context.payload['paths'][0], encoding='utf-8-sig', errors='replace', newline='') as lines:
+        created = import_flash_card_rows(context.job.flashcard_set_id, parse_flash_card_rows(lines),
+                                         progress=context.progress)
+    return finish_job_set(context, created, "No terms were found in that file.")
+
+
+@job_handler('refine_cards')
+def refine_cards_job(context):
+    entries = FlashCardEntry.query.filter_by(flashcard_set_id=context.job.flashcard_set_id).order_by(FlashCardEntry.id).all()
+    cards = refine_flash_cards_with_ai([{'term': entry.term, 'definition': entry.definition} for entry in entries])
+    if len(cards) != len(entries):
+        return {'refined': 0}
+    for entry, card in zip(entries, cards):
+        entry.term = card['term']
+        entry.definition = card['definition']
+    db.session.commit()
+    enqueue_dedup_job(context.job.user_id)
+    return {'refined': len(entries)}
+
+
+@job_handler('crawl_web')
+def crawl_web_job(context):
+    restart_job_set(context)
+    payload = context.payload
+    flash_card_set = db.session.get(FlashCardSet, context.job.flashcard_set_id)
+    max_cards = payload['max_cards']
+    cards_per_page = max(3, math.ceil(max_cards / payload['max_pages']))
+
+    # Cards are saved page by page as the crawl delivers them.
+    seen_terms = set()
+    created = 0
+    for page_url, title, text in crawl_site(payload['url'], max_pages=payload['max_pages'], max_depth=payload['max_depth']):
+        cards = [
+            card for card in extract_flash_cards(text, max_cards=min(cards_per_page, max_cards - created))
+            if card['term'].lower() not in seen_terms
+        ]
+        if not cards:
+            continue
+        if payload.get('title_from_page') and title and not created:
+            flash_card_set.set_title = truncate_field(title)
+        seen_terms.update(card['term'].lower() for card in cards)
+        created += import_flash_card_rows(flash_card_set.id, ((card['term'], card['definition']) for card in cards))
+        context.progress(created, max_cards)
+        if created >= max_cards:
+            break
+    return finish_job_set(context, created, "Could not find any terms on that page.")
+
+
+@job_handler('import_captions')
+def import_captions_job(context):
+    restart_job_set(context)
+    payload = context.payload
+    sources = []
+    if payload.get('caption_url'):
+        try:
+            meta, body = fetch_web_page(payload['caption_url'])
+        except urllib.error.HTTPError as e:
+            raise JobFailed(f"We could not load that caption file ({e.code}).")
+        except ValueError as e:
+            raise JobFailed(str(e))
+        sources.append(lambda: io.TextIOWrapper(io.BytesIO(body), encoding=meta.get('charset') or 'utf-8', errors='replace'))
+    for path in payload.get('paths', []):
+        sources.append(lambda path=path: open(path, encoding='utf-8-sig', errors='replace'))
+
+    created = 0
+    for source in sources:
+        with source() as lines:
+            cards = caption_flash_cards(lines, payload.get('video_url'), payload['cards_per_window'])
+            created += import_flash_card_rows(
+                context.job.flashcard_set_id, cards,
+                progress=lambda count, offset=created: context.progress(offset + count)
+            )
+    return finish_job_set(context, created, "No terms were found in those captions.")
+
+
+@job_handler('import_social')
+def import_social_job(context):
+    restart_job_set(context)
+    payload = context.payload
+    with open(payload['paths'][0], encoding='utf-8-sig', errors='replace') as stream:
+        posts = filter_posts(
+            iter_json_records(stream), hashtag=payload.get('hashtag'), thread=payload.get('thread'),
+            since=datetime.date.fromisoformat(payload['since']) if payload.get('since') else None,
+            until=datetime.date.fromisoformat(payload['until']) if payload.get('until') else None
+        )
+        try:
+            created = import_flash_card_rows(
+                context.job.flashcard_set_id, itertools.islice(social_flash_cards(posts), payload['max_cards']),
+                progress=context.progress
+            )
+        except ValueError:
+            raise JobFailed("That file does not look like a JSON or JSONL export.")
+    return finish_job_set(context, created, "No matching posts were found in that export.")
+
+
+@job_handler('repair_counters')
+def repair_counters_job(context):
+    return {'repaired': repair_set_counters(context.payload.get('set_ids'))}
+
+
+@app.cli.command("repair-counters")
+def repair_counters_command():
+    """Recompute the card, due and last-practiced counters of every set."""
+    print(f"Repaired counters on {repair_set_counters()} sets")
+
+
+# Near-duplicate cards. Each card is shingled into word pairs of its term and
+# definition and summarised by a MinHash signature stored on the entry. The
+# signature is cut into LSH bands whose hashes go into card_lsh_bucket, so a
+# card is only compared with cards that share at least one band instead of
+# with every other card the user owns. Cards with a NULL signature are new or
+# edited; the dedup job indexes them in id order, a batch at a time, and
+# records pairs whose estimated similarity reaches DEDUP_THRESHOLD.
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+MINHASH_FORMAT = f'<{MINHASH_PERMUTATIONS}I'
+DEDUP_THRESHOLD = 0.6
+DEDUP_BATCH_SIZE = 500
+DEDUP_MAX_BUCKET_CANDIDATES = 50
+
+
+def word_shingles(words):
+    if len(words) < 2:
+        return set(words)
+    return {f'{first} {second}' for first, second in zip(words, words[1:])}
+
+
+def card_shingles(term, definition):
+    return word_shingles(WORD_RE.findall(f'{term} {definition}'.lower()))
+
+
+def minhash_signature(shingles):
+    # One SHAKE-128 digest per shingle supplies all 64 independent 32-bit
+    # hash values, and the column-wise minimum is taken by zip/min in C.
+    hashes = [
+        struct.unpack(MINHASH_FORMAT, hashlib.shake_128(shingle.encode('utf-8')).digest(4 * MINHASH_PERMUTATIONS))
+        for shingle in shingles
+    ]
+    if not hashes:
+        return None
+    return tuple(map(min, zip(*hashes)))
+
+
+def lsh_band_hashes(signature):
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    return [
+        int.from_bytes(hashlib.blake2b(struct.pack(f'<H{rows}I', band, *signature[band * rows:(band + 1) * rows]),
+                                       digest_size=8).digest(), 'little', signed=True)
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def minhash_similarity(first, second):
+    return sum(a == b for a, b in zip(first, second)) / MINHASH_PERMUTATIONS
+
+
+def enqueue_dedup_job(user_id, rebuild=False):
+    if user_id is None:
+        return None
+    pending = Job.query.filter_by(kind='dedup_cards', user_id=user_id, status='queued').first()
+    if pending is not None and not rebuild:
+        return pending
+    return enqueue_job('dedup_cards', {'rebuild': rebuild}, user_id=user_id, priority=-1)
+
+
+def reset_card_dedup(user_id):
+    set_ids = db.select(FlashCardSet.id).where(FlashCardSet.user_id == user_id)
+    db.session.execute(db.update(FlashCardEntry).where(FlashCardEntry.flashcard_set_id.in_(set_ids)).values(minhash=None))
+    db.session.execute(db.delete(CardLshBucket).where(CardLshBucket.user_id == user_id))
+    db.session.execute(db.delete(CardDuplicate).where(CardDuplicate.user_id == user_id))
+    db.session.commit()
+
+
+def dedup_cards(user_id, batch_size=DEDUP_BATCH_SIZE, progress=None):
+    indexed = 0
+    found = 0
+    while True:
+        entries = db.session.execute(
+            db.select(FlashCardEntry.id, FlashCardEntry.term, FlashCardEntry.definition)
+            .join(FlashCardSet, FlashCardSet.id == FlashCardEntry.flashcard_set_id)
+            .where(FlashCardSet.user_id == user_id, FlashCardEntry.minhash.is_(None))
+            .order_by(FlashCardEntry.id).limit(batch_size)
+        ).all()
+        if not entries:
+            break
+
+        signatures = {entry_id: minhash_signature(card_shingles(term, definition)) for entry_id, term, definition in entries}
+        bands = {entry_id: lsh_band_hashes(signature) if signature else [] for entry_id, signature in signatures.items()}
+
+        # Everything already indexed that shares a band with this batch.
+        buckets = defaultdict(list)
+        band_hashes = {band_hash for hashes in bands.values() for band_hash in hashes}
+        if band_hashes:
+            for band_hash, entry_id in db.session.execute(
+                db.select(CardLshBucket.band_hash, CardLshBucket.entry_id)
+                .where(CardLshBucket.user_id == user_id, CardLshBucket.band_hash.in_(band_hashes))
+            ):
+                buckets[band_hash].append(entry_id)
+        known = {entry_id for entry_ids in buckets.values() for entry_id in entry_ids}
+        stored = {
+            entry_id: struct.unpack(MINHASH_FORMAT, minhash)
+            for entry_id, minhash in db.session.execute(
+                db.select(FlashCardEntry.id, FlashCardEntry.minhash).where(FlashCardEntry.id.in_(known))
+            ) if minhash
+        } if known else {}
+
+        pairs = []
+        for entry_id, *_ in entries:
+            signature = signatures[entry_id]
+            candidates = set()
+            for band_hash in bands[entry_id]:
+                # Very common bands (boilerplate definitions) only contribute
+                # a bounded number of comparisons.
+                candidates.update(buckets[band_hash][:DEDUP_MAX_BUCKET_CANDIDATES])
+                buckets[band_hash].append(entry_id)
+            for candidate_id in candidates:
+                other = signatures.get(candidate_id) or stored.get(candidate_id)
+                if other is None:
+                    continue
+                similarity = minhash_similarity(signature, other)
+                if similarity >= DEDUP_THRESHOLD:
+                    pairs.append({'user_id': user_id, 'entry_id': min(entry_id, candidate_id),
+                                  'duplicate_id': max(entry_id, candidate_id), 'similarity': similarity})
+
+        db.session.execute(db.update(FlashCardEntry), [
+            {'id': entry_id, 'minhash': struct.pack(MINHASH_FORMAT, *signature) if signature else b''}
+            for entry_id, signature in signatures.items()
+        ])
+        bucket_rows = [
+            {'user_id': user_id, 'band_hash': band_hash, 'entry_id': entry_id}
+            for entry_id, hashes in bands.items() for band_hash in hashes
+        ]
+        if bucket_rows:
+            # A Core executemany; the ORM bulk path is several times slower
+            # for the 16 narrow rows written per card.
+            db.session.execute(CardLshBucket.__table__.insert(), bucket_rows)
+        if pairs:
+            db.session.execute(db.insert(CardDuplicate), pairs)
+        db.session.commit()
+
+        indexed += len(entries)
+        found += len(pairs)
+        if progress:
+            progress(indexed)
+    return indexed, found
+
+
+@job_handler('dedup_cards')
+def dedup_cards_job(context):
+    if context.payload.get('rebuild'):
+        reset_card_dedup(context.job.user_id)
+    indexed, found = dedup_cards(context.job.user_id, progress=context.progress)
+    return {'indexed': indexed, 'duplicates': found}
+
+
+@app.cli.command("dedup-cards")
+@click.option("--user-id", type=int, help="Only sweep this user's cards.")
+@click.option("--rebuild", is_flag=True, help="Recompute every signature instead of only new and edited cards.")
+def dedup_cards_command(user_id, rebuild):
+    """Find near-duplicate flashcards."""
+    user_ids = [user_id] if user_id else db.session.execute(db.select(User.id)).scalars().all()
+    for user_id in user_ids:
+        if rebuild:
+            reset_card_dedup(user_id)
+        indexed, found = dedup_cards(user_id)
+        print(f"User {user_id}: indexed {indexed} cards, found {found} near-duplicate pairs")
+
+
+@app.route("/")
+def index():
+    if current_user.is_authenticated:
+        return redirect(url_for('home'))
+    form = RegistrationForm()
+    return render_template("index.html", form=form)
+
+@app.route("/login", methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('home'))
+    form = LoginForm()
+    if request.method == 'POST':
+        if form.validate_on_submit():
+            email = form.email.data
+            password = form.password.data
+
+            user = User.query.filter_by(email=email).first()
+            
+            if not user or user.deactivated_at is not None or not check_password_hash(user.password, password):
+                flash('Please check your login details and try again.')
+                return redirect(url_for('login'))
+
+            login_user(user)
+            return redirect(url_for('home'))
+
+    return render_template("login.html", form=form)
+
+@app.route("/register", methods=['GET', 'POST'])
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for('home'))
+    form = RegistrationForm()
+   
+    if request.method == 'POST':
+        if form.validate_on_submit():
+            email = form.email.data
+            password = form.password.data
+
+            user = User.query.filter_by(email=email).first()
+            if user:
+                flash('Username already exists. Please choose a different one.')
+                return redirect(url_for('login'))
+
+            new_user = User(email=email, password=generate_password_hash(password, method='sha256'))
+            db.session.add(new_user)
+            db.session.commit()
+
+            message_body = """We are excited to introduce you to CardBase, the innovative flashcard platform that will revolutionize the way you learn. With CardBase, you can tap into the vast resources of YouTube, web pages, and social media to generate personalized flashcards that cover any subject matter you desire.
+
+By leveraging the power of AI, CardBase seamlessly combines the wisdom of centuries with state-of-the-art technology to simplify your learning experience. Our platform empowers you to effortlessly create and manage flashcards using your voice, allowing you to learn on the go and make the most of your valuable time.
+\n
+Whether you're a student, a professional, or simply someone passionate about continuous learning, CardBase is designed to cater to your needs. With our platform, you can access a wealth of knowledge from various sources and compile it into engaging flashcards, all at the convenience of a few simple voice commands.
+
+We invite you to embrace the efficiency and convenience of CardBase today. Experience a new level of productivity as you explore any subject matter with ease and simplicity. 
+\n
+To get started, simply visit our user-friendly website and follow our quick and hassle-free registration process. Once you're in, you'll gain access to a range of powerful features and tools designed to enhance your learning experience.
+
+If you have any questions or need assistance, our dedicated support team is here to help. Feel free to reach out to us at **CardBase@gmail.com**, and we'll be delighted to assist you.
+\n
+Thank you for choosing CardBase as your go-to flashcard platform. We are thrilled to have you on board and cannot wait to witness the positive impact CardBase will have on your learning journey.
+
+Wishing you success and fulfillment as you embark on your quest for knowledge!
+\n
+Best regards,
+\n
+CardBase Team"""
+          
+            # Send email to the new user
+            msg = Message(
+                subject="Welcome to CardBase - Simply Learning! Amplify Knowledge!",
+                sender=app.config["MAIL_USERNAME"],
+                recipients=[email],
+                body=f"Hi {email},\n\n{message_body}"
+            )
+            mail.send(msg)
+
+            flash('Registration successful! An email has been sent to your email address.')
+            user = User.query.filter_by(email=email).first()
+            login_user(user)
+            return redirect(url_for('home'))
+    return render_template("register.html", form=form)
+
+@app.route("/home")
+@login_required
+@conditional_page(lambda: deck_list_version(current_user.id))
+def home():
+    user_id = current_user.id 
+    # The deck table is only queried when its cached fragment is out of date.
+    flash_card_sets = FlashCardSet.query.filter_by(user_id=user_id)
+    return render_template("home.html", current_user=current_user, flash_card_sets=flash_card_sets,
+                           deck_list_version=deck_list_version(user_id))
+
+@app.route("/create_set", methods=["GET", "POST"])
+@login_required
+def create_set():
+    current_user.session_engaged = True
+    form = FlashCardSetForm()
+    if request.method == "POST":
+        if not form.validate_on_submit():
+            flash("Please give the set a title and description of at most 255 characters.")
+            if htmx_request():
+                return htmx_fragment("flash_card_set_form_row.html", form=form, flash_card_set=None)
+            return render_template("create_set.html", current_user=current_user, form=form)
+
+        new_set = FlashCardSet(
+            user_id=current_user.id,
+            set_title=form.set_title.data.strip(),
+            set_description=form.set_description.data.strip()
+        )
+
+        db.session.add(new_set)
+        db.session.commit()
+
+        if htmx_request():
+            flash("Flashcard set created successfully.")
+            return htmx_fragment("flash_card_set_row.html", flash_card_set=new_set)
+        return redirect(url_for("flash_card_sets"))
+
+    if htmx_request():
+        return htmx_fragment("flash_card_set_form_row.html", form=form, flash_card_set=None)
+    return render_template("create_set.html", current_user=current_user, form=form)
+
+@app.route("/create_with_ai", methods=["GET", "POST"])
+@login_required
+def create_with_ai():
+    current_user.session_engaged = True
+    form = FlashCardSetForm()
+    if request.method == "POST":
+        print(request.form)
+        user_id = current_user.id
+        set_title = request.form.get("set_title")
+        set_description = request.form.get("set_description")
+
+        new_set = FlashCardSet(
+            user_id=user_id,
+            set_title=set_title,
+            set_description=set_description
+        )
+
+        db.session.add(new_set)
+        db.session.commit()
+
+        print(FlashCardSet.query.filter_by(user_id=user_id).all())
+
+        return redirect(url_for("flash_card_sets"))
+    
+    return render_template("create_with_ai.html", current_user=current_user, form=form)
+
+@app.route("/create_with_youtube", methods=["GET", "POST"])
+@login_required
+def create_with_youtube():
+    form = FlashCardCaptionForm()
+    if form.validate_on_submit():
+        caption_url = (form.caption_url.data or '').strip() or None
+        uploads = sorted((upload for upload in form.files.data or [] if upload and upload.filename), key=lambda upload: upload.filename)
+        if not caption_url and not uploads:
+            flash("Upload a caption file or enter its URL.")
+            return render_template("create_with_youtube.html", current_user=current_user, form=form)
+        if caption_url:
+            try:
+                check_public_url(caption_url)
+            except (ValueError, OSError):
+                flash("We can only load caption files from public http or https URLs.")
+                return render_template("create_with_youtube.html", current_user=current_user, form=form)
+
+        video_url = (form.video_url.data or '').strip() or None
+        new_set = FlashCardSet(
+            user_id=current_user.id,
+            set_title=form.set_title.data,
+            set_description=truncate_field(form.set_description.data or f"Generated from {video_url or 'captions'}")
+        )
+        db.session.add(new_set)
+        db.session.commit()
+
+        job = enqueue_job('import_captions', {
+            'paths': [save_job_upload(upload) for upload in uploads],
+            'filenames': [upload.filename for upload in uploads],
+            'caption_url': caption_url,
+            'video_url': video_url,
+            'cards_per_window': form.cards_per_window.data or 5,
+        }, user_id=current_user.id, flashcard_set_id=new_set.id)
+        flash("Your captions are being turned into flashcards.")
+        return redirect(url_for("job_status", job_id=job.id))
+
+    return render_template("create_with_youtube.html", current_user=current_user, form=form)
+
+@app.route("/create_with_text", methods=["GET", "POST"])
+@login_required
+def create_with_text():
+    form = FlashCardTextForm()
+    import_form = FlashCardImportForm(prefix="import")
+    if import_form.submit.data and import_form.validate_on_submit():
+        upload = import_form.file.data
+        if upload and upload.filename:
+            path, filename = save_job_upload(upload), upload.filename
+        elif import_form.terms.data:
+            path, filename = save_job_text(import_form.terms.data), 'pasted.txt'
+        else:
+            flash("Paste some terms or choose a file to import.")
+            return render_template("create_with_text.html", current_user=current_user, form=form, import_form=import_form)
+
+        new_set = FlashCardSet(
+            user_id=current_user.id,
+            set_title=import_form.set_title.data,
+            set_description=import_form.set_description.data
+        )
+        db.session.add(new_set)
+        db.session.commit()
+
+        job = enqueue_job('import_terms', {'paths': [path], 'filenames': [filename]}, user_id=current_user.id,
+                          flashcard_set_id=new_set.id)
+        flash("Your flashcards are being imported.")
+        return redirect(url_for("job_status", job_id=job.id))
+
+    if form.submit.data and form.validate_on_submit():
+        cards = extract_flash_cards(form.text.data, max_cards=form.max_cards.data or 20)
+        if not cards:
+            flash("Could not find any terms in that text.")
+            return render_template("create_with_text.html", current_user=current_user, form=form, import_form=import_form)
+
+        new_set = FlashCardSet(
+            user_id=current_user.id,
+            set_title=form.set_title.data,
+            set_description=form.set_description.data
+        )
+        db.session.add(new_set)
+        db.session.flush()
+
+        for card in cards:
+            db.session.add(FlashCardEntry(term=card['term'], definition=card['definition'], flashcard_set_id=new_set.id))
+        db.session.commit()
+        enqueue_dedup_job(current_user.id)
+
+        # The offline cards are usable straight away; AI refinement runs later.
+        if form.refine_with_ai.data:
+            enqueue_job('refine_cards', {}, user_id=current_user.id, flashcard_set_id=new_set.id)
+        flash(f"Created {len(cards)} flashcards from your text.")
+        return redirect(url_for("flash_card_sets"))
+
+    return render_template("create_with_text.html", current_user=current_user, form=form, import_form=import_form)
+
+@app.route("/create_with_social_media", methods=["GET", "POST"])
+@login_required
+def create_with_social_media():
+    form = FlashCardSocialForm()
+    if form.validate_on_submit():
+        upload = form.file.data
+        if not upload or not upload.filename:
+            flash("Choose an exported JSON or JSONL file.")
+            return render_template("create_with_social.html", current_user=current_user, form=form)
+
+        new_set = FlashCardSet(
+            user_id=current_user.id,
+            set_title=form.set_title.data,
+            set_description=truncate_field(form.set_description.data or f"Generated from {upload.filename}")
+        )
+        db.session.add(new_set)
+        db.session.commit()
+
+        job = enqueue_job('import_social', {
+            'paths': [save_job_upload(upload)],
+            'filenames': [upload.filename],
+            'hashtag': form.hashtag.data or None,
+            'thread': (form.thread.data or '').strip() or None,
+            'since': form.date_from.data.isoformat() if form.date_from.data else None,
+            'until': form.date_to.data.isoformat() if form.date_to.data else None,
+            'max_cards': form.max_cards.data or 50,
+        }, user_id=current_user.id, flashcard_set_id=new_set.id)
+        flash("Your posts are being turned into flashcards.")
+        return redirect(url_for("job_status", job_id=job.id))
+
+    return render_template("create_with_social.html", current_user=current_user, form=form)
+
+@app.route("/create_with_web_page", methods=["GET", "POST"])
+@login_required
+def create_with_web_page():
+    form = FlashCardWebForm()
+    if form.validate_on_submit():
+        url = form.url.data.strip()
+        try:
+            check_public_url(url)
+        except (ValueError, OSError):
+            flash("We can only import public http or https pages.")
+            return render_template("create_with_web.html", current_user=current_user, form=form)
+        if form.crawl.data:
+            max_pages = form.max_pages.data or 10
+            max_depth = form.max_depth.data if form.max_depth.data is not None else 1
+        else:
+            max_pages, max_depth = 1, 0
+
+        new_set = FlashCardSet(
+            user_id=current_user.id,
+            set_title=truncate_field(form.set_title.data or url),
+            set_description=truncate_field(form.set_description.data or f"Generated from {url}")
+        )
+        db.session.add(new_set)
+        db.session.commit()
+
+        job = enqueue_job('crawl_web', {
+            'url': url,
+            'max_pages': max_pages,
+            'max_depth': max_depth,
+            'max_cards': form.max_cards.data or 20,
+            'title_from_page': not form.set_title.data,
+        }, user_id=current_user.id, flashcard_set_id=new_set.id)
+        flash("Your web page is being turned into flashcards.")
+        return redirect(url_for("job_status", job_id=job.id))
+
+    return render_template("create_with_web.html", current_user=current_user, form=form)
+
+
+# Job progress. The events endpoint streams Server-Sent Events and the poll
+# endpoint is a long-poll fallback for clients without EventSource. Both
+# check the job at most once per JOB_EVENTS_INTERVAL and only report the
+# latest state, so a job that progresses quickly cannot flood a connection.
+# Each connection holds a web worker, so run gunicorn with threads
+# (e.g. --threads 8) when many users watch jobs at once.
+
+JOB_EVENTS_INTERVAL = 1.0
+JOB_EVENTS_MAX_SECONDS = 300
+JOB_EVENTS_HEARTBEAT = 15
+JOB_POLL_TIMEOUT = 25
+JOB_CARDS_PER_EVENT = 50
+
+
+def get_user_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return job
+
+
+def job_snapshot(job_id, after_entry_id=0):
+    # End the previous read transaction first so progress committed by the
+    # worker since then is visible.
+    db.session.rollback()
+    job = db.session.get(Job, job_id)
+    db.session.refresh(job)
+    cards = []
+    if job.flashcard_set_id:
+        entries = FlashCardEntry.query.filter(
+            FlashCardEntry.flashcard_set_id == job.flashcard_set_id, FlashCardEntry.id > after_entry_id
+        ).order_by(FlashCardEntry.id).limit(JOB_CARDS_PER_EVENT).all()
+        cards = [{'id': entry.id, 'term': entry.term, 'definition': entry.definition} for entry in entries]
+    return {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error if job.status == 'failed' else None,
+        'flashcard_set_id': job.flashcard_set_id,
+        'cards': cards,
+        'last_entry_id': cards[-1]['id'] if cards else after_entry_id,
+    }
+
+
+def job_finished(snapshot):
+    return snapshot['status'] in ('done', 'failed') and not snapshot['cards']
+
+
+@app.route("/jobs/<int:job_id>")
+@login_required
+def job_status(job_id):
+    job = get_user_job(job_id)
+    if job.kind == 'export_account':
+        download_url = url_for('download_account_export', job_id=job.id)
+    elif job.kind == 'export_cards':
+        payload = json.loads(job.payload)
+        download_url = url_for('export_flash_card_sets', set_id=payload['set_id'], export_format=payload['format'])
+    else:
+        download_url = None
+    return render_template("job.html", current_user=current_user, job=job, download_url=download_url)
+
+
+@app.route("/jobs/<int:job_id>/events")
+@login_required
+def job_events(job_id):
+    get_user_job(job_id)
+    after_entry_id = request.headers.get("Last-Event-ID", type=int) or request.args.get("after", 0, type=int)
+
+    def generate():
+        last_entry_id = after_entry_id
+        last_state = None
+        last_sent = started = time.monotonic()
+        yield f"retry: {int(JOB_EVENTS_INTERVAL * 3000)}\n\n"
+        while time.monotonic() - started < JOB_EVENTS_MAX_SECONDS:
+            snapshot = job_snapshot(job_id, last_entry_id)
+            state = (snapshot['status'], snapshot['progress'], snapshot['total'])
+            changed = state != last_state or snapshot['cards']
+            if changed:
+                last_state = state
+                last_entry_id = snapshot['last_entry_id']
+                last_sent = time.monotonic()
+                yield f"id: {last_entry_id}\nevent: progress\ndata: {json.dumps(snapshot)}\n\n"
+            if job_finished(snapshot):
+                yield "event: done\ndata: {}\n\n"
+                return
+            if snapshot['cards']:
+                # More cards may be waiting; send them without sleeping.
+                continue
+            if not changed and time.monotonic() - last_sent > JOB_EVENTS_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            db.session.remove()
+            time.sleep(JOB_EVENTS_INTERVAL)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@app.route("/jobs/<int:job_id>/poll")
+@login_required
+def job_poll(job_id):
+    get_user_job(job_id)
+    after_entry_id = request.args.get("after", 0, type=int)
+    known_state = (request.args.get("status"), request.args.get("progress", type=int))
+    deadline = time.monotonic() + JOB_POLL_TIMEOUT
+    while True:
+        snapshot = job_snapshot(job_id, after_entry_id)
+        changed = (snapshot['status'], snapshot['progress']) != known_state or snapshot['cards']
+        if changed or time.monotonic() >= deadline:
+            return jsonify(snapshot)
+        db.session.remove()
+        time.sleep(JOB_EVENTS_INTERVAL)
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_TERMS = 8
+SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+SEARCH_MARK_START = '\x02'
+SEARCH_MARK_END = '\x03'
+
+
+def search_match_expression(user_id, query, columns):
+    # Every word becomes a quoted prefix query, so user input can never be
+    # read as FTS syntax and "photo syn" finds "photosynthesis".
+    tokens = SEARCH_TOKEN_RE.findall(query.lower())[:SEARCH_MAX_TERMS]
+    if not tokens:
+        return None
+    words = ' AND '.join(f'"{token}"*' for token in tokens)
+    return f'owner : "u{int(user_id)}" AND {{{columns}}} : ({words})'
+
+
+def search_highlight(value):
+    # snippet()/highlight() wrap matches in control characters; escape the
+    # text first and only then turn those into <mark> tags.
+    return Markup(str(escape(value or '')).replace(SEARCH_MARK_START, '<mark>').replace(SEARCH_MARK_END, '</mark>'))
+
+
+def search_flash_cards(user_id, query, page=1):
+    results = {'query': query, 'page': page, 'sets': [], 'entries': [], 'has_more': False}
+    entry_match = search_match_expression(user_id, query, 'term definition')
+    if entry_match is None:
+        return results
+
+    marks = {'start': SEARCH_MARK_START, 'end': SEARCH_MARK_END}
+    if page == 1:
+        rows = db.session.execute(db.text("""
+            SELECT rowid, highlight(flash_card_set_fts, 1, :start, :end), snippet(flash_card_set_fts, 2, :start, :end, '...', 16)
+            FROM flash_card_set_fts WHERE flash_card_set_fts MATCH :match
+            ORDER BY bm25(flash_card_set_fts, 0.0, 10.0, 1.0) LIMIT 5
+        """), dict(marks, match=search_match_expression(user_id, query, 'set_title set_description'))).all()
+        results['sets'] = [
+            {'id': set_id, 'set_title': search_highlight(title), 'set_description': search_highlight(description)}
+            for set_id, title, description in rows
+        ]
+
+    rows = db.session.execute(db.text("""
+        SELECT flash_card_entry_fts.rowid, flash_card_entry.flashcard_set_id,
+               highlight(flash_card_entry_fts, 1, :start, :end), snippet(flash_card_entry_fts, 2, :start, :end, '...', 16)
+        FROM flash_card_entry_fts JOIN flash_card_entry ON flash_card_entry.id = flash_card_entry_fts.rowid
+        WHERE flash_card_entry_fts MATCH :match
+        ORDER BY bm25(flash_card_entry_fts, 0.0, 5.0, 1.0) LIMIT :limit OFFSET :offset
+    """), dict(marks, match=entry_match, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE)).all()
+    results['has_more'] = len(rows) > SEARCH_PAGE_SIZE
+    results['entries'] = [
+        {'id': entry_id, 'flashcard_set_id': set_id, 'term': search_highlight(term), 'definition': search_highlight(definition)}
+        for entry_id, set_id, term, definition in rows[:SEARCH_PAGE_SIZE]
+    ]
+    return results
+
+
+@app.route("/search")
+@login_required
+def search():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    results = search_flash_cards(current_user.id, query, page)
+    return render_template("search.html", current_user=current_user, results=results)
+
+
+@app.route("/api/search")
+@login_required
+def api_search():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    return jsonify(search_flash_cards(current_user.id, query, page))
+
+
+# Type-ahead suggestions come from a per-user index held in memory: a sorted
+# list of (key, kind, id) tuples searched with bisect, where a title gets one
+# key per word so "cell" also suggests "Plant cells". Indexes are warmed at
+# login, patched from committed ORM writes, and rebuilt once they are older
+# than PREFIX_INDEX_MAX_AGE. Writes made by other processes, such as cards
+# committed by the job worker, reach the index through the change log: at
+# most every PREFIX_INDEX_SYNC_INTERVAL seconds the rows logged since the
+# index's seq are applied. Loads and catch-ups only ever run in a background
+# thread, so a keystroke never waits on the database; until the first load
+# finishes it just gets no suggestions. The least recently used indexes are
+# evicted once all of them together hold more than PREFIX_INDEX_MAX_KEYS keys.
+
+PREFIX_INDEX_MAX_KEYS = 500000
+PREFIX_INDEX_MAX_AGE = 300
+PREFIX_INDEX_SYNC_INTERVAL = 2
+PREFIX_INDEX_SYNC_LIMIT = 5000
+PREFIX_INDEX_MAX_WORDS = 6
+PREFIX_INDEX_KEY_LENGTH = 64
+PREFIX_INDEX_SUGGESTIONS = 8
+PREFIX_INDEX_SCAN_LIMIT = 200
+
+
+def prefix_keys(label):
+    words = SEARCH_TOKEN_RE.findall((label or '').lower())
+    return {' '.join(words[start:])[:PREFIX_INDEX_KEY_LENGTH] for start in range(min(len(words), PREFIX_INDEX_MAX_WORDS))}
+
+
+class PrefixIndex:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.keys = []
+        self.labels = {}
+        self.loaded_at = None
+        self.synced_at = None
+        self.seq = 0
+        self.refreshing = False
+
+    def load(self, sets, entries, seq):
+        keys = []
+        labels = {}
+        for kind, rows in (('set', sets), ('entry', entries)):
+            for object_id, label, set_id in rows:
+                labels[(kind, object_id)] = (label, set_id)
+                keys.extend((key, kind, object_id) for key in prefix_keys(label))
+        keys.sort()
+        self.keys = keys
+        self.labels = labels
+        self.seq = seq
+        self.loaded_at = self.synced_at = time.monotonic()
+
+    def add(self, kind, object_id, label, set_id):
+        self.remove(kind, object_id)
+        self.labels[(kind, object_id)] = (label, set_id)
+        for key in prefix_keys(label):
+            bisect.insort(self.keys, (key, kind, object_id))
+
+    def remove(self, kind, object_id):
+        label, set_id = self.labels.pop((kind, object_id), (None, None))
+        for key in prefix_keys(label):
+            position = bisect.bisect_left(self.keys, (key, kind, object_id))
+            if position < len(self.keys) and self.keys[position] == (key, kind, object_id):
+                del self.keys[position]
+
+    def remove_set(self, set_id):
+        for kind, object_id in [item for item, value in self.labels.items() if value[1] == set_id]:
+            self.remove(kind, object_id)
+
+    def suggest(self, prefix, limit=PREFIX_INDEX_SUGGESTIONS):
+        prefix = ' '.join(SEARCH_TOKEN_RE.findall(prefix.lower()))[:PREFIX_INDEX_KEY_LENGTH]
+        if not prefix:
+            return []
+        seen = set()
+        suggestions = []
+        position = bisect.bisect_left(self.keys, (prefix,))
+        for key, kind, object_id in itertools.islice(self.keys, position, position + PREFIX_INDEX_SCAN_LIMIT):
+            if not key.startswith(prefix):
+                break
+            if (kind, object_id) in seen:
+                continue
+            seen.add((kind, object_id))
+            label, set_id = self.labels[(kind, object_id)]
+            suggestions.append({'kind': kind, 'id': object_id, 'label': label, 'flashcard_set_id': set_id})
+            if len(suggestions) >= limit:
+                break
+        # Whole decks first, then cards, keeping alphabetical order within each.
+        suggestions.sort(key=lambda suggestion: suggestion['kind'] != 'set')
+        return suggestions
+
+
+prefix_indexes = OrderedDict()
+prefix_index_lock = threading.RLock()
+
+
+def load_prefix_index_rows(user_id):
+    # The seq is read first, so anything committed while the rows load is
+    # applied again by the next catch-up; applying a change twice is harmless.
+    seq = user_version(user_id)
+    sets = db.session.execute(
+        db.select(FlashCardSet.id, FlashCardSet.set_title, FlashCardSet.id).where(FlashCardSet.user_id == user_id)
+    ).all()
+    entries = db.session.execute(
+        db.select(FlashCardEntry.id, FlashCardEntry.term, FlashCardEntry.flashcard_set_id)
+        .join(FlashCardSet, FlashCardSet.id == FlashCardEntry.flashcard_set_id)
+        .where(FlashCardSet.user_id == user_id)
+    ).all()
+    return sets, entries, seq
+
+
+def load_prefix_index_changes(user_id, since):
+    logged = db.session.execute(
+        db.select(ChangeLog.seq, ChangeLog.kind, ChangeLog.object_id, ChangeLog.op, ChangeLog.set_id)
+        .where(ChangeLog.user_id == user_id, ChangeLog.seq > since)
+        .order_by(ChangeLog.seq).limit(PREFIX_INDEX_SYNC_LIMIT + 1)
+    ).all()
+    if len(logged) > PREFIX_INDEX_SYNC_LIMIT:
+        return None, since
+    upserts = {'set': [], 'entry': []}
+    changes = []
+    for seq, kind, object_id, op, set_id in logged:
+        if op == 'delete':
+            changes.append(('delete', kind, object_id, None, set_id))
+        else:
+            upserts[kind].append(object_id)
+    if upserts['set']:
+        changes.extend(('add', 'set', set_id, title, set_id) for set_id, title in db.session.execute(
+            db.select(FlashCardSet.id, FlashCardSet.set_title).where(FlashCardSet.id.in_(upserts['set']))))
+    if upserts['entry']:
+        changes.extend(('add', 'entry', entry_id, term, set_id) for entry_id, term, set_id in db.session.execute(
+            db.select(FlashCardEntry.id, FlashCardEntry.term, FlashCardEntry.flashcard_set_id)
+            .where(FlashCardEntry.id.in_(upserts['entry']))))
+    return changes, logged[-1].seq if logged else since
+
+
+def evict_prefix_indexes():
+    total = sum(len(index.keys) for index in prefix_indexes.values())
+    while total > PREFIX_INDEX_MAX_KEYS and len(prefix_indexes) > 1:
+        user_id, index = prefix_indexes.popitem(last=False)
+        total -= len(index.keys)
+        print(f"Evicted prefix index for user {user_id}")
+
+
+def refresh_prefix_index(user_id, index, full):
+    try:
+        with app.app_context():
+            try:
+                changes = None
+                if not full:
+                    changes, seq = load_prefix_index_changes(user_id, index.seq)
+                if changes is None:
+                    sets, entries, seq = load_prefix_index_rows(user_id)
+            finally:
+                db.session.remove()
+        with prefix_index_lock:
+            if prefix_indexes.get(user_id) is index:
+                if changes is None:
+                    index.load(sets, entries, seq)
+                else:
+                    update_prefix_index(user_id, changes)
+                    index.seq = max(index.seq, seq)
+                evict_prefix_indexes()
+    finally:
+        index.refreshing = False
+
+
+def get_prefix_index(user_id):
+    with prefix_index_lock:
+        index = prefix_indexes.get(user_id)
+        if index is None:
+            index = prefix_indexes[user_id] = PrefixIndex(user_id)
+        prefix_indexes.move_to_end(user_id)
+        if not index.refreshing:
+            now = time.monotonic()
+            full = index.loaded_at is None or now - index.loaded_at > PREFIX_INDEX_MAX_AGE
+            if full or now - index.synced_at >= PREFIX_INDEX_SYNC_INTERVAL:
+                index.refreshing = True
+                index.synced_at = now
+                threading.Thread(target=refresh_prefix_index, args=(user_id, index, full), daemon=True).start()
+        return index
+
+
+@user_logged_in.connect_via(app)
+@user_loaded_from_cookie.connect_via(app)
+def warm_prefix_index(sender, user):
+    get_prefix_index(user.id)
+
+
+def update_prefix_index(user_id, changes):
+    with prefix_index_lock:
+        index = prefix_indexes.get(user_id)
+        if index is None:
+            return
+        for op, kind, object_id, label, set_id in changes:
+            if op == 'delete' and kind == 'set':
+                index.remove_set(set_id)
+            elif op == 'delete':
+                index.remove(kind, object_id)
+            else:
+                index.add(kind, object_id, label, set_id)
+        evict_prefix_indexes()
+
+
+def prefix_index_owner(set_id):
+    with prefix_index_lock:
+        for user_id, index in prefix_indexes.items():
+            if ('set', set_id) in index.labels:
+                return user_id
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def collect_prefix_index_changes(session, flush_context):
+    changes = session.info.setdefault('prefix_index_changes', [])
+    for op, objects in (('add', session.new), ('add', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if isinstance(obj, FlashCardSet):
+                changes.append((obj.user_id, op, 'set', obj.id, obj.set_title, obj.id))
+            elif isinstance(obj, FlashCardEntry):
+                changes.append((None, op, 'entry', obj.id, obj.term, obj.flashcard_set_id))
+
+
+@event.listens_for(Session, "after_commit")
+def apply_prefix_index_changes(session):
+    changes = session.info.pop('prefix_index_changes', None)
+    if not changes:
+        return
+    by_user = defaultdict(list)
+    for user_id, op, kind, object_id, label, set_id in changes:
+        user_id = user_id if user_id is not None else prefix_index_owner(set_id)
+        if user_id is not None:
+            by_user[user_id].append((op, kind, object_id, label, set_id))
+    for user_id, user_changes in by_user.items():
+        update_prefix_index(user_id, user_changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_prefix_index_changes(session):
+    session.info.pop('prefix_index_changes', None)
+
+
+@app.route("/api/suggest")
+@login_required
+def api_suggest():
+    prefix = request.args.get("q", "")
+    index = get_prefix_index(current_user.id)
+    with prefix_index_lock:
+        suggestions = index.suggest(prefix)
+    return jsonify(suggestions)
+
+
+@app.route("/api/duplicates")
+@login_required
+def api_duplicates():
+    set_id = request.args.get("set_id", type=int)
+    entry = db.aliased(FlashCardEntry)
+    duplicate = db.aliased(FlashCardEntry)
+    query = (
+        db.select(CardDuplicate.similarity, entry, duplicate)
+        .join(entry, entry.id == CardDuplicate.entry_id)
+        .join(duplicate, duplicate.id == CardDuplicate.duplicate_id)
+        .where(CardDuplicate.user_id == current_user.id)
+        .order_by(CardDuplicate.similarity.desc(), CardDuplicate.id)
+        .limit(200)
+    )
+    if set_id:
+        query = query.where(db.or_(entry.flashcard_set_id == set_id, duplicate.flashcard_set_id == set_id))
+    return jsonify([
+        {'similarity': round(similarity, 2), 'cards': [
+            {'id': card.id, 'flashcard_set_id': card.flashcard_set_id, 'term': card.term, 'definition': card.definition}
+            for card in (first, second)
+        ]}
+        for similarity, first, second in db.session.execute(query)
+    ])
+
+
+@app.route("/edit_flash_card_set/<set_id>", methods=["GET", "POST"])
+@login_required
+@conditional_page(edit_page_version)
+def edit_flash_card_set(set_id):
+    flash_card_set = FlashCardSet.query.get(set_id)
+    if flash_card_set is None or flash_card_set.user_id != current_user.id:
+        flash("Flashcard set not found.")
+        return redirect(url_for("flash_card_sets"))
+
+    form = FlashCardSetEditForm(obj=flash_card_set)
+    if request.method == "POST":
+        if htmx_request() and not request.form.get("set_title"):
+            flash("Please give the set a title.")
+            return htmx_fragment("flash_card_set_form_row.html", form=form, flash_card_set=flash_card_set)
+        flash_card_set.set_title = request.form.get("set_title")
+        flash_card_set.set_description = request.form.get("set_description")
+        db.session.commit()
+
+        flash("Flashcard set updated successfully.")
+        if htmx_request():
+            return htmx_fragment("flash_card_set_row.html", flash_card_set=flash_card_set)
+        return redirect(url_for("flash_card_sets"))
+
+    if htmx_request():
+        return htmx_fragment("flash_card_set_form_row.html", form=form, flash_card_set=flash_card_set)
+    return render_template("edit_flash_card_set.html", current_user=current_user, flash_card_set=flash_card_set, form=form,
+                           max_field_length=MAX_FIELD_LENGTH)
+
+
+@app.route("/practice_flash_card_set/<set_id>")
+@login_required
+@conditional_page(owned_set_version)
+def practice_flash_card_set(set_id):
+    flash_card_set = FlashCardSet.query.get(set_id)
+    if flash_card_set is None or flash_card_set.user_id != current_user.id:
+        flash("Flashcard set not found.")
+        return redirect(url_for("flash_card_sets"))
+
+    # The cards themselves come from the IndexedDB deck cache, revalidated
+    # against this version, so the page only carries the version number.
+    return render_template("practice_flash_card_set.html", current_user=current_user, flash_card_set=flash_card_set,
+                           deck_version=set_version(flash_card_set.id))
+
+
+def deck_payload(flash_card_set, version):
+    # Due cards come first, oldest first, with never-reviewed cards ahead.
+    entries = FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).order_by(
+        FlashCardEntry.due_at.is_not(None), FlashCardEntry.due_at, FlashCardEntry.id)
+    return {
+        'id': flash_card_set.id,
+        'version': version,
+        'set_title': flash_card_set.set_title,
+        'set_description': flash_card_set.set_description,
+        'entries': [
+            {'id': entry.id, 'term': entry.term, 'definition': entry.definition, 'source_url': entry.source_url,
+             'source_time': format_timestamp(entry.source_start) if entry.source_start is not None else None,
+             'due_at': isoformat(entry.due_at)}
+            for entry in entries
+        ],
+    }
+
+
+@app.route("/api/flash_card_sets/<int:set_id>/deck")
+@login_required
+def api_deck(set_id):
+    flash_card_set = db.session.get(FlashCardSet, set_id)
+    if flash_card_set is None or flash_card_set.user_id != current_user.id:
+        abort(404)
+    version = set_version(set_id)
+    etag = str(version)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(deck_payload(flash_card_set, version))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Editor API. The editor pages through a set's entries by id and sends its
+# edits back in batches: new cards with a client key so it learns their ids,
+# changed cards by id and deleted ids, all applied in one transaction.
+# Changes with a blank term or definition come back as "rejected" and are
+# left for the editor to fix; text is trimmed and truncated like every other
+# write path.
+
+ENTRY_PAGE_SIZE = 500
+ENTRY_SAVE_LIMIT = 500
+
+
+@app.route("/api/flash_card_sets/<int:set_id>/entries")
+@login_required
+def api_entries(set_id):
+    flash_card_set = db.session.get(FlashCardSet, set_id)
+    if flash_card_set is None or flash_card_set.user_id != current_user.id:
+        abort(404)
+    after = request.args.get("after", 0, type=int)
+    limit = min(max(request.args.get("limit", ENTRY_PAGE_SIZE, type=int), 1), ENTRY_PAGE_SIZE)
+    rows = db.session.execute(
+        db.select(FlashCardEntry.id, FlashCardEntry.term, FlashCardEntry.definition)
+        .where(FlashCardEntry.flashcard_set_id == set_id, FlashCardEntry.id > after)
+        .order_by(FlashCardEntry.id).limit(limit + 1)
+    ).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'entries': [{'id': row.id, 'term': row.term, 'definition': row.definition} for row in rows],
+        'next': rows[-1].id if more else None,
+        'total': flash_card_set.card_count,
+    })
+
+
+def entry_change_fields(change):
+    if not isinstance(change, dict):
+        return None
+    fields = {}
+    for field in ('term', 'definition'):
+        if field in change:
+            if not isinstance(change[field], str) or not change[field].strip():
+                return None
+            fields[field] = truncate_field(change[field])
+    return fields
+
+
+def save_entries(flash_card_set, changes, deletes):
+    rejected = []
+    updates = {}
+    creates = []
+    for position, change in enumerate(changes):
+        fields = entry_change_fields(change)
+        if fields is None:
+            rejected.append(position)
+        elif change.get('id') is None and len(fields) == 2:
+            creates.append((change.get('key'), fields))
+        elif isinstance(change.get('id'), int):
+            updates[change['id']] = (position, fields)
+        else:
+            rejected.append(position)
+    delete_ids = {entry_id for entry_id in deletes if isinstance(entry_id, int)}
+
+    existing = {
+        entry.id: entry for entry in FlashCardEntry.query.filter(
+            FlashCardEntry.flashcard_set_id == flash_card_set.id, FlashCardEntry.id.in_(set(updates) | delete_ids))
+    } if updates or delete_ids else {}
+    updated = 0
+    for entry_id, (position, fields) in updates.items():
+        entry = existing.get(entry_id)
+        if entry is None or entry_id in delete_ids:
+            rejected.append(position)
+            continue
+        for field, value in fields.items():
+            setattr(entry, field, value)
+        updated += 1
+    deleted = 0
+    for entry_id in delete_ids:
+        if entry_id in existing:
+            db.session.delete(existing[entry_id])
+            deleted += 1
+    created = [(key, FlashCardEntry(flashcard_set_id=flash_card_set.id, **fields)) for key, fields in creates]
+    db.session.add_all([entry for _, entry in created])
+    db.session.flush()
+    created_ids = {str(key): entry.id for key, entry in created if key is not None}
+    db.session.commit()
+    if created or updated:
+        enqueue_dedup_job(flash_card_set.user_id)
+    return {'created': created_ids, 'updated': updated, 'deleted': deleted, 'rejected': sorted(rejected)}
+
+
+@app.route("/api/flash_card_sets/<int:set_id>/entries", methods=["POST"])
+@login_required
+def api_save_entries(set_id):
+    flash_card_set = db.session.get(FlashCardSet, set_id)
+    if flash_card_set is None or flash_card_set.user_id != current_user.id:
+        abort(404)
+    data = request.get_json(silent=True)
+    changes = data.get('changes', []) if isinstance(data, dict) else None
+    deletes = data.get('deletes', []) if isinstance(data, dict) else None
+    if not isinstance(changes, list) or not isinstance(deletes, list) or len(changes) + len(deletes) > ENTRY_SAVE_LIMIT:
+        return jsonify({'error': f'Send at most {ENTRY_SAVE_LIMIT} changes and deletes at a time.'}), 400
+    return jsonify(save_entries(flash_card_set, changes, deletes))
+
+
+OFFLINE_SHELL_ASSETS = ['css/style.css', 'js/offline.js', 'img/cardbase-emblem.png', 'img/cardbase-icon.ico']
+# Versioned CDN files the layout loads with crossorigin, so the worker gets a
+# readable response it can check before caching it.
+OFFLINE_CDN_ASSETS = ['https://unpkg.com/htmx.org@1.9.12', 'https://cdn.jsdelivr.net/npm/bulma@0.9.4/css/bulma-rtl.min.css']
+
+
+@app.route("/sw.js")
+def service_worker():
+    # Served from the root so the worker can control every page. The asset
+    # URLs are fingerprinted, so the shell version changes whenever a cached
+    # asset does, which makes browsers install the new worker and drop the
+    # old cache.
+    shell_assets = [url_for('static', filename=filename) for filename in OFFLINE_SHELL_ASSETS]
+    shell_version = hashlib.blake2b(repr((shell_assets, OFFLINE_CDN_ASSETS)).encode(), digest_size=6).hexdigest()
+    body = render_template("sw.js", shell_version=shell_version, shell_assets=shell_assets,
+                           cdn_assets=OFFLINE_CDN_ASSETS)
+    response = Response(body, mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Service-Worker-Allowed'] = '/'
+    return response
+
+
+# Fragment cache. {% cache scope, key, ... %}...{% endcache %} renders its
+# body once per distinct key and then serves it from an in-process LRU. The
+# scope is usually the user id: commits drop that user's fragments at once,
+# and a version in the key covers writes made by other processes. Compiled
+# templates are kept on disk so new workers skip parsing.
+
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', 2000))
+
+
+class FragmentCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, scope):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == scope]:
+                del self.entries[key]
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_SIZE)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_fragment_cache_users(session, flush_context):
+    users = session.info.setdefault('fragment_cache_users', set())
+    set_ids = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, FlashCardSet):
+            users.add(obj.user_id)
+        elif isinstance(obj, FlashCardEntry):
+            set_ids.add(obj.flashcard_set_id)
+    if set_ids:
+        users.update(session.execute(db.select(FlashCardSet.user_id).where(FlashCardSet.id.in_(set_ids))).scalars())
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_fragment_cache(session):
+    for user_id in session.info.pop('fragment_cache_users', ()):
+        fragment_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_fragment_cache_users(session):
+    session.info.pop('fragment_cache_users', None)
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        location = [nodes.Const(parser.name), nodes.Const(lineno)]
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(key), nodes.List(location)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, key, location, caller):
+        # Templates reload while debugging, so their old output must not stick.
+        if app.debug:
+            return caller()
+        key = (key[0], *location, *key[1:])
+        value = fragment_cache.get(key)
+        if value is None:
+            value = caller()
+            fragment_cache.set(key, value)
+        return value
+
+
+JINJA_CACHE_DIR = os.path.join(app.instance_path, 'jinja_cache')
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+
+# Compression. Dynamic responses above COMPRESS_MIN_SIZE are compressed with
+# the best encoding the client accepts, at a level cheap enough to run on
+# every request. Static files are compressed once, at the highest level, by
+# `flask build-static`, and the .br/.gz copies are served as they are.
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+                      'application/json', 'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon'}
+COMPRESS_LEVELS = {'br': 5, 'gzip': 6}
+STATIC_COMPRESS_LEVELS = {'br': 11, 'gzip': 9}
+STATIC_ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+# JPEG and PNG are compressed already; only these shrink worth keeping.
+PRECOMPRESS_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.ico', '.txt', '.map'}
+PRECOMPRESS_MIN_SAVING = 0.1
+
+
+def accepted_encodings():
+    encodings = [encoding for encoding in ('br', 'gzip')
+                 if (encoding != 'br' or brotli is not None) and request.accept_encodings[encoding]]
+    return sorted(encodings, key=lambda encoding: -request.accept_encodings[encoding])
+
+
+def compress_bytes(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+@app.after_request
+def compress_response(response):
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or request.method == 'HEAD' or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    encodings = accepted_encodings()
+    if len(data) < COMPRESS_MIN_SIZE or not encodings:
+        return response
+    response.set_data(compress_bytes(data, encodings[0], COMPRESS_LEVELS[encodings[0]]))
+    response.headers['Content-Encoding'] = encodings[0]
+    # The bytes differ per encoding, so a strong validator would be wrong.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# Fingerprinted assets. url_for('static', ...) adds a hash of the file's
+# contents to the name, so the response can be cached for a year: a changed
+# file gets a new URL. `flask build-static` writes the manifest; without one
+# it is computed on first use, and in debug mode whenever a file changes.
+
+STATIC_MANIFEST_NAME = 'manifest.json'
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+FINGERPRINT_PATTERN = re.compile(r'^(.+)\.[0-9a-f]{10}(\.[^./]+)$')
+
+static_manifest = {}
+
+
+def static_asset_files(folder):
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or name == STATIC_MANIFEST_NAME or name.endswith(('.gz', '.br', '.tmp')):
+                continue
+            yield os.path.relpath(os.path.join(root, name), folder).replace(os.sep, '/')
+
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=5).hexdigest()
+
+
+def build_asset_manifest(folder):
+    manifest = {}
+    for filename in static_asset_files(folder):
+        with open(os.path.join(folder, filename), 'rb') as f:
+            digest = content_digest(f.read())
+        stem, extension = posixpath.splitext(filename)
+        manifest[filename] = f'{stem}.{digest}{extension}'
+    return manifest
+
+
+def asset_manifest():
+    key = None
+    if app.debug:
+        key = [(filename, os.stat(os.path.join(app.static_folder, filename)).st_mtime_ns)
+               for filename in static_asset_files(app.static_folder)]
+    if 'files' not in static_manifest or static_manifest['key'] != key:
+        path = os.path.join(app.static_folder, STATIC_MANIFEST_NAME)
+        if not app.debug and os.path.exists(path):
+            with open(path) as f:
+                files = json.load(f)
+        else:
+            files = build_asset_manifest(app.static_folder)
+        static_manifest.update(key=key, files=files, originals={value: name for name, value in files.items()})
+    return static_manifest
+
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = asset_manifest()['files'].get(values['filename'], values['filename'])
+
+
+def static_file(filename):
+    original = asset_manifest()['originals'].get(filename)
+    immutable = original is not None
+    match = FINGERPRINT_PATTERN.match(filename)
+    if original is None and match and not os.path.isfile(safe_join(app.static_folder, filename) or ''):
+        # A URL from an older build: serve the current file, but let it expire.
+        original = match.group(1) + match.group(2)
+    filename = original or filename
+    path = safe_join(app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    for encoding in accepted_encodings():
+        encoded_path = path + STATIC_ENCODING_SUFFIXES[encoding]
+        if os.path.isfile(encoded_path) and os.path.getmtime(encoded_path) >= os.path.getmtime(path):
+            response = send_file(encoded_path, mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+                                 max_age=app.get_send_file_max_age(filename), conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = app.send_static_file(filename)
+    if os.path.splitext(filename)[1] in PRECOMPRESS_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+app.view_functions['static'] = static_file
+
+
+# Responsive images. `flask build-static` resizes the images in static/img
+# to RESPONSIVE_IMAGE_WIDTHS as AVIF and WebP. Variants are named after the
+# source's content hash, so a rebuild only encodes images that changed.
+# Templates call responsive_image() to get a <picture> with those variants
+# that falls back to the original file. Pillow is only needed for the build.
+
+RESPONSIVE_IMAGE_DIR = 'img/responsive'
+RESPONSIVE_IMAGE_INDEX = 'images.json'
+RESPONSIVE_IMAGE_SOURCES = {'.jpg', '.jpeg', '.png'}
+RESPONSIVE_IMAGE_WIDTHS = (160, 320, 480, 640, 960, 1280)
+RESPONSIVE_IMAGE_FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 55, 'speed': 6}),
+    'webp': ('WEBP', 'image/webp', {'quality': 78, 'method': 6}),
+}
+
+responsive_images = {}
+
+
+def build_responsive_images(folder):
+    from PIL import Image, features
+
+    output = os.path.join(folder, RESPONSIVE_IMAGE_DIR)
+    os.makedirs(output, exist_ok=True)
+    formats = [name for name in RESPONSIVE_IMAGE_FORMATS if features.check(name)]
+    index, keep, written = {}, {RESPONSIVE_IMAGE_INDEX}, 0
+    for filename in static_asset_files(folder):
+        stem, extension = posixpath.splitext(filename)
+        if (not filename.startswith('img/') or filename.startswith(RESPONSIVE_IMAGE_DIR + '/')
+                or extension.lower() not in RESPONSIVE_IMAGE_SOURCES):
+            continue
+        with open(os.path.join(folder, filename), 'rb') as f:
+            data = f.read()
+        digest = content_digest(data)
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        if width < RESPONSIVE_IMAGE_WIDTHS[0]:
+            continue
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'PA') or 'transparency' in image.info else 'RGB')
+        widths = [size for size in RESPONSIVE_IMAGE_WIDTHS if size < width] + \
+            ([width] if width <= RESPONSIVE_IMAGE_WIDTHS[-1] else [])
+        variants = {}
+        for name in formats:
+            pil_format, mimetype, options = RESPONSIVE_IMAGE_FORMATS[name]
+            variants[name] = []
+            for size in widths:
+                variant = f"{stem[len('img/'):].replace('/', '-')}.{digest}.{size}.{name}"
+                keep.add(variant)
+                variants[name].append([size, f'{RESPONSIVE_IMAGE_DIR}/{variant}'])
+                path = os.path.join(output, variant)
+                if os.path.exists(path):
+                    continue
+                resized = image if size == width else image.resize((size, round(height * size / width)), Image.LANCZOS)
+                resized.save(path + '.tmp', format=pil_format, **options)
+                os.replace(path + '.tmp', path)
+                written += 1
+        index[filename] = {'hash': digest, 'width': width, 'height': height, 'variants': variants}
+    for name in os.listdir(output):
+        if name not in keep:
+            os.remove(os.path.join(output, name))
+    with open(os.path.join(output, RESPONSIVE_IMAGE_INDEX + '.tmp'), 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(os.path.join(output, RESPONSIVE_IMAGE_INDEX + '.tmp'), os.path.join(output, RESPONSIVE_IMAGE_INDEX))
+    return written
+
+
+def responsive_image_index():
+    path = os.path.join(app.static_folder, RESPONSIVE_IMAGE_DIR, RESPONSIVE_IMAGE_INDEX)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    if responsive_images.get('mtime') != mtime:
+        with open(path) as f:
+            responsive_images.update(mtime=mtime, images=json.load(f))
+    return responsive_images['images']
+
+
+def html_attributes(attributes):
+    return Markup('').join(Markup(' {}="{}"').format(name.rstrip('_').replace('_', '-'), value)
+                           for name, value in attributes.items() if value is not None)
+
+
+@app.template_global()
+def responsive_image(filename, alt, sizes='100vw', **attributes):
+    entry = responsive_image_index().get(filename)
+    stem, extension = posixpath.splitext(filename)
+    # Variants of an older version of the file are worse than none.
+    if entry and asset_manifest()['files'].get(filename) != f"{stem}.{entry['hash']}{extension}":
+        entry = None
+    attributes.setdefault('loading', 'lazy')
+    attributes.setdefault('decoding', 'async')
+    if entry:
+        attributes.setdefault('width', entry['width'])
+        attributes.setdefault('height', entry['height'])
+    img = Markup('<img src="{}" alt="{}"{}>').format(url_for('static', filename=filename), alt,
+                                                     html_attributes(attributes))
+    if not entry:
+        return img
+    sources = Markup('').join(
+        Markup('<source type="{}" srcset="{}" sizes="{}">').format(
+            RESPONSIVE_IMAGE_FORMATS[name][1],
+            ', '.join(f"{url_for('static', filename=variant)} {size}w" for size, variant in entry['variants'][name]),
+            sizes)
+        for name in RESPONSIVE_IMAGE_FORMATS if entry['variants'].get(name))
+    return Markup('<picture>{}{}</picture>').format(sources, img)
+
+
+def precompress_static(folder):
+    written = 0
+    for filename in static_asset_files(folder):
+        if os.path.splitext(filename)[1] not in PRECOMPRESS_EXTENSIONS:
+            continue
+        path = os.path.join(folder, filename)
+        data = None
+        for encoding, suffix in STATIC_ENCODING_SUFFIXES.items():
+            encoded_path = path + suffix
+            if encoding == 'br' and brotli is None:
+                continue
+            if os.path.exists(encoded_path) and os.path.getmtime(encoded_path) >= os.path.getmtime(path):
+                continue
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            compressed = compress_bytes(data, encoding, STATIC_COMPRESS_LEVELS[encoding])
+            if len(compressed) > len(data) * (1 - PRECOMPRESS_MIN_SAVING):
+                if os.path.exists(encoded_path):
+                    os.remove(encoded_path)
+                continue
+            with open(encoded_path + '.tmp', 'wb') as f:
+                f.write(compressed)
+            os.replace(encoded_path + '.tmp', encoded_path)
+            written += 1
+    return written
+
+
+@app.cli.command("build-static")
+def build_static_command():
+    """Build image variants, then precompress and fingerprint static assets."""
+    try:
+        print(f"Encoded {build_responsive_images(app.static_folder)} image variants.")
+    except ImportError:
+        print("Pillow is not installed; skipped the responsive images.")
+    print(f"Compressed {precompress_static(app.static_folder)} static files.")
+    if brotli is None:
+        print("Brotli is not installed; only gzip copies were written.")
+    manifest = build_asset_manifest(app.static_folder)
+    path = os.path.join(app.static_folder, STATIC_MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    static_manifest.clear()
+    print(f"Fingerprinted {len(manifest)} static files.")
 
+# Reviews. Grades follow a small Leitner-style schedule: "again" brings the
+# card back in a few minutes, every other grade multiplies its interval.
 
-import moment
-import os
+REVIEW_GRADES = {'again': 0, 'hard': 1, 'good': 2, 'easy': 3}
+REVIEW_INTERVAL_FACTORS = (0, 1.2, 2.5, 3.5)
+REVIEW_RELEARN_MINUTES = 10
+REVIEW_BATCH_LIMIT = 500
 
-app = Flask(__name__)
 
-load_dotenv()
+def schedule_review(entry, grade, reviewed_at):
+    if grade == 0:
+        entry.interval = 0
+        entry.due_at = reviewed_at + datetime.timedelta(minutes=REVIEW_RELEARN_MINUTES)
+    else:
+        entry.interval = max(1.0, entry.interval * REVIEW_INTERVAL_FACTORS[grade])
+        entry.due_at = reviewed_at + datetime.timedelta(days=entry.interval)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SECRET_KEY'] = 'QPEunVzlmptwr73MfPz44w=='
-api_token = os.getenv("API_TOKEN")
-log_config_id = os.getenv("CONFIG_ID")
 
-app.config["MAIL_SERVER"] = "smtp.gmail.com"
-app.config["MAIL_PORT"] = 465
-app.config["MAIL_USE_SSL"] = True
-app.config["MAIL_USERNAME"] = os.getenv("MAIL_USERNAME")  # Replace with your email address
-app.config["MAIL_PASSWORD"] = os.getenv("MAIL_PASSWORD") # Replace with your email password
+def parse_review(data):
+    grade = data.get('grade')
+    grade = REVIEW_GRADES.get(grade, grade)
+    if not isinstance(grade, int) or not 0 <= grade < len(REVIEW_INTERVAL_FACTORS):
+        raise ValueError('grade')
+    reviewed_at = datetime.datetime.utcnow()
+    if data.get('reviewed_at'):
+        # Offline clients send when the review happened; never in the future.
+        stamp = datetime.datetime.fromisoformat(str(data['reviewed_at']).replace('Z', '+00:00'))
+        if stamp.tzinfo is not None:
+            stamp = stamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        reviewed_at = min(stamp, reviewed_at)
+    return int(data['entry_id']), grade, reviewed_at, data.get('client_id')
 
 
-mail = Mail(app)
+def record_reviews(user_id, reviews):
+    parsed = []
+    rejected = []
+    for position, data in enumerate(reviews):
+        try:
+            parsed.append(parse_review(data))
+        except (KeyError, TypeError, ValueError):
+            rejected.append(position)
 
-client = OpenAI()
+    client_ids = [client_id for _, _, _, client_id in parsed if client_id]
+    seen = set(db.session.execute(
+        db.select(FlashCardReview.client_id).where(FlashCardReview.client_id.in_(client_ids))
+    ).scalars()) if client_ids else set()
+    entries = {
+        entry.id: entry for entry in FlashCardEntry.query.join(FlashCardSet).filter(
+            FlashCardSet.user_id == user_id, FlashCardEntry.id.in_({entry_id for entry_id, *_ in parsed})
+        )
+    } if parsed else {}
 
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+    accepted = 0
+    duplicates = 0
+    for entry_id, grade, reviewed_at, client_id in sorted(parsed, key=lambda review: review[2]):
+        if client_id and client_id in seen:
+            duplicates += 1
+            continue
+        entry = entries.get(entry_id)
+        if entry is None:
+            continue
+        schedule_review(entry, grade, reviewed_at)
+        db.session.add(FlashCardReview(user_id=user_id, flashcard_set_id=entry.flashcard_set_id, entry_id=entry.id,
+                                       grade=grade, reviewed_at=reviewed_at, client_id=client_id))
+        if client_id:
+            seen.add(client_id)
+        accepted += 1
+    db.session.commit()
+    return {'accepted': accepted, 'duplicates': duplicates, 'rejected': rejected}
 
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(20), unique=True, nullable=True)
-    first_name = db.Column(db.String(20), nullable=True)
-    last_name = db.Column(db.String(20), nullable=True)
-    password = db.Column(db.String(20), nullable=False)
-    email = db.Column(db.String(100), nullable=False)
-     
-    flash_card_sets = db.relationship('FlashCardSet', backref='user', lazy=True)
 
+@app.route("/api/sync")
+@login_required
+def api_sync():
+    # The token is the last seq the client has applied; "0" or no token
+    # returns everything. Keep calling with the new token while "more" is set.
+    try:
+        since, floor_seen = parse_sync_token(request.args.get("since"))
+    except ValueError:
+        return jsonify({'error': 'Invalid sync token.'}), 400
+    limit = min(max(request.args.get("limit", SYNC_PAGE_SIZE, type=int), 1), SYNC_PAGE_SIZE)
+    return jsonify(sync_changes(current_user.id, since, limit, floor_seen))
 
-class FlashCardSet(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    set_title = db.Column(db.String(255), nullable=False)
-    set_description = db.Column(db.String(255), nullable=False)
-    set_creation_date = db.Column(db.Date, nullable=False, default=moment.now().date)
-    set_modified_date = db.Column(db.Date, nullable=False, default=moment.now().date, onupdate=moment.now().date)
 
-    flashcard_entries = db.relationship('FlashCardEntry', backref='flashcard_set', lazy=True)
+@app.route("/api/reviews", methods=["POST"])
+@login_required
+def api_reviews():
+    reviews = request.get_json(silent=True)
+    if isinstance(reviews, dict):
+        reviews = [reviews]
+    if not isinstance(reviews, list) or len(reviews) > REVIEW_BATCH_LIMIT:
+        return jsonify({'error': f'Send a list of at most {REVIEW_BATCH_LIMIT} reviews.'}), 400
+    return jsonify(record_reviews(current_user.id, reviews))
 
-class FlashCardEntry(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    term = db.Column(db.String(255), nullable=False)
-    definition = db.Column(db.String(255), nullable=False)
 
-    flashcard_set_id = db.Column(db.Integer, db.ForeignKey('flash_card_set.id'), nullable=False)
+# Export. CSV and JSON are generated from yield_per cursors and streamed, and
+# the bytes are copied to instance/exports on the way out. Once a file for the
+# current deck (or account) version is complete it is served with send_file,
+# which answers Range requests, so an interrupted download resumes instead of
+# starting over; until then a Range request gets the whole stream. Anki
+# packages are built on disk by the export_cards job (the collection SQLite
+# is filled in batches and then deflated into the zip in chunks) and the job
+# page links back to the export URL, which serves the finished file.
 
+EXPORT_DIR = os.path.join(app.instance_path, 'exports')
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'json': 'application/json', 'apkg': 'application/octet-stream'}
+EXPORT_YIELD_PER = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_CSV_COLUMNS = ('term', 'definition', 'set_title', 'source_url', 'source_start', 'due_at')
 
-with app.app_context():
-    db.create_all()
+ANKI_ID_BASE = 1_600_000_000_000
+ANKI_MODEL_ID = 1_600_000_000_000
+ANKI_SCHEMA = """
+    CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+        ver integer not null, dty integer not null, usn integer not null, ls integer not null, conf text not null,
+        models text not null, decks text not null, dconf text not null, tags text not null);
+    CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null, mod integer not null,
+        usn integer not null, tags text not null, flds text not null, sfld integer not null, csum integer not null,
+        flags integer not null, data text not null);
+    CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null, ord integer not null,
+        mod integer not null, usn integer not null, type integer not null, queue integer not null, due integer not null,
+        ivl integer not null, factor integer not null, reps integer not null, lapses integer not null,
+        left integer not null, odue integer not null, odid integer not null, flags integer not null, data text not null);
+    CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+        ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null,
+        type integer not null);
+    CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+    CREATE INDEX ix_notes_usn on notes (usn);
+    CREATE INDEX ix_cards_usn on cards (usn);
+    CREATE INDEX ix_cards_nid on cards (nid);
+    CREATE INDEX ix_cards_sched on cards (did, queue, due);
+    CREATE INDEX ix_revlog_usn on revlog (usn);
+    CREATE INDEX ix_revlog_cid on revlog (cid);
+"""
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
 
+def export_sets(user_id, set_id=None):
+    query = db.select(FlashCardSet).where(FlashCardSet.user_id == user_id).order_by(FlashCardSet.id)
+    if set_id is not None:
+        query = query.where(FlashCardSet.id == set_id)
+    return db.session.execute(query).scalars().all()
 
 
-class LoginForm(FlaskForm):
-    email = StringField('Email', validators=[InputRequired(), Length(min=4, max=100)])
-    password = PasswordField('Password', validators=[InputRequired(), Length(min=8, max=64)])
+def export_entries(user_id, set_id=None):
+    query = db.select(
+        FlashCardEntry.id, FlashCardEntry.flashcard_set_id, FlashCardEntry.term, FlashCardEntry.definition,
+        FlashCardEntry.source_url, FlashCardEntry.source_start, FlashCardEntry.due_at, FlashCardEntry.interval
+    ).order_by(FlashCardEntry.flashcard_set_id, FlashCardEntry.id).execution_options(yield_per=EXPORT_YIELD_PER)
+    if set_id is not None:
+        query = query.where(FlashCardEntry.flashcard_set_id == set_id)
+    else:
+        query = query.join(FlashCardSet, FlashCardSet.id == FlashCardEntry.flashcard_set_id).where(FlashCardSet.user_id == user_id)
+    return db.session.execute(query)
 
-class RegistrationForm(FlaskForm):
-    email = StringField('Email', validators=[InputRequired(), Length(min=4, max=100)])
-    password = PasswordField('Password', validators=[InputRequired(), Length(min=8, max=64)])
 
-class FlashCardSetForm(FlaskForm):
-    set_title = StringField('Set Title', validators=[InputRequired()])
-    set_description = StringField('Set Description', validators=[InputRequired()])
-    submit = SubmitField('Create Set')
+def buffered_chunks(pieces, size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    for piece in pieces:
+        buffer.write(piece)
+        if buffer.tell() >= size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
 
-class FlashCardSetEditForm(FlaskForm):
-    set_title = StringField('Set Title', validators=[InputRequired()])
-    set_description = StringField('Set Description', validators=[InputRequired()])
-    submit = SubmitField('Update Set')
 
-class FlashCardEntryForm(FlaskForm):
-    flashcard_set_id = StringField('FlashCardSet ID', validators=[InputRequired()])
-    term = StringField('Term', validators=[InputRequired()])
-    definition = StringField('Definition', validators=[InputRequired()])
-    submit = SubmitField('Save Entry')
+def csv_export_pieces(user_id, set_id=None):
+    titles = {flash_card_set.id: flash_card_set.set_title for flash_card_set in export_sets(user_id, set_id)}
+    line = io.StringIO()
+    writer = csv.writer(line)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    for entry in export_entries(user_id, set_id):
+        writer.writerow((entry.term, entry.definition, titles.get(entry.flashcard_set_id), entry.source_url,
+                         entry.source_start, isoformat(entry.due_at)))
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+    yield line.getvalue()
 
-class ContactUsForm(FlaskForm):
-    name = StringField("Name", validators=[DataRequired()])
-    email = StringField("Email", validators=[DataRequired()])
-    message = TextAreaField("Message", validators=[DataRequired()])
-    submit = SubmitField("Send")
 
-@app.route("/")
-def index():
-    if current_user.is_authenticated:
-        return redirect(url_for('home'))
-    form = RegistrationForm()
-    return render_template("index.html", form=form)
+def json_export_pieces(user_id, set_id=None):
+    # Entries arrive ordered by set, so each set's array is written while the
+    # cursor walks through that set's rows.
+    entries = iter(export_entries(user_id, set_id))
+    pending = next(entries, None)
+    yield '{"sets": ['
+    for position, flash_card_set in enumerate(export_sets(user_id, set_id)):
+        yield (', ' if position else '') + json.dumps(set_sync_payload(flash_card_set))[:-1] + ', "entries": ['
+        first = True
+        while pending is not None and pending.flashcard_set_id == flash_card_set.id:
+            yield ('' if first else ', ') + json.dumps(entry_sync_payload(pending))
+            first = False
+            pending = next(entries, None)
+        yield ']}'
+    yield ']}'
 
-@app.route("/login", methods=['GET', 'POST'])
-def login():
-    if current_user.is_authenticated:
-        return redirect(url_for('home'))
-    form = LoginForm()
-    if request.method == 'POST':
-        if form.validate_on_submit():
-            email = form.email.data
-            password = form.password.data
 
-            user = User.query.filter_by(email=email).first()
-            
-            if not user or not check_password_hash(user.password, password):
-                flash('Please check your login details and try again.')
-                return redirect(url_for('login'))
+def anki_field(value):
+    return html.escape(value or '').replace('\n', '<br>')
 
-            login_user(user)
-            return redirect(url_for('home'))
 
-    return render_template("login.html", form=form)
+def anki_collection_json(decks, now):
+    deck_config = {'1': {
+        'id': 1, 'name': 'Default', 'mod': now, 'usn': 0, 'maxTaken': 60, 'autoplay': True, 'timer': 0,
+        'replayq': True, 'dyn': False,
+        'new': {'delays': [1, 10], 'ints': [1, 4, 7], 'initialFactor': 2500, 'order': 1, 'perDay': 20,
+                'bury': True, 'separate': True},
+        'rev': {'perDay': 100, 'ease4': 1.3, 'fuzz': 0.05, 'maxIvl': 36500, 'ivlFct': 1, 'bury': True,
+                'minSpace': 1},
+        'lapse': {'delays': [10], 'mult': 0, 'minInt': 1, 'leechFails': 8, 'leechAction': 0},
+    }}
+    deck_fields = {'mod': now, 'usn': -1, 'lrnToday': [0, 0], 'revToday': [0, 0], 'newToday': [0, 0],
+                   'timeToday': [0, 0], 'collapsed': False, 'desc': '', 'dyn': 0, 'conf': 1,
+                   'extendNew': 10, 'extendRev': 50}
+    anki_decks = {'1': dict(deck_fields, id=1, name='Default')}
+    for deck_id, name, description in decks:
+        anki_decks[str(deck_id)] = dict(deck_fields, id=deck_id, name=name, desc=description)
+    model = {
+        'id': ANKI_MODEL_ID, 'name': 'CardBase Basic', 'type': 0, 'mod': now, 'usn': -1, 'sortf': 0,
+        'did': decks[0][0] if decks else 1, 'tags': [], 'vers': [], 'req': [[0, 'any', [0]]],
+        'latexPre': '\\documentclass[12pt]{article}\n\\begin{document}\n', 'latexPost': '\\end{document}',
+        'css': '.card { font-family: arial; font-size: 20px; text-align: center; }',
+        'flds': [{'name': name, 'ord': position, 'sticky': False, 'rtl': False, 'font': 'Arial', 'size': 20,
+                  'media': []} for position, name in enumerate(('Term', 'Definition'))],
+        'tmpls': [{'name': 'Card 1', 'ord': 0, 'qfmt': '{{Term}}',
+                   'afmt': '{{FrontSide}}<hr id=answer>{{Definition}}', 'did': None, 'bqfmt': '', 'bafmt': ''}],
+    }
+    conf = {'nextPos': 1, 'estTimes': True, 'activeDecks': [1], 'sortType': 'noteFld', 'timeLim': 0,
+            'sortBackwards': False, 'addToCur': True, 'curDeck': 1, 'newBury': True, 'newSpread': 0,
+            'dueCounts': True, 'curModel': str(ANKI_MODEL_ID), 'collapseTime': 1200}
+    return json.dumps(conf), json.dumps({str(ANKI_MODEL_ID): model}), json.dumps(anki_decks), json.dumps(deck_config)
 
-@app.route("/register", methods=['GET', 'POST'])
-def register():
-    if current_user.is_authenticated:
-        return redirect(url_for('home'))
-    form = RegistrationForm()
-   
-    if request.method == 'POST':
-        if form.validate_on_submit():
-            email = form.email.data
-            password = form.password.data
 
-            user = User.query.filter_by(email=email).first()
-            if user:
-                flash('Username already exists. Please choose a different one.')
-                return redirect(url_for('login'))
+def write_anki_package(path, user_id, set_id=None):
+    now = int(time.time())
+    sets = export_sets(user_id, set_id)
+    decks = [(ANKI_ID_BASE + flash_card_set.id, f"CardBase::{flash_card_set.set_title}",
+              flash_card_set.set_description) for flash_card_set in sets]
+    descriptor, collection_path = tempfile.mkstemp(suffix='.anki2', dir=EXPORT_DIR)
+    os.close(descriptor)
+    try:
+        collection = sqlite3.connect(collection_path)
+        collection.executescript(ANKI_SCHEMA)
+        conf, models, anki_decks, deck_config = anki_collection_json(decks, now)
+        collection.execute('INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, ?)',
+                           (now, now * 1000, now * 1000, conf, models, anki_decks, deck_config, '{}'))
+        for position, batch in enumerate(iter_batches(export_entries(user_id, set_id), EXPORT_YIELD_PER)):
+            notes = []
+            cards = []
+            for offset, entry in enumerate(batch):
+                term = anki_field(entry.term)
+                fields = f"{term}\x1f{anki_field(entry.definition)}"
+                checksum = int(hashlib.sha1(term.encode('utf-8')).hexdigest()[:8], 16)
+                guid = hashlib.sha1(f"cardbase-{entry.id}".encode('utf-8')).hexdigest()[:10]
+                notes.append((ANKI_ID_BASE + entry.id, guid, ANKI_MODEL_ID, now, -1, '', fields, term, checksum, 0, ''))
+                cards.append((ANKI_ID_BASE + entry.id, ANKI_ID_BASE + entry.id, ANKI_ID_BASE + entry.flashcard_set_id,
+                              0, now, -1, 0, 0, position * EXPORT_YIELD_PER + offset, 0, 0, 0, 0, 0, 0, 0, 0, ''))
+            collection.executemany('INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', notes)
+            collection.executemany('INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', cards)
+        collection.commit()
+        collection.close()
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+            package.write(collection_path, 'collection.anki2')
+            package.writestr('media', '{}')
+    finally:
+        os.remove(collection_path)
 
-            new_user = User(email=email, password=generate_password_hash(password, method='sha256'))
-            db.session.add(new_user)
-            db.session.commit()
 
-            message_body = """We are excited to introduce you to CardBase, the innovative flashcard platform that will revolutionize the way you learn. With CardBase, you can tap into the vast resources of YouTube, web pages, and social media to generate personalized flashcards that cover any subject matter you desire.
+def export_version(user_id, set_id):
+    return user_version(user_id) if set_id is None else set_version(set_id)
 
-By leveraging the power of AI, CardBase seamlessly combines the wisdom of centuries with state-of-the-art technology to simplify your learning experience. Our platform empowers you to effortlessly create and manage flashcards using your voice, allowing you to learn on the go and make the most of your valuable time.
-\n
-Whether you're a student, a professional, or simply someone passionate about continuous learning, CardBase is designed to cater to your needs. With our platform, you can access a wealth of knowledge from various sources and compile it into engaging flashcards, all at the convenience of a few simple voice commands.
 
-We invite you to embrace the efficiency and convenience of CardBase today. Experience a new level of productivity as you explore any subject matter with ease and simplicity. 
-\n
-To get started, simply visit our user-friendly website and follow our quick and hassle-free registration process. Once you're in, you'll gain access to a range of powerful features and tools designed to enhance your learning experience.
+def export_file_path(user_id, set_id, export_format, version):
+    scope = f'set{set_id}' if set_id else 'all'
+    return os.path.join(EXPORT_DIR, f'{user_id}-{scope}-{version}.{export_format}')
 
-If you have any questions or need assistance, our dedicated support team is here to help. Feel free to reach out to us at **CardBase@gmail.com**, and we'll be delighted to assist you.
-\n
-Thank you for choosing CardBase as your go-to flashcard platform. We are thrilled to have you on board and cannot wait to witness the positive impact CardBase will have on your learning journey.
 
-Wishing you success and fulfillment as you embark on your quest for knowledge!
-\n
-Best regards,
-\n
-CardBase Team"""
-          
-            # Send email to the new user
-            msg = Message(
-                subject="Welcome to CardBase - Simply Learning! Amplify Knowledge!",
-                sender=app.config["MAIL_USERNAME"],
-                recipients=[email],
-                body=f"Hi {email},\n\n{message_body}"
-            )
-            mail.send(msg)
+def replace_export_file(part_path, path):
+    os.replace(part_path, path)
+    # Older versions of the same export can never be requested again.
+    prefix = os.path.basename(path).rsplit('-', 1)[0] + '-'
+    extension = os.path.splitext(path)[1]
+    for name in os.listdir(EXPORT_DIR):
+        if name.startswith(prefix) and name.endswith(extension) and name != os.path.basename(path):
+            os.remove(os.path.join(EXPORT_DIR, name))
 
-            flash('Registration successful! An email has been sent to your email address.')
-            user = User.query.filter_by(email=email).first()
-            login_user(user)
-            return redirect(url_for('home'))
-    return render_template("register.html", form=form)
 
-@login_required
-@app.route("/home")
-def home():
-    user_id = current_user.id 
-    flash_card_sets = FlashCardSet.query.filter_by(user_id=user_id).all()
-    return render_template("home.html", current_user=current_user, flash_card_sets=flash_card_sets)
+def tee_export(path, chunks):
+    # Streams the chunks to the client and to a part file; only a download
+    # that ran to the end becomes the file that Range requests are served from.
+    part_path = f'{path}.{uuid.uuid4().hex}.part'
+    complete = False
+    try:
+        with open(part_path, 'wb') as part:
+            for chunk in chunks:
+                part.write(chunk)
+                yield chunk
+        complete = True
+        replace_export_file(part_path, path)
+    finally:
+        if not complete and os.path.exists(part_path):
+            os.remove(part_path)
 
-@app.route("/create_set", methods=["GET", "POST"])
-@login_required
-def create_set():
-    current_user.session_engaged = True
-    form = FlashCardSetForm()
-    if request.method == "POST":
-        print(request.form)
-        user_id = current_user.id
-        set_title = request.form.get("set_title")
-        set_description = request.form.get("set_description")
-        set_creation_date = moment.now().date
-        set_modified_date = moment.now().date
 
-        new_set = FlashCardSet(
-            user_id=user_id,
-            set_title=set_title,
-            set_description=set_description,
-            set_creation_date=set_creation_date,
-            set_modified_date=set_modified_date
-        )
+def export_chunks(user_id, set_id, export_format):
+    pieces = csv_export_pieces if export_format == 'csv' else json_export_pieces
+    return buffered_chunks(pieces(user_id, set_id))
 
-        db.session.add(new_set)
-        db.session.commit()
 
-        print(FlashCardSet.query.filter_by(user_id=user_id).all())
+def build_export_file(path, user_id, set_id, export_format):
+    part_path = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        if export_format == 'apkg':
+            write_anki_package(part_path, user_id, set_id)
+        else:
+            with open(part_path, 'wb') as part:
+                for chunk in export_chunks(user_id, set_id, export_format):
+                    part.write(chunk)
+        replace_export_file(part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
 
-        return redirect(url_for("flash_card_sets"))
-    
-    return render_template("create_set.html", current_user=current_user, form=form)
 
-@app.route("/create_with_ai", methods=["GET", "POST"])
-@login_required
-def create_with_ai():
-    current_user.session_engaged = True
-    form = FlashCardSetForm()
-    if request.method == "POST":
-        print(request.form)
-        user_id = current_user.id
-        set_title = request.form.get("set_title")
-        set_description = request.form.get("set_description")
-        set_creation_date = moment.now().date
-        set_modified_date = moment.now().date
+@job_handler('export_cards')
+def export_cards_job(context):
+    user_id = context.job.user_id
+    set_id = context.payload.get('set_id')
+    if set_id is not None:
+        flash_card_set = db.session.get(FlashCardSet, set_id)
+        if flash_card_set is None or flash_card_set.user_id != user_id:
+            raise JobFailed("That flashcard set no longer exists.")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = export_file_path(user_id, set_id, context.payload['format'], export_version(user_id, set_id))
+    if not os.path.exists(path):
+        build_export_file(path, user_id, set_id, context.payload['format'])
+    return {'archive': os.path.basename(path), 'size': os.path.getsize(path)}
 
-        new_set = FlashCardSet(
-            user_id=user_id,
-            set_title=set_title,
-            set_description=set_description,
-            set_creation_date=set_creation_date,
-            set_modified_date=set_modified_date
-        )
 
-        db.session.add(new_set)
-        db.session.commit()
+# Account export. The archive is assembled by the export_account job, one
+# table at a time, reading keyset-paginated chunks and appending them as JSON
+# lines to the zip member being written, so neither the worker nor a web
+# worker ever holds more than one chunk of the account. Finished archives are
+# served from instance/exports with send_file.
 
-        print(FlashCardSet.query.filter_by(user_id=user_id).all())
+ACCOUNT_EXPORT_CHUNK = 1000
 
-        return redirect(url_for("flash_card_sets"))
-    
-    return render_template("create_with_ai.html", current_user=current_user, form=form)
 
-@app.route("/create_with_youtube", methods=["GET", "POST"])
-@login_required
-def create_with_youtube():
-     return render_template("create_with_youtube.html", current_user=current_user)
+def iter_keyset_batches(query, key_column, size=ACCOUNT_EXPORT_CHUNK):
+    # Each chunk is its own short query, so the worker can commit progress
+    # between chunks without holding a cursor open across transactions.
+    last = None
+    while True:
+        batch_query = query if last is None else query.where(key_column > last)
+        rows = db.session.execute(batch_query.order_by(key_column).limit(size)).all()
+        if not rows:
+            return
+        yield rows
+        last = getattr(rows[-1], key_column.key)
 
-@app.route("/create_with_text", methods=["GET", "POST"])
-@login_required
-def create_with_text():
-    return render_template("create_with_text.html", current_user=current_user)
 
-@app.route("/create_with_social_media", methods=["GET", "POST"])
-@login_required
-def create_with_social_media():
-     return render_template("create_with_social.html", current_user=current_user)
+def account_export_tables(user_id):
+    owned_sets = db.select(FlashCardSet.id).where(FlashCardSet.user_id == user_id)
+    return [
+        ('sets.jsonl', FlashCardSet.id, db.select(
+            FlashCardSet.id, FlashCardSet.set_title, FlashCardSet.set_description, FlashCardSet.set_creation_date,
+            FlashCardSet.set_modified_date).where(FlashCardSet.user_id == user_id),
+         set_sync_payload),
+        ('entries.jsonl', FlashCardEntry.id, db.select(
+            FlashCardEntry.id, FlashCardEntry.flashcard_set_id, FlashCardEntry.term, FlashCardEntry.definition,
+            FlashCardEntry.source_url, FlashCardEntry.source_start, FlashCardEntry.due_at, FlashCardEntry.interval
+        ).where(FlashCardEntry.flashcard_set_id.in_(owned_sets)),
+         entry_sync_payload),
+        ('reviews.jsonl', FlashCardReview.id, db.select(
+            FlashCardReview.id, FlashCardReview.flashcard_set_id, FlashCardReview.entry_id, FlashCardReview.grade,
+            FlashCardReview.reviewed_at).where(FlashCardReview.user_id == user_id),
+         lambda row: {'id': row.id, 'flashcard_set_id': row.flashcard_set_id, 'entry_id': row.entry_id,
+                      'grade': row.grade, 'reviewed_at': isoformat(row.reviewed_at)}),
+        # The jobs that generated each set: what was imported, crawled or
+        # uploaded, with the kept upload files as archive members instead of
+        # their server-side paths.
+        ('sources.jsonl', Job.id, db.select(
+            Job.id, Job.kind, Job.flashcard_set_id, Job.status, Job.payload, Job.result, Job.created_at
+        ).where(Job.user_id == user_id, Job.kind.not_in(('export_account', 'export_cards', 'dedup_cards', 'repair_counters'))),
+         job_source_payload),
+    ]
 
-@app.route("/create_with_web_page", methods=["GET", "POST"])
+
+def job_source_files(job_id, payload):
+    filenames = payload.get('filenames') or []
+    files = []
+    for number, path in enumerate(payload.get('paths', [])):
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(JOB_SOURCE_DIR) or not os.path.exists(path):
+            continue
+        name = secure_filename(filenames[number]) if number < len(filenames) else ''
+        files.append((path, f'sources/{job_id}/{number}-{name or os.path.basename(path)}'))
+    return files
+
+
+def job_source_payload(row):
+    payload = json.loads(row.payload)
+    return {'id': row.id, 'kind': row.kind, 'flashcard_set_id': row.flashcard_set_id, 'status': row.status,
+            'request': {key: value for key, value in payload.items() if key != 'paths'},
+            'files': [name for path, name in job_source_files(row.id, payload)],
+            'result': json.loads(row.result) if row.result else None,
+            'created_at': isoformat(row.created_at)}
+
+
+def account_export_path(user_id, job_id):
+    return os.path.join(EXPORT_DIR, f'account-{user_id}-{job_id}.zip')
+
+
+@job_handler('export_account')
+def export_account_job(context):
+    user = db.session.get(User, context.job.user_id)
+    if user is None:
+        raise JobFailed("That account no longer exists.")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = account_export_path(user.id, context.job_id)
+    part_path = f'{path}.{uuid.uuid4().hex}.part'
+    total = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(FlashCardSet.card_count), 0)).where(FlashCardSet.user_id == user.id)
+    ).scalar()
+    written = 0
+    try:
+        with zipfile.ZipFile(part_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('profile.json', json.dumps({
+                'id': user.id, 'username': user.username, 'first_name': user.first_name,
+                'last_name': user.last_name, 'email': user.email,
+                'exported_at': datetime.datetime.utcnow().isoformat(),
+            }, indent=2))
+            for name, key_column, query, serialize in account_export_tables(user.id):
+                with archive.open(name, 'w', force_zip64=True) as member:
+                    for batch in iter_keyset_batches(query, key_column):
+                        member.write(''.join(json.dumps(serialize(row)) + '\n' for row in batch).encode('utf-8'))
+                        written += len(batch)
+                        context.progress(written, max(total, written))
+            for batch in iter_keyset_batches(db.select(Job.id, Job.payload).where(Job.user_id == user.id), Job.id):
+                for row in batch:
+                    for source_path, name in job_source_files(row.id, json.loads(row.payload)):
+                        archive.write(source_path, name)
+        os.replace(part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return {'archive': os.path.basename(path), 'rows': written, 'size': os.path.getsize(path)}
+
+
+@app.route("/account/export", methods=["POST"])
 @login_required
-def create_with_web_page():
-     return render_template("create_with_web.html", current_user=current_user)
+def request_account_export():
+    job = Job.query.filter(Job.user_id == current_user.id, Job.kind == 'export_account',
+                           Job.status.in_(('queued', 'running'))).first()
+    if job is None:
+        job = enqueue_job('export_account', {}, user_id=current_user.id)
+    flash("Your data export is being prepared.")
+    return redirect(url_for("job_status", job_id=job.id))
 
 
-@app.route("/edit_flash_card_set/<set_id>", methods=["GET", "POST"])
+@app.route("/account/export/<int:job_id>")
 @login_required
-def edit_flash_card_set(set_id):
-    flash_card_set = FlashCardSet.query.get(set_id)
-    if flash_card_set is None or flash_card_set.user_id != current_user.id:
-        flash("Flashcard set not found.")
+def download_account_export(job_id):
+    job = get_user_job(job_id)
+    result = json.loads(job.result) if job.result else {}
+    if job.kind != 'export_account' or job.status != 'done' or not result.get('archive'):
+        abort(404)
+    path = os.path.join(EXPORT_DIR, secure_filename(result['archive']))
+    if not os.path.exists(path):
+        flash("That export has expired. Please request a new one.")
         return redirect(url_for("flash_card_sets"))
+    return send_file(path, mimetype='application/zip', as_attachment=True,
+                     download_name=f"cardbase-account-{job.created_at:%Y%m%d}.zip", conditional=True, max_age=0)
+
+
+# Account deletion. Deleting an account only deactivates it; the purge_account
+# job then removes the data table by table, a bounded batch per short
+# transaction with a pause in between, so web requests keep getting the
+# SQLite write lock. Every step just deletes "some remaining rows", so a job
+# that crashes halfway is picked up again by the lease and carries on.
+# retention_sweep (or `flask sweep` from cron) applies the same batching to
+# sync tombstones, old review events and finished export archives.
+
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 500))
+PURGE_PAUSE_SECONDS = float(os.getenv('PURGE_PAUSE_SECONDS', 0.05))
+TOMBSTONE_RETENTION_DAYS = 90
+REVIEW_RETENTION_DAYS = 365
+EXPORT_RETENTION_HOURS = 24
 
-    form = FlashCardSetEditForm()
-    if request.method == "POST":
-        flash_card_set.set_title = request.form.get("set_title")
-        flash_card_set.set_description = request.form.get("set_description")
-        flash_card_set.set_modified_date = moment.now().date
 
+def delete_in_batches(model, condition, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS, progress=None):
+    key = model.__mapper__.primary_key[0]
+    deleted = 0
+    while True:
+        keys = db.session.execute(db.select(key).where(condition).limit(batch_size)).scalars().all()
+        if not keys:
+            return deleted
+        db.session.execute(db.delete(model).where(key.in_(keys)).execution_options(synchronize_session=False))
         db.session.commit()
+        deleted += len(keys)
+        if progress:
+            progress(deleted)
+        time.sleep(pause)
 
-        flash("Flashcard set updated successfully.")
-        return redirect(url_for("flash_card_sets"))
 
-    return render_template("edit_flash_card_set.html", current_user=current_user, flash_card_set=flash_card_set, form=form)
+def remove_user_files(user_id):
+    for directory in (EXPORT_DIR, JOB_SOURCE_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.startswith((f'{user_id}-', f'account-{user_id}-')):
+                os.remove(os.path.join(directory, name))
 
 
-@app.route("/practice_flash_card_set/<set_id>")
+def purge_user(user_id, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS, keep_job_id=None, progress=None):
+    owned_sets = db.select(FlashCardSet.id).where(FlashCardSet.user_id == user_id)
+    # Children before parents: deleting entries fires the search, dedup,
+    # counter and change log triggers while their set still exists.
+    steps = [
+        (FlashCardReview, FlashCardReview.user_id == user_id),
+        (CardDuplicate, CardDuplicate.user_id == user_id),
+        (CardLshBucket, CardLshBucket.user_id == user_id),
+        (FlashCardEntry, FlashCardEntry.flashcard_set_id.in_(owned_sets)),
+        (FlashCardSet, FlashCardSet.user_id == user_id),
+        (ChangeLog, ChangeLog.user_id == user_id),
+        (Job, db.and_(Job.user_id == user_id, Job.id != (keep_job_id or 0))),
+    ]
+    deleted = 0
+    for model, condition in steps:
+        deleted += delete_in_batches(
+            model, condition, batch_size, pause,
+            progress=(lambda count, offset=deleted: progress(offset + count)) if progress else None)
+    remove_user_files(user_id)
+    User.query.filter_by(id=user_id).delete()
+    db.session.commit()
+    return deleted
+
+
+@job_handler('purge_account')
+def purge_account_job(context):
+    user = db.session.get(User, context.job.user_id)
+    if user is None:
+        return {'deleted': 0}
+    if user.deactivated_at is None:
+        raise JobFailed("Only deactivated accounts can be purged.")
+    deleted = purge_user(user.id, batch_size=context.payload.get('batch_size', PURGE_BATCH_SIZE),
+                         pause=context.payload.get('pause', PURGE_PAUSE_SECONDS), keep_job_id=context.job_id,
+                         progress=context.progress)
+    return {'deleted': deleted}
+
+
+def sweep_tombstones(cutoff, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS):
+    expired = db.and_(ChangeLog.op == 'delete', ChangeLog.created_at < cutoff)
+    # Raise each user's sync floor before their tombstones disappear.
+    floors = db.session.execute(
+        db.select(ChangeLog.user_id, db.func.max(ChangeLog.seq)).where(expired).group_by(ChangeLog.user_id)
+    ).all()
+    for user_id, floor in floors:
+        db.session.execute(db.update(User).where(User.id == user_id, User.sync_floor < floor).values(sync_floor=floor))
+    db.session.commit()
+    return delete_in_batches(ChangeLog, expired, batch_size, pause)
+
+
+def sweep_export_files(cutoff):
+    removed = 0
+    if not os.path.isdir(EXPORT_DIR):
+        return removed
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def retention_sweep(batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS):
+    now = datetime.datetime.utcnow()
+    return {
+        'tombstones': sweep_tombstones(now - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS), batch_size, pause),
+        'reviews': delete_in_batches(
+            FlashCardReview, FlashCardReview.reviewed_at < now - datetime.timedelta(days=REVIEW_RETENTION_DAYS),
+            batch_size, pause),
+        'exports': sweep_export_files(time.time() - EXPORT_RETENTION_HOURS * 3600),
+    }
+
+
+@job_handler('retention_sweep')
+def retention_sweep_job(context):
+    return retention_sweep(context.payload.get('batch_size', PURGE_BATCH_SIZE),
+                           context.payload.get('pause', PURGE_PAUSE_SECONDS))
+
+
+@app.cli.command("sweep")
+@click.option("--batch-size", default=PURGE_BATCH_SIZE, help="Rows deleted per transaction.")
+@click.option("--pause", default=PURGE_PAUSE_SECONDS, help="Seconds to wait between batches.")
+def sweep_command(batch_size, pause):
+    """Delete expired sync tombstones, review events and export archives."""
+    print(retention_sweep(batch_size, pause))
+
+
+@app.route("/account")
 @login_required
-def practice_flash_card_set(set_id):
-    flash_card_set = FlashCardSet.query.get(set_id)
-    if flash_card_set is None or flash_card_set.user_id != current_user.id:
-        flash("Flashcard set not found.")
-        return redirect(url_for("flash_card_sets"))
+def account():
+    form = AccountDeleteForm()
+    return render_template("account.html", current_user=current_user, form=form)
+
+
+@app.route("/account/delete", methods=["POST"])
+@login_required
+def delete_account():
+    form = AccountDeleteForm()
+    if not form.validate_on_submit() or not check_password_hash(current_user.password, form.password.data):
+        flash("Please enter your password to delete your account.")
+        return redirect(url_for("account"))
+
+    user_id = current_user.id
+    current_user.deactivated_at = datetime.datetime.utcnow()
+    db.session.commit()
+    enqueue_job('purge_account', {}, user_id=user_id, priority=-1, max_attempts=10)
+    with prefix_index_lock:
+        prefix_indexes.pop(user_id, None)
+    fragment_cache.invalidate(user_id)
+    logout_user()
+    flash("Your account has been deleted.")
+    return redirect(url_for("login"))
+
+
+@app.route("/flash_card_sets/export.<export_format>")
+@app.route("/flash_card_sets/<int:set_id>/export.<export_format>")
+@login_required
+def export_flash_card_sets(export_format, set_id=None):
+    if export_format not in EXPORT_MIMETYPES:
+        abort(404)
+    if set_id is None:
+        name = 'cardbase'
+    else:
+        flash_card_set = db.session.get(FlashCardSet, set_id)
+        if flash_card_set is None or flash_card_set.user_id != current_user.id:
+            abort(404)
+        name = secure_filename(flash_card_set.set_title) or 'flashcards'
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = export_file_path(current_user.id, set_id, export_format, export_version(current_user.id, set_id))
+    etag = os.path.basename(path)
+    download_name = f'{name}.{export_format}'
+    if os.path.exists(path):
+        return send_file(path, mimetype=EXPORT_MIMETYPES[export_format], as_attachment=True,
+                         download_name=download_name, conditional=True, etag=etag, max_age=0)
+
+    if export_format == 'apkg':
+        payload = {'set_id': set_id, 'format': export_format}
+        job = Job.query.filter(Job.user_id == current_user.id, Job.kind == 'export_cards',
+                               Job.payload == json.dumps(payload), Job.status.in_(('queued', 'running'))).first()
+        if job is None:
+            job = enqueue_job('export_cards', payload, user_id=current_user.id)
+        flash("Your Anki package is being prepared.")
+        return redirect(url_for("job_status", job_id=job.id))
+
+    response = Response(stream_with_context(tee_export(path, export_chunks(current_user.id, set_id, export_format))),
+                        mimetype=EXPORT_MIMETYPES[export_format])
+    response.set_etag(etag)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
-    flash_card_entries = [{'term': entry.term, 'definition': entry.definition} for entry in flash_card_set.flashcard_entries]
-    flash_card_set_json = json.dumps(flash_card_entries)
-    
-    return render_template("practice_flash_card_set.html", current_user=current_user, flash_card_set=flash_card_set, flash_card_set_json=flash_card_set_json)
 
 @app.route("/delete_flash_card_set/<set_id>", methods=["POST"])
 @login_required
@@ -323,7 +4256,10 @@ def delete_flash_card_set(set_id):
         flash("Flashcard set not found.")
         return redirect(url_for("flash_card_sets"))
 
-    # Delete all flash_card_entries in the flash_card_set
+    # Delete the set's reviews and flash_card_entries in the same transaction
+    entry_ids = db.select(FlashCardEntry.id).where(FlashCardEntry.flashcard_set_id == flash_card_set.id)
+    db.session.execute(db.delete(FlashCardReview).where(db.or_(
+        FlashCardReview.flashcard_set_id == flash_card_set.id, FlashCardReview.entry_id.in_(entry_ids))))
     for entry in flash_card_set.flashcard_entries:
         db.session.delete(entry)
 
@@ -331,9 +4267,20 @@ def delete_flash_card_set(set_id):
     db.session.commit()
 
     flash("Flashcard set deleted successfully.")
+    if htmx_request():
+        return htmx_fragment()
     return redirect(url_for("flash_card_sets"))
 
 
+@app.route("/flash_card_sets/<int:set_id>/row")
+@login_required
+def flash_card_set_row(set_id):
+    flash_card_set = db.session.get(FlashCardSet, set_id)
+    if flash_card_set is None or flash_card_set.user_id != current_user.id:
+        abort(404)
+    return htmx_fragment("flash_card_set_row.html", flash_card_set=flash_card_set)
+
+
 @app.route('/save_flashcard_entries', methods=['POST'])
 def save_flashcard_entries():
     flashcard_entries_data = request.json  # Assuming the data is sent as JSON array
@@ -426,11 +4373,21 @@ def customers():
     customers = Customer.query.filter_by(user_id=current_user.id).all()
     return render_template("customers.html", current_user=current_user, customers=customers)
 
+def deck_list_page_version():
+    # Runs before every GET of the deck list, so this is the one place its
+    # due counts are refreshed.
+    refresh_due_counts(current_user.id)
+    return deck_list_version(current_user.id)
+
+
 @app.route("/flash_card_sets")
 @login_required
+@conditional_page(deck_list_page_version)
 def flash_card_sets():
-    flash_card_sets = FlashCardSet.query.filter_by(user_id=current_user.id).all()
-    return render_template("flash_card_sets.html", current_user=current_user, flash_card_sets=flash_card_sets)
+    # The deck table is only queried when its cached fragment is out of date.
+    flash_card_sets = FlashCardSet.query.filter_by(user_id=current_user.id).order_by(FlashCardSet.set_modified_date.desc())
+    return render_template("flash_card_sets.html", current_user=current_user, flash_card_sets=flash_card_sets,
+                           deck_list_version=deck_list_version(current_user.id))
 
 @app.route("/products")
 @login_required
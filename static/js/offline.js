@@ -0,0 +1,136 @@
+// IndexedDB storage shared by the practice page and the service worker:
+// decks are cached by set id together with their version, and reviews made
+// while offline wait in a queue until they can be sent in batches.
+var CardBaseOffline = (function() {
+    var DB_NAME = "cardbase";
+    var DB_VERSION = 1;
+    var REVIEW_BATCH_SIZE = 100;
+    var flushing = null;
+
+    function openDb() {
+        return new Promise(function(resolve, reject) {
+            var request = indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = function() {
+                var db = request.result;
+                if (!db.objectStoreNames.contains("decks")) {
+                    db.createObjectStore("decks", {keyPath: "id"});
+                }
+                if (!db.objectStoreNames.contains("reviews")) {
+                    db.createObjectStore("reviews", {keyPath: "client_id"});
+                }
+            };
+            request.onsuccess = function() { resolve(request.result); };
+            request.onerror = function() { reject(request.error); };
+        });
+    }
+
+    function withStore(name, mode, callback) {
+        return openDb().then(function(db) {
+            return new Promise(function(resolve, reject) {
+                var transaction = db.transaction(name, mode);
+                var result = callback(transaction.objectStore(name));
+                transaction.oncomplete = function() {
+                    db.close();
+                    resolve(result && "result" in result ? result.result : result);
+                };
+                transaction.onerror = function() {
+                    db.close();
+                    reject(transaction.error);
+                };
+            });
+        });
+    }
+
+    function getDeck(setId) {
+        return withStore("decks", "readonly", function(store) { return store.get(setId); });
+    }
+
+    function putDeck(deck) {
+        return withStore("decks", "readwrite", function(store) { store.put(deck); });
+    }
+
+    // Fetches the deck unless the cached copy is already at `version`; the
+    // server answers 304 when the client's ETag is still current.
+    function revalidateDeck(url, cached, version) {
+        if (cached && version && cached.version === version) {
+            return Promise.resolve(cached);
+        }
+        var headers = cached ? {"If-None-Match": '"' + cached.version + '"'} : {};
+        return fetch(url, {headers: headers, credentials: "same-origin"}).then(function(response) {
+            if (response.status === 304) {
+                return cached;
+            }
+            if (!response.ok) {
+                throw new Error("Deck request failed with " + response.status);
+            }
+            return response.json().then(function(deck) {
+                return putDeck(deck).then(function() { return deck; });
+            });
+        });
+    }
+
+    function queueReview(review) {
+        review.client_id = review.client_id || (self.crypto && crypto.randomUUID ? crypto.randomUUID() : Date.now() + "-" + Math.random());
+        return withStore("reviews", "readwrite", function(store) { store.put(review); });
+    }
+
+    function pendingReviews() {
+        return withStore("reviews", "readonly", function(store) { return store.getAll(); });
+    }
+
+    function removeReviews(clientIds) {
+        return withStore("reviews", "readwrite", function(store) {
+            clientIds.forEach(function(clientId) { store.delete(clientId); });
+        });
+    }
+
+    // Sends queued reviews oldest first; a batch is only dropped from the
+    // queue once the server has answered, and replays are harmless because
+    // the server ignores client_ids it has already recorded.
+    function flushReviews(url) {
+        if (flushing) {
+            return flushing;
+        }
+        flushing = pendingReviews().then(function(reviews) {
+            reviews.sort(function(a, b) { return a.reviewed_at < b.reviewed_at ? -1 : 1; });
+            var sendNext = function(offset) {
+                var batch = reviews.slice(offset, offset + REVIEW_BATCH_SIZE);
+                if (!batch.length) {
+                    return reviews.length;
+                }
+                return fetch(url, {
+                    method: "POST",
+                    credentials: "same-origin",
+                    headers: {"Content-Type": "application/json"},
+                    body: JSON.stringify(batch)
+                }).then(function(response) {
+                    if (!response.ok) {
+                        throw new Error("Review upload failed with " + response.status);
+                    }
+                    return removeReviews(batch.map(function(review) { return review.client_id; }));
+                }).then(function() {
+                    return sendNext(offset + REVIEW_BATCH_SIZE);
+                });
+            };
+            return sendNext(0);
+        });
+        flushing = flushing.finally(function() { flushing = null; });
+        return flushing;
+    }
+
+    function clear() {
+        return new Promise(function(resolve) {
+            var request = indexedDB.deleteDatabase(DB_NAME);
+            request.onsuccess = request.onerror = request.onblocked = function() { resolve(); };
+        });
+    }
+
+    return {
+        getDeck: getDeck,
+        putDeck: putDeck,
+        revalidateDeck: revalidateDeck,
+        queueReview: queueReview,
+        flushReviews: flushReviews,
+        clear: clear
+    };
+})();
@@ -0,0 +1,93 @@
+// CardBase service worker. The app shell (our own styles, scripts and icons,
+// plus the htmx and Bulma builds from their CDNs) is served from cache and
+// refreshed in the background; nothing else is cached at runtime. Practice
+// pages are fetched from the network first and fall back to their last cached
+// copy offline. Deck data itself lives in IndexedDB (see offline.js), not in
+// these caches.
+importScripts("{{ url_for('static', filename='js/offline.js') }}");
+
+var SHELL_CACHE = "cardbase-shell-{{ shell_version }}";
+var PAGE_CACHE = "cardbase-pages";
+var SHELL_ASSETS = {{ shell_assets|tojson }};
+var CDN_ASSETS = {{ cdn_assets|tojson }};
+var REVIEWS_URL = "{{ url_for('api_reviews') }}";
+
+self.addEventListener("install", function(event) {
+    event.waitUntil(caches.open(SHELL_CACHE).then(function(cache) {
+        return cache.addAll(SHELL_ASSETS);
+    }).then(function() {
+        return self.skipWaiting();
+    }));
+});
+
+self.addEventListener("activate", function(event) {
+    event.waitUntil(caches.keys().then(function(names) {
+        return Promise.all(names.filter(function(name) {
+            return name.indexOf("cardbase-shell-") === 0 && name !== SHELL_CACHE;
+        }).map(function(name) {
+            return caches.delete(name);
+        }));
+    }).then(function() {
+        return self.clients.claim();
+    }));
+});
+
+function isShellAsset(url) {
+    if (url.origin === self.location.origin) {
+        return SHELL_ASSETS.indexOf(url.pathname) !== -1;
+    }
+    return CDN_ASSETS.indexOf(url.href) !== -1;
+}
+
+function staleWhileRevalidate(request) {
+    return caches.open(SHELL_CACHE).then(function(cache) {
+        return cache.match(request).then(function(cached) {
+            // An opaque response could be an error page we cannot see, so
+            // only readable, successful responses replace the cached copy.
+            var fresh = fetch(request).then(function(response) {
+                if (response.ok && response.type !== "opaque") {
+                    cache.put(request, response.clone());
+                }
+                return response;
+            }).catch(function() {
+                return cached || Response.error();
+            });
+            return cached || fresh;
+        });
+    });
+}
+
+function networkFirst(request) {
+    return fetch(request).then(function(response) {
+        if (response.ok) {
+            var copy = response.clone();
+            caches.open(PAGE_CACHE).then(function(cache) { cache.put(request, copy); });
+        }
+        return response;
+    }).catch(function() {
+        return caches.match(request).then(function(cached) {
+            return cached || Response.error();
+        });
+    });
+}
+
+self.addEventListener("fetch", function(event) {
+    var request = event.request;
+    if (request.method !== "GET") {
+        return;
+    }
+    var url = new URL(request.url);
+    if (request.mode === "navigate" && url.pathname.indexOf("/practice_flash_card_set/") === 0) {
+        event.respondWith(networkFirst(request));
+    } else if (isShellAsset(url)) {
+        event.respondWith(staleWhileRevalidate(request));
+    }
+});
+
+// Background Sync replays the review queue once the browser is back online,
+// even if the practice page has been closed in the meantime.
+self.addEventListener("sync", function(event) {
+    if (event.tag === "flush-reviews") {
+        event.waitUntil(CardBaseOffline.flushReviews(REVIEWS_URL));
+    }
+});
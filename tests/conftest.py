@@ -0,0 +1,78 @@
+import functools
+import http.server
+import ipaddress
+import os
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# The app creates its tables on import, so point it at a scratch database
+# before it is loaded.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as cardbase
+from werkzeug.security import generate_password_hash
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    cardbase.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    monkeypatch.setattr(cardbase, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setattr(cardbase, 'JOB_UPLOAD_DIR', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(cardbase, 'JOB_SOURCE_DIR', str(tmp_path / 'sources'))
+    with cardbase.app.app_context():
+        yield cardbase.app
+
+
+@pytest.fixture
+def user(app):
+    user = cardbase.User(email=f'{os.urandom(6).hex()}@example.com', password=generate_password_hash('password123'))
+    cardbase.db.session.add(user)
+    cardbase.db.session.commit()
+    return user
+
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    response = client.post('/login', data={'email': user.email, 'password': 'password123'})
+    assert response.status_code == 302
+    return client
+
+
+class SiteHandler(http.server.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path in self.server.redirects:
+            self.send_response(302)
+            self.send_header('Location', self.server.redirects[self.path])
+            self.end_headers()
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def web_site(tmp_path, monkeypatch):
+    # Serves tmp_path/site on loopback, which fetches are allowed to reach
+    # for the length of the test.
+    root = tmp_path / 'site'
+    root.mkdir()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(SiteHandler, directory=str(root)))
+    server.requests = []
+    server.redirects = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(cardbase, 'WEB_ALLOWED_NETWORKS', [ipaddress.ip_network('127.0.0.0/8')])
+    monkeypatch.setattr(cardbase, 'WEB_CACHE_DIR', str(tmp_path / 'web_cache'))
+    yield SimpleNamespace(root=root, url=f'http://127.0.0.1:{server.server_port}',
+                          requests=server.requests, redirects=server.redirects)
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,73 @@
+import io
+import json
+import zipfile
+
+from werkzeug.security import generate_password_hash
+
+import app as cardbase
+
+
+def run_jobs():
+    while True:
+        job = cardbase.claim_job('test')
+        if job is None:
+            return
+        cardbase.run_job(job, 'test')
+
+
+def import_terms(client, title, **data):
+    response = client.post('/create_with_text', data=dict(
+        {'import-set_title': title, 'import-set_description': 'Imported', 'import-submit': 'Import Cards'}, **data),
+        content_type='multipart/form-data')
+    assert response.status_code == 302
+    run_jobs()
+    return cardbase.FlashCardSet.query.filter_by(set_title=title).one()
+
+
+def read_jsonl(archive, name):
+    return [json.loads(line) for line in archive.read(name).decode('utf-8').splitlines()]
+
+
+def test_account_export_members(client, user):
+    uploaded = import_terms(client, 'Uploaded', **{'import-file': (io.BytesIO(b'alpha,first\nbeta,second\n'), 'my terms.csv')})
+    pasted = import_terms(client, 'Pasted', **{'import-terms': 'gamma\tthird\n'})
+    entry = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=uploaded.id, term='alpha').one()
+    cardbase.db.session.add(cardbase.FlashCardReview(user_id=user.id, flashcard_set_id=uploaded.id, entry_id=entry.id, grade=4))
+    cardbase.db.session.commit()
+
+    # Someone else's data must stay out of the archive.
+    other = cardbase.User(email=f'other-{user.id}@example.com', password=generate_password_hash('password123'))
+    cardbase.db.session.add(other)
+    cardbase.db.session.commit()
+    cardbase.db.session.add(cardbase.FlashCardSet(user_id=other.id, set_title='Not mine', set_description='Other user'))
+    cardbase.db.session.commit()
+
+    response = client.post('/account/export')
+    job_id = int(response.headers['Location'].rstrip('/').split('/')[-1])
+    run_jobs()
+    response = client.get(f'/account/export/{job_id}')
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        names = set(archive.namelist())
+        profile = json.loads(archive.read('profile.json'))
+        sets = read_jsonl(archive, 'sets.jsonl')
+        entries = read_jsonl(archive, 'entries.jsonl')
+        reviews = read_jsonl(archive, 'reviews.jsonl')
+        sources = {source['flashcard_set_id']: source for source in read_jsonl(archive, 'sources.jsonl')}
+        uploaded_source, pasted_source = sources[uploaded.id], sources[pasted.id]
+        assert archive.read(uploaded_source['files'][0]) == b'alpha,first\nbeta,second\n'
+        assert archive.read(pasted_source['files'][0]) == b'gamma\tthird\n'
+
+    assert profile['email'] == user.email
+    assert {flash_card_set['set_title'] for flash_card_set in sets} == {'Uploaded', 'Pasted'}
+    assert sorted(entry['term'] for entry in entries) == ['alpha', 'beta', 'gamma']
+    assert [(review['entry_id'], review['grade']) for review in reviews] == [(entry.id, 4)]
+    assert uploaded_source['kind'] == 'import_terms'
+    assert uploaded_source['request'] == {'filenames': ['my terms.csv']}
+    assert uploaded_source['files'] == [f"sources/{uploaded_source['id']}/0-my_terms.csv"]
+    assert pasted_source['request'] == {'filenames': ['pasted.txt']}
+    assert uploaded_source['result']['created'] == 2
+    assert names == {'profile.json', 'sets.jsonl', 'entries.jsonl', 'reviews.jsonl', 'sources.jsonl',
+                     *uploaded_source['files'], *pasted_source['files']}
+    # Server-side paths never leak into the archive.
+    assert cardbase.JOB_SOURCE_DIR not in json.dumps(list(sources.values()))
@@ -0,0 +1,50 @@
+import os
+
+import app as cardbase
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture_lines(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.readlines()
+
+
+def test_parse_vtt_joins_lines_and_drops_rolled_repeats():
+    assert list(cardbase.parse_captions(fixture_lines('mitosis.vtt'))) == [
+        (1.0, 4.5, 'Mitosis is the division of one cell into two identical cells.'),
+        (4.5, 7.25, 'Each daughter cell gets a full'),
+        (7.25, 10.0, 'set of chromosomes & organelles.'),
+    ]
+
+
+def test_parse_srt_numbers_tags_and_short_millis():
+    srt = '\ufeff1\n00:00:01,000 --> 00:00:03,000\nHello <i>there</i>.\n\n2\n01:00:02,5 --> 01:00:04,000\nLast line\n'
+    assert list(cardbase.parse_captions(srt.splitlines(True))) == [
+        (1.0, 3.0, 'Hello there.'),
+        (3602.5, 3604.0, 'Last line'),
+    ]
+
+
+def test_sentences_split_across_cues_keep_their_start():
+    sentences = list(cardbase.caption_sentences(cardbase.parse_captions(fixture_lines('mitosis.vtt'))))
+    assert sentences == [
+        (1.0, 'Mitosis is the division of one cell into two identical cells.'),
+        (4.5, 'Each daughter cell gets a full set of chromosomes & organelles.'),
+    ]
+
+
+def test_unpunctuated_captions_are_cut_by_time():
+    cues = [(0, 5, 'so today we look at'), (5, 30, 'how cells divide'), (30, 32, 'and why')]
+    assert list(cardbase.caption_sentences(cues)) == [
+        (0, 'so today we look at how cells divide.'),
+        (30, 'and why'),
+    ]
+
+
+def test_caption_cards_link_back_to_when_they_were_said():
+    cards = list(cardbase.caption_flash_cards(fixture_lines('mitosis.vtt'), video_url='https://www.youtube.com/watch?v=abc&t=9s'))
+    term, definition, source_url, source_start = cards[0]
+    assert (term, definition) == ('Mitosis', 'The division of one cell into two identical cells')
+    assert source_url == 'https://www.youtube.com/watch?v=abc&t=1s'
+    assert source_start == 1.0
@@ -0,0 +1,42 @@
+import gzip
+
+import app as cardbase
+
+
+def test_large_page_is_gzipped(client, monkeypatch):
+    monkeypatch.setattr(cardbase, 'brotli', None)
+    plain = client.get('/flash_card_sets')
+    assert len(plain.data) >= cardbase.COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.vary
+
+    response = client.get('/flash_card_sets', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert 'HX-Request' in response.vary
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert gzip.decompress(response.data) == plain.data
+    assert response.get_etag()[1]
+
+
+def test_small_response_is_left_alone(client, monkeypatch):
+    monkeypatch.setattr(cardbase, 'COMPRESS_MIN_SIZE', 10 ** 6)
+    response = client.get('/flash_card_sets', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_not_modified_is_not_compressed(client):
+    etag = client.get('/flash_card_sets', headers={'Accept-Encoding': 'gzip'}).get_etag()[0]
+    response = client.get('/flash_card_sets', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'W/"{etag}"'})
+    assert response.status_code == 304
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_images_are_not_compressed(client):
+    response = client.get('/static/img/social.jpg', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' not in response.vary
+    response.close()
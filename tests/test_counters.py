@@ -0,0 +1,98 @@
+import datetime
+import time
+
+import app as cardbase
+
+
+def make_set(user, title='Counted'):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title=title, set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    return flash_card_set
+
+
+def counters(flash_card_set):
+    # The triggers write behind the ORM's back, so always read the row again.
+    cardbase.db.session.expire_all()
+    row = cardbase.db.session.get(cardbase.FlashCardSet, flash_card_set.id)
+    return row.card_count, row.due_count, row.next_due_at, row.last_practiced_at
+
+
+def in_days(days):
+    return datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(days=days)
+
+
+def test_triggers_count_cards_and_due_cards(app, user):
+    flash_card_set = make_set(user)
+    assert counters(flash_card_set) == (0, 0, None, None)
+
+    cardbase.import_flash_card_rows(flash_card_set.id, [('new', 'never scheduled'), ('also new', 'never scheduled')])
+    later, soon = in_days(3), in_days(1)
+    cardbase.db.session.add_all([
+        cardbase.FlashCardEntry(flashcard_set_id=flash_card_set.id, term='later', definition='due later', due_at=later),
+        cardbase.FlashCardEntry(flashcard_set_id=flash_card_set.id, term='soon', definition='due soon', due_at=soon),
+        cardbase.FlashCardEntry(flashcard_set_id=flash_card_set.id, term='overdue', definition='was due', due_at=in_days(-1)),
+    ])
+    cardbase.db.session.commit()
+    assert counters(flash_card_set) == (5, 3, soon, None)
+
+    # Rescheduling moves cards in and out of the due count.
+    entry = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id, term='new').one()
+    entry.due_at = in_days(2)
+    cardbase.db.session.commit()
+    assert counters(flash_card_set)[:2] == (5, 2)
+    entry = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id, term='later').one()
+    entry.due_at = in_days(-2)
+    cardbase.db.session.commit()
+    assert counters(flash_card_set)[:2] == (5, 3)
+
+    # Bulk deletes skip the ORM but not the triggers.
+    cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id, term='overdue').delete()
+    cardbase.db.session.delete(cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id, term='soon').one())
+    cardbase.db.session.commit()
+    assert counters(flash_card_set)[:2] == (3, 2)
+
+
+def test_reviews_move_last_practiced_forward_only(app, user):
+    flash_card_set = make_set(user)
+    cardbase.import_flash_card_rows(flash_card_set.id, [('term', 'definition')])
+    entry = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).one()
+    recent, older = in_days(-1), in_days(-5)
+    for reviewed_at in (recent, older):
+        cardbase.db.session.add(cardbase.FlashCardReview(user_id=user.id, flashcard_set_id=flash_card_set.id,
+                                                         entry_id=entry.id, grade=3, reviewed_at=reviewed_at))
+        cardbase.db.session.commit()
+    assert counters(flash_card_set)[3] == recent
+
+
+def test_repair_recounts_drifted_sets(app, user):
+    drifted, untouched = make_set(user, 'Drifted'), make_set(user, 'Untouched')
+    cardbase.import_flash_card_rows(drifted.id, [('a', 'one'), ('b', 'two')])
+    cardbase.import_flash_card_rows(untouched.id, [('c', 'three')])
+    cardbase.db.session.execute(cardbase.db.update(cardbase.FlashCardSet.__table__).values(card_count=40, due_count=7))
+    cardbase.db.session.commit()
+    modified = cardbase.db.session.get(cardbase.FlashCardSet, drifted.id).set_modified_date
+
+    assert cardbase.repair_set_counters([drifted.id]) == 1
+    assert counters(drifted) == (2, 2, None, None)
+    assert counters(untouched)[:2] == (40, 7)
+    # Repairing is not an edit.
+    assert cardbase.db.session.get(cardbase.FlashCardSet, drifted.id).set_modified_date == modified
+
+    result = cardbase.app.test_cli_runner().invoke(args=['repair-counters'])
+    assert 'Repaired counters on' in result.output
+    assert counters(untouched)[:2] == (1, 1)
+
+
+def test_sets_are_recounted_once_their_next_card_falls_due(app, user):
+    flash_card_set = make_set(user)
+    due_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    cardbase.db.session.add(cardbase.FlashCardEntry(flashcard_set_id=flash_card_set.id, term='soon', definition='due soon', due_at=due_at))
+    cardbase.db.session.commit()
+    assert counters(flash_card_set)[:2] == (1, 0)
+
+    cardbase.refresh_due_counts(user.id)
+    assert counters(flash_card_set)[:2] == (1, 0)
+    time.sleep(1.1)
+    cardbase.refresh_due_counts(user.id)
+    assert counters(flash_card_set)[:3] == (1, 1, None)
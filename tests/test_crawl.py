@@ -0,0 +1,59 @@
+import app as cardbase
+
+PARAGRAPH = '<p>{} is described here in a sentence that is long enough to count as content.</p>'
+
+
+def page(title, *links):
+    anchors = ''.join(f'<li><a href="{link}">{link}</a></li>' for link in links)
+    return f'<html><head><title>{title}</title></head><body><main>{PARAGRAPH.format(title)}<ul>{anchors}</ul></main></body></html>'
+
+
+def build_site(root):
+    (root / 'index.html').write_text(page('Index', 'a.html', 'b.html', 'private/hidden.html'))
+    (root / 'a.html').write_text(page('A', 'deep.html'))
+    (root / 'b.html').write_text(page('B'))
+    (root / 'deep.html').write_text(page('Deep'))
+    (root / 'private').mkdir()
+    (root / 'private' / 'hidden.html').write_text(page('Hidden'))
+    (root / 'robots.txt').write_text('User-agent: *\nDisallow: /private/\n')
+
+
+def crawl(web_site, **limits):
+    limits.setdefault('host_delay', 0)
+    return [title for url, title, text in cardbase.crawl_site(web_site.url + '/index.html', **limits)]
+
+
+def test_crawl_stops_at_max_depth(web_site):
+    build_site(web_site.root)
+    assert sorted(crawl(web_site, max_depth=1)) == ['A', 'B', 'Index']
+    assert sorted(crawl(web_site, max_depth=2)) == ['A', 'B', 'Deep', 'Index']
+
+
+def test_crawl_stops_at_max_pages(web_site):
+    build_site(web_site.root)
+    assert len(crawl(web_site, max_pages=2, max_depth=2)) == 2
+
+
+def test_crawl_stops_at_max_bytes(web_site):
+    build_site(web_site.root)
+    assert crawl(web_site, max_bytes=1, max_depth=2, workers=1) == ['Index']
+
+
+def test_crawl_honours_robots_txt(web_site):
+    build_site(web_site.root)
+    assert 'Hidden' not in crawl(web_site, max_depth=2)
+    assert '/robots.txt' in web_site.requests
+    assert '/private/hidden.html' not in web_site.requests
+
+
+def test_crawl_refuses_non_public_start_url(web_site, monkeypatch):
+    build_site(web_site.root)
+    monkeypatch.setattr(cardbase, 'WEB_ALLOWED_NETWORKS', [])
+    assert crawl(web_site) == []
+    assert web_site.requests == []
+
+
+def test_crawl_skips_redirects_to_non_public_addresses(web_site):
+    build_site(web_site.root)
+    web_site.redirects['/b.html'] = 'http://169.254.169.254/latest/meta-data/'
+    assert sorted(crawl(web_site)) == ['A', 'Index']
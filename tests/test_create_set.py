@@ -0,0 +1,31 @@
+import pytest
+
+import app as cardbase
+
+HTMX = {'HX-Request': 'true'}
+
+
+def user_sets(user):
+    return cardbase.FlashCardSet.query.filter_by(user_id=user.id).all()
+
+
+@pytest.mark.parametrize('headers', [{}, HTMX])
+@pytest.mark.parametrize('title', ['', '   ', 'x' * 256])
+def test_create_set_rejects_bad_titles(client, user, headers, title):
+    response = client.post('/create_set', data={'set_title': title, 'set_description': 'Notes'}, headers=headers)
+    assert response.status_code == 200
+    assert b'at most 255 characters' in response.data
+    assert user_sets(user) == []
+
+
+def test_create_set_from_full_page(client, user):
+    response = client.post('/create_set', data={'set_title': ' Biology ', 'set_description': 'Cells'})
+    assert response.status_code == 302
+    assert [(flash_card_set.set_title, flash_card_set.set_description) for flash_card_set in user_sets(user)] == [('Biology', 'Cells')]
+
+
+def test_create_set_with_htmx_returns_the_row(client, user):
+    response = client.post('/create_set', data={'set_title': 'x' * 255, 'set_description': 'Cells'}, headers=HTMX)
+    assert response.status_code == 200
+    flash_card_set, = user_sets(user)
+    assert f'flash-card-set-{flash_card_set.id}'.encode() in response.data
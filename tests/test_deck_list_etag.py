@@ -0,0 +1,47 @@
+import app as cardbase
+
+
+def test_matching_etag_gets_not_modified(client, user):
+    cardbase.db.session.add(cardbase.FlashCardSet(user_id=user.id, set_title='Biology', set_description='Cells'))
+    cardbase.db.session.commit()
+
+    response = client.get('/flash_card_sets')
+    assert response.status_code == 200
+    assert b'Biology' in response.data
+    etag, weak = response.get_etag()
+    assert etag and weak
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert 'HX-Request' in response.vary
+
+    response = client.get('/flash_card_sets', headers={'If-None-Match': f'W/"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.get_etag() == (etag, True)
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert 'HX-Request' in response.vary
+
+
+def test_changed_deck_list_gets_new_etag(client, user):
+    etag = client.get('/flash_card_sets').get_etag()[0]
+    cardbase.db.session.add(cardbase.FlashCardSet(user_id=user.id, set_title='Chemistry', set_description='Atoms'))
+    cardbase.db.session.commit()
+
+    response = client.get('/flash_card_sets', headers={'If-None-Match': f'W/"{etag}"'})
+    assert response.status_code == 200
+    assert b'Chemistry' in response.data
+    assert response.get_etag()[0] != etag
+
+
+def test_htmx_request_gets_its_own_etag(client):
+    page = client.get('/flash_card_sets').get_etag()[0]
+    response = client.get('/flash_card_sets', headers={'HX-Request': 'true', 'If-None-Match': f'W/"{page}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != page
+
+
+def test_due_counts_refresh_once_per_request(client, monkeypatch):
+    calls = []
+    refresh = cardbase.refresh_due_counts
+    monkeypatch.setattr(cardbase, 'refresh_due_counts', lambda user_id: calls.append(user_id) or refresh(user_id))
+    assert client.get('/flash_card_sets').status_code == 200
+    assert len(calls) == 1
@@ -0,0 +1,72 @@
+import pytest
+
+import app as cardbase
+
+ORIGINAL = ('Mitochondria', 'the powerhouse of the cell that makes ATP from glucose and oxygen')
+EDITED = ('Mitochondria', 'the powerhouse of a cell that makes ATP from glucose and oxygen')
+UNRELATED = ('Ribosome', 'the site of protein synthesis in the cell')
+
+
+def signature(card):
+    return cardbase.minhash_signature(cardbase.card_shingles(*card))
+
+
+def make_set(user, cards):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Biology', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    cardbase.import_flash_card_rows(flash_card_set.id, cards)
+    return flash_card_set
+
+
+@pytest.fixture
+def similarity():
+    first, second = signature(ORIGINAL), signature(EDITED)
+    # The pair must share an LSH band to be compared at all.
+    assert set(cardbase.lsh_band_hashes(first)) & set(cardbase.lsh_band_hashes(second))
+    return cardbase.minhash_similarity(first, second)
+
+
+def test_pair_at_the_threshold_is_recorded(app, user, monkeypatch, similarity):
+    monkeypatch.setattr(cardbase, 'DEDUP_THRESHOLD', similarity)
+    make_set(user, [ORIGINAL, UNRELATED, EDITED])
+    assert cardbase.dedup_cards(user.id) == (3, 1)
+    pair, = cardbase.CardDuplicate.query.filter_by(user_id=user.id).all()
+    assert pair.entry_id < pair.duplicate_id
+    assert pair.similarity == similarity
+
+
+def test_pair_just_below_the_threshold_is_not(app, user, monkeypatch, similarity):
+    monkeypatch.setattr(cardbase, 'DEDUP_THRESHOLD', similarity + 1 / cardbase.MINHASH_PERMUTATIONS)
+    make_set(user, [ORIGINAL, UNRELATED, EDITED])
+    assert cardbase.dedup_cards(user.id) == (3, 0)
+    assert cardbase.CardDuplicate.query.filter_by(user_id=user.id).count() == 0
+    # Every card is still indexed, so the next sweep has nothing to do.
+    assert cardbase.dedup_cards(user.id) == (0, 0)
+
+
+def test_pairs_span_batches_and_sweeps(app, user):
+    flash_card_set = make_set(user, [ORIGINAL, UNRELATED])
+    assert cardbase.dedup_cards(user.id, batch_size=1) == (2, 0)
+    cardbase.import_flash_card_rows(flash_card_set.id, [EDITED])
+    assert cardbase.dedup_cards(user.id, batch_size=1) == (1, 1)
+
+
+def test_editing_a_card_drops_its_pairs(app, user):
+    make_set(user, [ORIGINAL, EDITED])
+    assert cardbase.dedup_cards(user.id) == (2, 1)
+    entry = cardbase.FlashCardEntry.query.filter_by(definition=EDITED[1]).order_by(cardbase.FlashCardEntry.id.desc()).first()
+    entry.term, entry.definition = UNRELATED
+    cardbase.db.session.commit()
+    assert cardbase.CardDuplicate.query.filter_by(user_id=user.id).count() == 0
+    assert cardbase.dedup_cards(user.id) == (1, 0)
+
+
+def test_other_users_cards_are_never_paired(app, user):
+    other = cardbase.User(email=f'other-{user.id}@example.com', password='x')
+    cardbase.db.session.add(other)
+    cardbase.db.session.commit()
+    make_set(user, [ORIGINAL])
+    make_set(other, [ORIGINAL])
+    assert cardbase.dedup_cards(user.id) == (1, 0)
+    assert cardbase.dedup_cards(other.id) == (1, 0)
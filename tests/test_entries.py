@@ -0,0 +1,23 @@
+import app as cardbase
+
+
+def test_save_entries_rejects_blank_fields_and_truncates(client, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Editor', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    url = f'/api/flash_card_sets/{flash_card_set.id}/entries'
+
+    result = client.post(url, json={'changes': [
+        {'key': 'ok', 'term': '  alpha  ', 'definition': 'x' * 300},
+        {'key': 'blank', 'term': 'beta', 'definition': '   '},
+        {'key': 'missing', 'term': 'gamma'},
+    ]}).get_json()
+    assert result['rejected'] == [1, 2]
+    entry = cardbase.db.session.get(cardbase.FlashCardEntry, result['created']['ok'])
+    assert entry.term == 'alpha'
+    assert len(entry.definition) == cardbase.MAX_FIELD_LENGTH
+
+    result = client.post(url, json={'changes': [{'id': entry.id, 'term': ''}]}).get_json()
+    assert result == {'created': {}, 'updated': 0, 'deleted': 0, 'rejected': [0]}
+    cardbase.db.session.refresh(entry)
+    assert entry.term == 'alpha'
@@ -0,0 +1,45 @@
+import zipfile
+
+import app as cardbase
+
+
+def run_jobs():
+    while True:
+        job = cardbase.claim_job('test')
+        if job is None:
+            return
+        cardbase.run_job(job, 'test')
+
+
+def test_anki_export_is_built_by_a_job(client, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Anki', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    client.post(f'/api/flash_card_sets/{flash_card_set.id}/entries', json={'changes': [
+        {'key': 'a', 'term': 'alpha', 'definition': 'first'},
+    ]})
+    url = f'/flash_card_sets/{flash_card_set.id}/export.apkg'
+
+    response = client.get(url)
+    assert response.status_code == 302
+    job_url = response.headers['Location']
+    assert client.get(url).headers['Location'] == job_url
+    assert url.encode() in client.get(job_url).data
+
+    run_jobs()
+    response = client.get(url, headers={'Range': 'bytes=0-1'})
+    assert response.status_code == 206
+    assert response.data == b'PK'
+    response = client.get(url)
+    assert response.status_code == 200
+    with zipfile.ZipFile(cardbase.io.BytesIO(response.data)) as package:
+        assert 'collection.anki2' in package.namelist()
+
+
+def test_csv_range_request_streams_until_the_file_exists(client, user):
+    response = client.get('/flash_card_sets/export.csv', headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 200
+    body = response.get_data()
+    response = client.get('/flash_card_sets/export.csv', headers={'Range': 'bytes=0-3'})
+    assert response.status_code == 206
+    assert response.data == body[:4]
@@ -0,0 +1,33 @@
+import app as cardbase
+
+
+def test_entry_commit_invalidates_owner_fragments(app, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Cached', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    cardbase.fragment_cache.set((user.id, 'deck-table'), 'stale')
+    cardbase.fragment_cache.set(('layout', 'nav'), 'shared')
+    assert user.id not in cardbase.prefix_indexes
+
+    cardbase.db.session.add(cardbase.FlashCardEntry(flashcard_set_id=flash_card_set.id, term='alpha', definition='first'))
+    cardbase.db.session.commit()
+    assert cardbase.fragment_cache.get((user.id, 'deck-table')) is None
+    assert cardbase.fragment_cache.get(('layout', 'nav')) == 'shared'
+
+
+def test_rollback_keeps_fragments(app, user):
+    cardbase.fragment_cache.set((user.id, 'deck-table'), 'fresh')
+    cardbase.db.session.add(cardbase.FlashCardSet(user_id=user.id, set_title='Rolled back', set_description='Test set'))
+    cardbase.db.session.flush()
+    cardbase.db.session.rollback()
+    assert cardbase.fragment_cache.get((user.id, 'deck-table')) == 'fresh'
+
+
+def test_layout_fragments_are_kept_per_login_state(app, client):
+    cardbase.fragment_cache.invalidate('layout')
+    with app.app_context(), app.test_request_context('/'):
+        assert 'Sign up' in cardbase.render_template('app_layout.html')
+    assert client.get('/home').status_code == 200
+    keys = {key[1:] for key in cardbase.fragment_cache.entries if key[0] == 'layout'}
+    assert {('app_layout.html', 1, False), ('app_layout.html', 1, True)} <= keys
+    assert ('app_layout.html', 1) not in keys
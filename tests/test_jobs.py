@@ -0,0 +1,142 @@
+import datetime
+
+import pytest
+
+import app as cardbase
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    # Jobs left behind by other tests would otherwise be claimed first.
+    cardbase.Job.query.delete()
+    cardbase.db.session.commit()
+    calls = []
+
+    def flaky(context):
+        calls.append(context.job.attempts)
+        if context.payload.get('fail') == 'permanent':
+            raise cardbase.JobFailed("Bad input.")
+        if context.payload.get('fail'):
+            raise RuntimeError("Temporary outage.")
+        return {'created': 3}
+
+    monkeypatch.setitem(cardbase.JOB_HANDLERS, 'flaky', flaky)
+    return calls
+
+
+def fetch(job_id):
+    cardbase.db.session.expire_all()
+    return cardbase.db.session.get(cardbase.Job, job_id)
+
+
+def make_runnable(job_id):
+    cardbase.db.session.execute(cardbase.db.update(cardbase.Job).where(cardbase.Job.id == job_id).values(
+        run_after=datetime.datetime.utcnow() - datetime.timedelta(seconds=1)))
+    cardbase.db.session.commit()
+
+
+def expire_lease(job_id):
+    cardbase.db.session.execute(cardbase.db.update(cardbase.Job).where(cardbase.Job.id == job_id).values(
+        leased_until=datetime.datetime.utcnow() - datetime.timedelta(seconds=1)))
+    cardbase.db.session.commit()
+
+
+def test_claims_by_priority_then_age(queue):
+    low = cardbase.enqueue_job('flaky', {})
+    high = cardbase.enqueue_job('flaky', {}, priority=5)
+    assert cardbase.claim_job('a').id == high.id
+    assert cardbase.claim_job('a').id == low.id
+    assert cardbase.claim_job('a') is None
+
+
+def test_expired_lease_is_taken_over(queue):
+    job = cardbase.enqueue_job('flaky', {})
+    claimed = cardbase.claim_job('a', lease_seconds=60)
+    assert (claimed.status, claimed.leased_by, claimed.attempts) == ('running', 'a', 1)
+    assert cardbase.claim_job('b') is None
+
+    expire_lease(job.id)
+    taken = cardbase.claim_job('b')
+    assert (taken.id, taken.leased_by, taken.attempts) == (job.id, 'b', 2)
+
+    # The first worker has lost the lease, so its progress and result are dropped.
+    context = cardbase.JobContext(fetch(job.id), 'a')
+    with pytest.raises(cardbase.JobLeaseLost):
+        context.progress(1, force=True)
+    cardbase.run_job(fetch(job.id), 'a')
+    assert (fetch(job.id).status, fetch(job.id).leased_by) == ('running', 'b')
+
+    cardbase.run_job(taken, 'b')
+    job = fetch(job.id)
+    assert (job.status, job.progress, job.leased_by, job.leased_until) == ('done', 3, None, None)
+
+
+def test_lease_expiring_past_max_attempts_fails_the_job(queue):
+    job = cardbase.enqueue_job('flaky', {}, max_attempts=1)
+    cardbase.claim_job('a')
+    expire_lease(job.id)
+    assert cardbase.claim_job('b') is None
+    job = fetch(job.id)
+    assert (job.status, job.attempts, job.error) == ('failed', 2, "The job's lease expired too many times.")
+
+
+def test_failures_retry_with_exponential_backoff(queue):
+    job = cardbase.enqueue_job('flaky', {'fail': 'temporary'}, max_attempts=3)
+    delays = []
+    for attempt in range(3):
+        make_runnable(job.id)
+        before = datetime.datetime.utcnow()
+        cardbase.run_job(cardbase.claim_job('a'), 'a')
+        job = fetch(job.id)
+        if job.status == 'queued':
+            delays.append(round((job.run_after - before).total_seconds()))
+    assert queue == [1, 2, 3]
+    assert delays == [cardbase.JOB_RETRY_DELAY, cardbase.JOB_RETRY_DELAY * 2]
+    assert (job.status, job.error, job.leased_by) == ('failed', 'Temporary outage.', None)
+
+
+def test_job_failed_is_not_retried_and_cleans_up(queue, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Empty', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    set_id = flash_card_set.id
+    path = cardbase.save_job_text('term\tdefinition\n')
+    job = cardbase.enqueue_job('flaky', {'fail': 'permanent', 'paths': [path]}, user_id=user.id, flashcard_set_id=set_id)
+    cardbase.run_job(cardbase.claim_job('a'), 'a')
+    job = fetch(job.id)
+    assert (job.status, job.attempts, job.error) == ('failed', 1, 'Bad input.')
+    assert not cardbase.os.path.exists(path)
+    assert cardbase.db.session.get(cardbase.FlashCardSet, set_id) is None
+
+
+def test_retried_import_restarts_its_set(queue, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Retried', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    path = cardbase.save_job_text('alpha\tfirst\nbeta\tsecond\n')
+    job = cardbase.enqueue_job('import_terms', {'paths': [path]}, user_id=user.id, flashcard_set_id=flash_card_set.id)
+
+    # The first worker dies after writing part of the file.
+    cardbase.claim_job('a')
+    cardbase.import_flash_card_rows(flash_card_set.id, [('alpha', 'first')])
+    expire_lease(job.id)
+
+    cardbase.run_job(cardbase.claim_job('b'), 'b')
+    job = fetch(job.id)
+    assert (job.status, job.attempts, job.progress) == ('done', 2, 2)
+    entries = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).order_by(cardbase.FlashCardEntry.id)
+    assert [(entry.term, entry.definition) for entry in entries] == [('alpha', 'first'), ('beta', 'second')]
+    assert not cardbase.os.path.exists(path)
+
+
+def test_first_attempt_keeps_existing_cards(queue, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Appended', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    cardbase.import_flash_card_rows(flash_card_set.id, [('kept', 'already here')])
+    job = cardbase.enqueue_job('import_terms', {'paths': [cardbase.save_job_text('new\tcard\n')]},
+                               user_id=user.id, flashcard_set_id=flash_card_set.id)
+    context = cardbase.JobContext(cardbase.claim_job('a'), 'a')
+    cardbase.restart_job_set(context)
+    assert cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).count() == 1
+    assert fetch(job.id).attempts == 1
@@ -0,0 +1,77 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tables as the first release created them: dates were DATE columns with
+# no server default and there were no counters, triggers or indexes.
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, username VARCHAR(20), first_name VARCHAR(20), last_name VARCHAR(20),
+    password VARCHAR(20) NOT NULL, email VARCHAR(100) NOT NULL, PRIMARY KEY (id), UNIQUE (username)
+);
+CREATE TABLE flash_card_set (
+    id INTEGER NOT NULL, user_id INTEGER NOT NULL, set_title VARCHAR(255) NOT NULL,
+    set_description VARCHAR(255) NOT NULL, set_creation_date DATE NOT NULL, set_modified_date DATE NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE flash_card_entry (
+    id INTEGER NOT NULL, term VARCHAR(255) NOT NULL, definition VARCHAR(255) NOT NULL,
+    flashcard_set_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(flashcard_set_id) REFERENCES flash_card_set (id)
+);
+INSERT INTO user (id, password, email) VALUES (1, 'x', 'old@example.com');
+INSERT INTO flash_card_set VALUES (2, 1, 'MIT 6.042', 'Algorithms with Mathematics', '2024-07-23', '2024-07-23');
+INSERT INTO flash_card_entry VALUES (1, 'Graph', 'Vertices joined by edges', 2);
+INSERT INTO flash_card_entry VALUES (2, 'Tree', 'A connected acyclic graph', 2);
+"""
+
+# Runs in a fresh interpreter, because importing the app is what upgrades
+# the database it points at.
+CHECK = """
+import json
+import app as cardbase
+with cardbase.app.app_context():
+    old = cardbase.db.session.get(cardbase.FlashCardSet, 2)
+    new = cardbase.FlashCardSet(user_id=1, set_title='New', set_description='Created after the upgrade')
+    cardbase.db.session.add(new)
+    cardbase.db.session.commit()
+    print(json.dumps({'old': [str(old.set_creation_date), str(old.set_modified_date), old.card_count],
+                      'new': [str(new.set_creation_date), str(new.set_modified_date)]}))
+"""
+
+
+def upgrade(path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', OPENAI_API_KEY='test')
+    output = subprocess.run([sys.executable, '-c', CHECK], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def test_baseline_database_is_upgraded(tmp_path):
+    path = tmp_path / 'baseline.db'
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+
+    checked = upgrade(path)
+    assert checked['old'] == ['2024-07-23 00:00:00', '2024-07-23 00:00:00', 2]
+    created, modified = checked['new']
+    assert created == modified and len(created) == 19
+
+    with sqlite3.connect(path) as connection:
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'ix_flash_card_set_user_modified', 'ix_flash_card_set_set_creation_date'} <= indexes
+        # Rows written behind the ORM, without the columns, still get stamped.
+        connection.execute("INSERT INTO flash_card_set (user_id, set_title, set_description) VALUES (1, 'Raw', 'SQL')")
+        raw_created, = connection.execute("SELECT set_creation_date FROM flash_card_set WHERE set_title = 'Raw'").fetchone()
+        assert raw_created is not None and len(raw_created) == 19
+
+        # Adding a card counts as modifying its set.
+        connection.execute("INSERT INTO flash_card_entry (term, definition, flashcard_set_id) VALUES ('Path', 'A walk', 2)")
+        modified, count = connection.execute("SELECT set_modified_date, card_count FROM flash_card_set WHERE id = 2").fetchone()
+        assert modified > '2024-07-23 00:00:00'
+        assert count == 3
+
+    # Upgrading an already upgraded database changes nothing.
+    assert upgrade(path)['old'][2] == 3
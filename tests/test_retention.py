@@ -0,0 +1,141 @@
+import datetime
+import os
+import time
+
+import pytest
+
+import app as cardbase
+
+
+def run_jobs():
+    while True:
+        job = cardbase.claim_job('test')
+        if job is None:
+            return
+        cardbase.run_job(job, 'test')
+
+
+def fill_account(user, sets=2, cards=3):
+    for number in range(sets):
+        flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title=f'Deck {number}', set_description='Test set')
+        cardbase.db.session.add(flash_card_set)
+        cardbase.db.session.commit()
+        cardbase.import_flash_card_rows(flash_card_set.id, [(f'term {n}', f'definition {n}') for n in range(cards)])
+        entry = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).first()
+        cardbase.db.session.add(cardbase.FlashCardReview(user_id=user.id, flashcard_set_id=flash_card_set.id,
+                                                         entry_id=entry.id, grade=3))
+    cardbase.db.session.commit()
+    cardbase.dedup_cards(user.id)
+
+
+def remaining(user_id):
+    owned_sets = cardbase.db.select(cardbase.FlashCardSet.id).where(cardbase.FlashCardSet.user_id == user_id)
+    return {
+        'reviews': cardbase.FlashCardReview.query.filter_by(user_id=user_id).count(),
+        'buckets': cardbase.CardLshBucket.query.filter_by(user_id=user_id).count(),
+        'entries': cardbase.FlashCardEntry.query.filter(cardbase.FlashCardEntry.flashcard_set_id.in_(owned_sets)).count(),
+        'sets': cardbase.FlashCardSet.query.filter_by(user_id=user_id).count(),
+        'change_log': cardbase.ChangeLog.query.filter_by(user_id=user_id).count(),
+        'users': cardbase.User.query.filter_by(id=user_id).count(),
+    }
+
+
+def make_old(model, column, condition, days):
+    cardbase.db.session.execute(cardbase.db.update(model).where(condition).values(
+        {column: datetime.datetime.utcnow() - datetime.timedelta(days=days)}))
+    cardbase.db.session.commit()
+
+
+def test_interrupted_purge_is_finished_by_the_job(client, user):
+    fill_account(user)
+    user_id = user.id
+    os.makedirs(cardbase.EXPORT_DIR)
+    export_path = os.path.join(cardbase.EXPORT_DIR, f'account-{user_id}-1.zip')
+    open(export_path, 'wb').close()
+    os.makedirs(cardbase.JOB_SOURCE_DIR)
+    source_path = os.path.join(cardbase.JOB_SOURCE_DIR, f'{user_id}-1-0.csv')
+    open(source_path, 'wb').close()
+
+    client.post('/account/delete', data={'password': 'password123'})
+    assert cardbase.db.session.get(cardbase.User, user_id).deactivated_at is not None
+
+    # The first worker dies after a few batches.
+    def crash(count):
+        if count >= 3:
+            raise RuntimeError("worker killed")
+
+    with pytest.raises(RuntimeError):
+        cardbase.purge_user(user_id, batch_size=1, pause=0, progress=crash)
+    cardbase.db.session.rollback()
+    partial = remaining(user_id)
+    assert partial['users'] == 1 and partial['entries'] == 6 and partial['reviews'] == 0
+
+    run_jobs()
+    assert remaining(user_id) == {'reviews': 0, 'buckets': 0, 'entries': 0, 'sets': 0, 'change_log': 0, 'users': 0}
+    assert cardbase.CardDuplicate.query.filter_by(user_id=user_id).count() == 0
+    assert not os.path.exists(export_path) and not os.path.exists(source_path)
+    purge, = cardbase.Job.query.filter_by(user_id=user_id).all()
+    assert (purge.kind, purge.status) == ('purge_account', 'done')
+    cardbase.db.session.execute(cardbase.db.text(
+        "INSERT INTO flash_card_entry_fts(flash_card_entry_fts, rank) VALUES ('integrity-check', 1)"))
+
+
+def test_active_accounts_are_never_purged(app, user):
+    fill_account(user, sets=1)
+    job = cardbase.enqueue_job('purge_account', {}, user_id=user.id)
+    cardbase.run_job(cardbase.claim_job('test'), 'test')
+    cardbase.db.session.expire_all()
+    assert (cardbase.db.session.get(cardbase.Job, job.id).status, remaining(user.id)['entries']) == ('failed', 3)
+
+
+def test_swept_tombstones_raise_the_sync_floor(client, user):
+    fill_account(user, sets=2, cards=2)
+    old_token = client.get('/api/sync').get_json()['token']
+    doomed = cardbase.FlashCardSet.query.filter_by(user_id=user.id, set_title='Deck 0').one()
+    client.post(f'/delete_flash_card_set/{doomed.id}')
+    make_old(cardbase.ChangeLog, 'created_at', cardbase.ChangeLog.user_id == user.id, days=cardbase.TOMBSTONE_RETENTION_DAYS + 1)
+
+    swept = cardbase.retention_sweep(pause=0)
+    assert swept['tombstones'] >= 3
+    assert cardbase.ChangeLog.query.filter_by(user_id=user.id, op='delete').count() == 0
+    floor = cardbase.db.session.get(cardbase.User, user.id).sync_floor
+    assert floor > int(old_token)
+
+    # A client that synced before the sweep may have missed the deletes, so it starts over...
+    first = client.get('/api/sync', query_string={'since': old_token, 'limit': 2}).get_json()
+    assert first['reset'] and first['more']
+    assert first['token'].endswith(f'.{floor}')
+    # ...and keeps paging with the floor its token carries instead of resetting again.
+    rest = client.get('/api/sync', query_string={'since': first['token']}).get_json()
+    assert not rest['reset'] and not rest['more']
+    synced = {flash_card_set['set_title'] for flash_card_set in first['sets'] + rest['sets']}
+    assert synced == {'Deck 1'}
+    assert client.get('/api/sync', query_string={'since': rest['token']}).get_json()['reset'] is False
+
+
+def test_retention_sweep_removes_only_expired_rows(app, user):
+    fill_account(user, sets=1, cards=2)
+    flash_card_set = cardbase.FlashCardSet.query.filter_by(user_id=user.id).one()
+    entry = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).first()
+    cardbase.db.session.add(cardbase.FlashCardReview(user_id=user.id, flashcard_set_id=flash_card_set.id, entry_id=entry.id, grade=5))
+    cardbase.db.session.commit()
+    make_old(cardbase.FlashCardReview, 'reviewed_at',
+             cardbase.db.and_(cardbase.FlashCardReview.user_id == user.id, cardbase.FlashCardReview.grade == 3),
+             days=cardbase.REVIEW_RETENTION_DAYS + 1)
+    # Old upserts are the current state of a card, not tombstones.
+    make_old(cardbase.ChangeLog, 'created_at', cardbase.ChangeLog.user_id == user.id, days=cardbase.TOMBSTONE_RETENTION_DAYS + 1)
+    os.makedirs(cardbase.EXPORT_DIR)
+    stale, fresh = (os.path.join(cardbase.EXPORT_DIR, name) for name in ('stale.csv', 'fresh.csv'))
+    for path in (stale, fresh):
+        open(path, 'wb').close()
+    day_ago = time.time() - cardbase.EXPORT_RETENTION_HOURS * 3600 - 60
+    os.utime(stale, (day_ago, day_ago))
+
+    result = cardbase.app.test_cli_runner().invoke(args=['sweep', '--pause', '0'])
+    assert result.exit_code == 0
+    assert [review.grade for review in cardbase.FlashCardReview.query.filter_by(user_id=user.id)] == [5]
+    assert cardbase.ChangeLog.query.filter_by(user_id=user.id).count() == 3
+    assert cardbase.db.session.get(cardbase.User, user.id).sync_floor == 0
+    assert not os.path.exists(stale) and os.path.exists(fresh)
+    cardbase.db.session.expire_all()
+    assert cardbase.db.session.get(cardbase.FlashCardSet, flash_card_set.id).last_practiced_at is not None
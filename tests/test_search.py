@@ -0,0 +1,103 @@
+import os
+
+import app as cardbase
+from werkzeug.security import generate_password_hash
+
+
+def make_user():
+    user = cardbase.User(email=f'{os.urandom(6).hex()}@example.com', password=generate_password_hash('password123'))
+    cardbase.db.session.add(user)
+    cardbase.db.session.commit()
+    return user
+
+
+def make_set(user, title, description='Test set'):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title=title, set_description=description)
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    return flash_card_set
+
+
+def fts_rowids(table, match):
+    return sorted(cardbase.db.session.execute(
+        cardbase.db.text(f"SELECT rowid FROM {table} WHERE {table} MATCH :match"), {'match': match}).scalars())
+
+
+def check_integrity():
+    # Fails if the FTS index and its external content views disagree.
+    for table in ('flash_card_entry_fts', 'flash_card_set_fts'):
+        cardbase.db.session.execute(cardbase.db.text(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)"))
+
+
+def entry_ids(results):
+    return [entry['id'] for entry in results['entries']]
+
+
+def test_triggers_follow_inserts_updates_and_deletes(app, user):
+    flash_card_set = make_set(user, 'Zoology')
+    entry = cardbase.FlashCardEntry(flashcard_set_id=flash_card_set.id, term='Axolotl', definition='A salamander that keeps its gills')
+    cardbase.db.session.add(entry)
+    cardbase.db.session.commit()
+    # Bulk inserts skip the ORM but not the triggers.
+    cardbase.import_flash_card_rows(flash_card_set.id, [('Okapi', 'A forest giraffe')])
+    okapi = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id, term='Okapi').one()
+    assert fts_rowids('flash_card_entry_fts', 'axolotl') == [entry.id]
+    assert fts_rowids('flash_card_entry_fts', 'giraffe') == [okapi.id]
+    check_integrity()
+
+    entry.term = 'Olm'
+    entry.definition = 'A blind cave salamander'
+    cardbase.db.session.commit()
+    assert fts_rowids('flash_card_entry_fts', 'axolotl') == []
+    assert fts_rowids('flash_card_entry_fts', 'olm AND cave') == [entry.id]
+    check_integrity()
+
+    cardbase.db.session.delete(entry)
+    cardbase.db.session.commit()
+    assert fts_rowids('flash_card_entry_fts', 'olm') == []
+    check_integrity()
+
+    flash_card_set.set_title = 'Mammals'
+    cardbase.db.session.commit()
+    assert fts_rowids('flash_card_set_fts', 'zoology') == []
+    assert flash_card_set.id in fts_rowids('flash_card_set_fts', 'mammals')
+
+    cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).delete()
+    cardbase.db.session.delete(flash_card_set)
+    cardbase.db.session.commit()
+    assert fts_rowids('flash_card_entry_fts', 'okapi') == []
+    assert flash_card_set.id not in fts_rowids('flash_card_set_fts', 'mammals')
+    check_integrity()
+
+
+def test_results_are_scoped_to_their_owner(app, user):
+    other = make_user()
+    mine = make_set(user, 'Photosynthesis basics', 'Light reactions')
+    theirs = make_set(other, 'Photosynthesis advanced', 'Calvin cycle')
+    cardbase.import_flash_card_rows(mine.id, [('Chlorophyll', 'Green pigment that absorbs light')])
+    cardbase.import_flash_card_rows(theirs.id, [('Chlorophyll b', 'Accessory pigment that absorbs light')])
+
+    results = cardbase.search_flash_cards(user.id, 'chloro light')
+    assert [entry['flashcard_set_id'] for entry in results['entries']] == [mine.id]
+    assert [result['id'] for result in results['sets']] == []
+    assert [result['id'] for result in cardbase.search_flash_cards(user.id, 'photo')['sets']] == [mine.id]
+    assert [result['id'] for result in cardbase.search_flash_cards(other.id, 'photo')['sets']] == [theirs.id]
+    assert str(results['entries'][0]['term']) == '<mark>Chlorophyll</mark>'
+
+
+def test_query_syntax_is_never_passed_through(app, user):
+    other = make_user()
+    theirs = make_set(other, 'Secret deck')
+    cardbase.import_flash_card_rows(theirs.id, [('Password', 'hunter2')])
+    for query in ('"password" OR owner', 'password) OR (owner : u1', 'NEAR(password', '*'):
+        assert cardbase.search_flash_cards(user.id, query)['entries'] == []
+
+
+def test_search_pages(client, user, monkeypatch):
+    monkeypatch.setattr(cardbase, 'SEARCH_PAGE_SIZE', 2)
+    flash_card_set = make_set(user, 'Elements')
+    cardbase.import_flash_card_rows(flash_card_set.id, [(f'Metal {n}', 'A shiny metal element') for n in range(5)])
+    first = client.get('/api/search?q=shiny+metal').get_json()
+    last = client.get('/api/search?q=shiny+metal&page=3').get_json()
+    assert (len(first['entries']), first['has_more']) == (2, True)
+    assert (len(last['entries']), last['has_more'], last['sets']) == (1, False, [])
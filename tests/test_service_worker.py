@@ -0,0 +1,21 @@
+import json
+
+import app as cardbase
+
+
+def test_worker_lists_only_shell_assets(app):
+    response = app.test_client().get('/sw.js')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/javascript'
+    assert response.headers['Service-Worker-Allowed'] == '/'
+    body = response.get_data(as_text=True)
+    with app.test_request_context():
+        shell_assets = [cardbase.url_for('static', filename=filename) for filename in cardbase.OFFLINE_SHELL_ASSETS]
+    assert f'var SHELL_ASSETS = {json.dumps(shell_assets)};' in body
+    assert f'var CDN_ASSETS = {json.dumps(cardbase.OFFLINE_CDN_ASSETS)};' in body
+
+
+def test_layout_loads_cdn_assets_with_cors(client):
+    page = client.get('/flash_card_sets').get_data(as_text=True)
+    for url in cardbase.OFFLINE_CDN_ASSETS:
+        assert f'"{url}" crossorigin="anonymous"' in page
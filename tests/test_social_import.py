@@ -0,0 +1,35 @@
+import io
+
+import app as cardbase
+
+ORIGINAL = ('Mitochondria are the organelles that produce most of the chemical energy '
+            'needed to power the biochemical reactions of the cell #biology')
+
+
+def test_filter_posts_drops_near_duplicates(app):
+    records = [
+        {'id': 1, 'full_text': ORIGINAL},
+        {'id': 2, 'full_text': 'RT @teacher: ' + ORIGINAL + ' https://example.com/cells'},
+        {'id': 3, 'full_text': ORIGINAL.replace('produce most of', 'produce nearly all of') + '!'},
+        {'id': 4, 'full_text': ORIGINAL.replace('the cell', 'a cell')},
+        {'id': 5, 'full_text': 'Ribosomes read messenger RNA and assemble proteins from amino acids #biology'},
+    ]
+    kept = [post['id'] for post in cardbase.filter_posts(records, hashtag='biology')]
+    assert kept == ['1', '5']
+
+
+def test_filter_posts_keeps_distinct_posts_sharing_a_template(app):
+    records = [
+        {'id': index, 'text': f'New lesson today: {topic} explained step by step with worked examples'}
+        for index, topic in enumerate(['photosynthesis in plants', 'plate tectonics and earthquakes',
+                                       'supply and demand curves'])
+    ]
+    assert len(list(cardbase.filter_posts(records))) == 3
+
+
+def test_filter_posts_reads_streamed_jsonl(app):
+    stream = io.StringIO('\n'.join([
+        '{"id": 1, "text": "%s"}' % ORIGINAL,
+        '{"id": 2, "text": "%s"}' % ORIGINAL.replace('chemical energy', 'energy'),
+    ]))
+    assert [post['id'] for post in cardbase.filter_posts(cardbase.iter_json_records(stream))] == ['1']
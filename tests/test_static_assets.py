@@ -0,0 +1,84 @@
+import gzip
+import os
+
+import pytest
+from flask import url_for
+
+import app as cardbase
+
+STYLE = b'body { color: #222; }\n' * 200
+
+
+@pytest.fixture
+def static_dir(app, tmp_path, monkeypatch):
+    folder = tmp_path / 'static'
+    (folder / 'css').mkdir(parents=True)
+    (folder / 'css' / 'site.css').write_bytes(STYLE)
+    monkeypatch.setattr(app, 'static_folder', str(folder))
+    monkeypatch.setattr(cardbase, 'static_manifest', {})
+    monkeypatch.setattr(cardbase, 'brotli', None)
+    return folder
+
+
+def static_url(app, filename):
+    with app.test_request_context():
+        return url_for('static', filename=filename)
+
+
+def test_fingerprinted_asset_is_immutable(app, static_dir):
+    url = static_url(app, 'css/site.css')
+    assert url == f'/static/css/site.{cardbase.content_digest(STYLE)}.css'
+
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.data == STYLE
+    assert response.cache_control.public
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == cardbase.STATIC_IMMUTABLE_MAX_AGE
+    assert 'Accept-Encoding' in response.vary
+    response.close()
+
+
+def test_plain_and_outdated_urls_are_not_immutable(app, static_dir):
+    client = app.test_client()
+    for url in ('/static/css/site.css', '/static/css/site.0123456789.css'):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data == STYLE
+        assert not response.cache_control.immutable
+        response.close()
+    assert client.get('/static/css/missing.0123456789.css').status_code == 404
+
+
+def test_precompressed_copy_is_served(app, static_dir):
+    assert cardbase.precompress_static(str(static_dir)) == 1
+    assert (static_dir / 'css' / 'site.css.gz').exists()
+    assert cardbase.precompress_static(str(static_dir)) == 0
+    url = static_url(app, 'css/site.css')
+
+    response = app.test_client().get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'Accept-Encoding' in response.vary
+    assert response.cache_control.immutable
+    assert gzip.decompress(response.data) == STYLE
+    response.close()
+
+    response = app.test_client().get(url)
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == STYLE
+    response.close()
+
+
+def test_stale_precompressed_copy_is_ignored(app, static_dir):
+    cardbase.precompress_static(str(static_dir))
+    path = static_dir / 'css' / 'site.css'
+    gz = static_dir / 'css' / 'site.css.gz'
+    stamp = gz.stat().st_mtime
+    os.utime(path, (stamp + 10, stamp + 10))
+
+    response = app.test_client().get('/static/css/site.css', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == STYLE
+    response.close()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import app as cardbase
+
+
+def worker_insert(flash_card_set, term):
+    # Written the way the job worker writes: committed by another connection,
+    # so this process's ORM events never see it.
+    with cardbase.db.engine.begin() as connection:
+        connection.execute(cardbase.db.insert(cardbase.FlashCardEntry).values(
+            flashcard_set_id=flash_card_set.id, term=term, definition='from a job'))
+
+
+def suggestions(user, prefix):
+    index = cardbase.get_prefix_index(user.id)
+    with cardbase.prefix_index_lock:
+        return [suggestion['label'] for suggestion in index.suggest(prefix)]
+
+
+def wait_for_refresh(user):
+    index = cardbase.prefix_indexes[user.id]
+    deadline = time.monotonic() + 5
+    while index.refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not index.refreshing
+
+
+def test_index_catches_up_with_writes_from_other_processes(app, user, monkeypatch):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Biology', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    assert suggestions(user, 'bio') == []
+    wait_for_refresh(user)
+    assert suggestions(user, 'bio') == ['Biology']
+
+    worker_insert(flash_card_set, 'Mitochondria')
+    assert suggestions(user, 'mito') == []
+
+    monkeypatch.setattr(cardbase, 'PREFIX_INDEX_SYNC_INTERVAL', 0)
+    suggestions(user, 'mito')
+    wait_for_refresh(user)
+    assert suggestions(user, 'mito') == ['Mitochondria']
+    wait_for_refresh(user)
+
+    with cardbase.db.engine.begin() as connection:
+        connection.execute(cardbase.db.delete(cardbase.FlashCardEntry).where(
+            cardbase.FlashCardEntry.flashcard_set_id == flash_card_set.id))
+    suggestions(user, 'mito')
+    wait_for_refresh(user)
+    assert suggestions(user, 'mito') == []
+
+
+def test_lookups_never_query_the_database(app, user, monkeypatch):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Physics', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    suggestions(user, 'phy')
+    wait_for_refresh(user)
+
+    # Stale and lagging indexes are still answered from memory; only the
+    # background thread they start reads the database.
+    monkeypatch.setattr(cardbase, 'PREFIX_INDEX_SYNC_INTERVAL', 0)
+    monkeypatch.setattr(cardbase, 'PREFIX_INDEX_MAX_AGE', 0)
+    callers = []
+
+    def record_caller(*args):
+        callers.append(threading.get_ident())
+
+    cardbase.event.listen(cardbase.db.engine, 'before_cursor_execute', record_caller)
+    try:
+        assert suggestions(user, 'phy') == ['Physics']
+        wait_for_refresh(user)
+    finally:
+        cardbase.event.remove(cardbase.db.engine, 'before_cursor_execute', record_caller)
+    assert callers
+    assert threading.get_ident() not in callers
+
+
+def test_login_warms_the_index(app, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Geology', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    cardbase.prefix_indexes.pop(user.id, None)
+    response = app.test_client().post('/login', data={'email': user.email, 'password': 'password123'})
+    assert response.status_code == 302
+    assert user.id in cardbase.prefix_indexes
+    wait_for_refresh(user)
+    assert suggestions(user, 'geo') == ['Geology']
+
+
+def test_job_snapshot_leaves_the_index_alone(app, user):
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Chemistry', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    job = cardbase.enqueue_job('import_terms', {}, user_id=user.id, flashcard_set_id=flash_card_set.id)
+    suggestions(user, 'chem')
+    wait_for_refresh(user)
+    assert suggestions(user, 'chem') == ['Chemistry']
+
+    worker_insert(flash_card_set, 'Covalent bond')
+    snapshot = cardbase.job_snapshot(job.id)
+    assert [card['term'] for card in snapshot['cards']] == ['Covalent bond']
+    assert suggestions(user, 'cova') == []
@@ -0,0 +1,39 @@
+import app as cardbase
+
+
+def create_set(client, title):
+    client.post('/create_set', data={'set_title': title, 'set_description': 'Test set'})
+    return cardbase.FlashCardSet.query.filter_by(set_title=title).one()
+
+
+def test_recreated_set_gets_new_id_and_entry_tombstones(client):
+    keep = create_set(client, 'Keep')
+    doomed = create_set(client, 'Doomed')
+    response = client.post(f'/api/flash_card_sets/{doomed.id}/entries', json={'changes': [
+        {'key': 'a', 'term': 'alpha', 'definition': 'first'},
+        {'key': 'b', 'term': 'beta', 'definition': 'second'},
+    ]})
+    entry_ids = sorted(response.get_json()['created'].values())
+    doomed_id = doomed.id
+    token = client.get('/api/sync').get_json()['token']
+
+    client.post(f'/delete_flash_card_set/{doomed_id}')
+    recreated = create_set(client, 'Recreated')
+
+    changes = client.get('/api/sync', query_string={'since': token}).get_json()
+    assert recreated.id > doomed_id > keep.id
+    assert changes['deleted']['sets'] == [doomed_id]
+    assert sorted(changes['deleted']['entries']) == entry_ids
+    assert [payload['id'] for payload in changes['sets']] == [recreated.id]
+
+
+def test_deleting_a_set_deletes_its_reviews(client, user):
+    flash_card_set = create_set(client, 'Reviewed')
+    response = client.post(f'/api/flash_card_sets/{flash_card_set.id}/entries', json={'changes': [
+        {'key': 'a', 'term': 'alpha', 'definition': 'first'},
+    ]})
+    entry_id = response.get_json()['created']['a']
+    assert client.post('/api/reviews', json={'entry_id': entry_id, 'grade': 2}).get_json()['accepted'] == 1
+
+    client.post(f'/delete_flash_card_set/{flash_card_set.id}')
+    assert cardbase.FlashCardReview.query.filter_by(user_id=user.id).count() == 0
@@ -0,0 +1,76 @@
+import io
+
+import pytest
+
+import app as cardbase
+
+
+def lines(text):
+    return io.StringIO(text)
+
+
+@pytest.mark.parametrize('text, delimiter', [
+    ('cell\tunit of life\natom\tsmallest unit of matter\n', '\t'),
+    ('cell;unit of life\natom;smallest unit of matter\n', ';'),
+    ('cell,unit of life\natom,smallest unit of matter\n', ','),
+    ('"cell","unit of life, the smallest living thing"\n"atom","smallest unit, of matter"\n', ','),
+    ('cell - unit of life\natom — smallest unit of matter\n', None),
+    ('', '\t'),
+])
+def test_sniff_delimiter(text, delimiter):
+    assert cardbase.sniff_delimiter(text.splitlines(True)) == delimiter
+
+
+def test_quoted_commas_stay_in_the_definition():
+    rows = list(cardbase.parse_flash_card_rows(lines(
+        'term,definition\n'
+        '"mitosis","division of a cell into two identical cells, each with a full set of chromosomes"\n'
+        '"ATP","energy carrier, made in mitochondria"\n')))
+    assert rows == [
+        ('mitosis', 'division of a cell into two identical cells, each with a full set of chromosomes'),
+        ('ATP', 'energy carrier, made in mitochondria'),
+    ]
+
+
+def test_tabs_keep_commas_and_semicolons():
+    rows = list(cardbase.parse_flash_card_rows(lines(
+        'osmosis\twater moving across a membrane; from dilute to concentrated\n'
+        'enzyme\ta protein catalyst, reused many times\n')))
+    assert rows == [
+        ('osmosis', 'water moving across a membrane; from dilute to concentrated'),
+        ('enzyme', 'a protein catalyst, reused many times'),
+    ]
+
+
+def test_semicolons_with_header_and_blank_or_short_rows(monkeypatch):
+    monkeypatch.setattr(cardbase, 'IMPORT_SAMPLE_LINES', 3)
+    rows = list(cardbase.parse_flash_card_rows(lines(
+        'Term;Definition\n'
+        'nucleus; holds the DNA \n'
+        '\n'
+        'orphan\n'
+        ';no term\n'
+        'ribosome;makes proteins\n')))
+    assert rows == [('nucleus', 'holds the DNA'), ('ribosome', 'makes proteins')]
+
+
+def test_dash_separated_lines_split_once():
+    rows = list(cardbase.parse_flash_card_rows(lines('pH - acidity - on a log scale\nmolar mass – grams per mole\n')))
+    assert rows == [('pH', 'acidity - on a log scale'), ('molar mass', 'grams per mole')]
+
+
+def test_long_fields_are_truncated():
+    (term, definition), = cardbase.parse_flash_card_rows(lines('word\t' + 'x' * 1000 + '\n'))
+    assert len(definition) <= cardbase.MAX_FIELD_LENGTH
+
+
+def test_sniffs_from_the_head_and_streams_the_rest(app, user, monkeypatch):
+    monkeypatch.setattr(cardbase, 'IMPORT_SAMPLE_LINES', 2)
+    text = ''.join(f'term {n};definition {n}\n' for n in range(25))
+    flash_card_set = cardbase.FlashCardSet(user_id=user.id, set_title='Bulk', set_description='Test set')
+    cardbase.db.session.add(flash_card_set)
+    cardbase.db.session.commit()
+    imported = cardbase.import_flash_card_rows(flash_card_set.id, cardbase.parse_flash_card_rows(lines(text)), batch_size=10)
+    assert imported == 25
+    entries = cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id).order_by(cardbase.FlashCardEntry.id).all()
+    assert [(entry.term, entry.definition) for entry in entries] == [(f'term {n}', f'definition {n}') for n in range(25)]
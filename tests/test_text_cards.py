@@ -0,0 +1,52 @@
+import os
+
+import app as cardbase
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_defined_terms_come_first_with_their_definitions():
+    cards = cardbase.extract_flash_cards(read_fixture('photosynthesis.txt'), max_cards=10)
+    defined = {card['term']: card['definition'] for card in cards[:4]}
+    assert defined == {
+        'Photosynthesis': 'The process by which green plants turn light, water and carbon dioxide into sugar and oxygen',
+        'Chlorophyll': 'The green pigment in chloroplasts that absorbs the light used to power photosynthesis',
+        'Calvin cycle': 'The set of reactions that fixes carbon dioxide into three-carbon sugars',
+        'Stomata': 'Small pores on the underside of a leaf that let carbon dioxide in and oxygen out',
+    }
+
+
+def test_each_sentence_defines_at_most_one_card():
+    cards = cardbase.extract_flash_cards(read_fixture('photosynthesis.txt'), max_cards=10)
+    indexes = [card['sentence_index'] for card in cards]
+    assert len(indexes) == len(set(indexes))
+    assert cards[0]['sentence_index'] == 2
+
+
+def test_max_cards_and_empty_text():
+    assert len(cardbase.extract_flash_cards(read_fixture('photosynthesis.txt'), max_cards=2)) == 2
+    assert cardbase.extract_flash_cards('', max_cards=5) == []
+
+
+def test_split_sentences_match_text():
+    # Importers that already split their sources pass sentences, not text.
+    text = read_fixture('photosynthesis.txt')
+    sentences = list(cardbase.split_sentences(text))
+    assert len(sentences) == 6
+    assert cardbase.extract_flash_cards(iter(sentences)) == cardbase.extract_flash_cards(text)
+
+
+def test_create_with_text_saves_the_cards(client, user):
+    response = client.post('/create_with_text', data={
+        'set_title': 'Plants', 'set_description': 'Photosynthesis notes',
+        'text': read_fixture('photosynthesis.txt'), 'max_cards': 4, 'submit': 'Generate Cards',
+    })
+    assert response.status_code == 302
+    flash_card_set = cardbase.FlashCardSet.query.filter_by(user_id=user.id).one()
+    terms = {entry.term for entry in cardbase.FlashCardEntry.query.filter_by(flashcard_set_id=flash_card_set.id)}
+    assert terms == {'Photosynthesis', 'Chlorophyll', 'Calvin cycle', 'Stomata'}
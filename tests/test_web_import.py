@@ -0,0 +1,64 @@
+import pytest
+
+import app as cardbase
+
+ARTICLE = """<html><head><title>Photosynthesis</title></head><body>
+<nav><a href="/">Home</a></nav>
+<main><h1>Photosynthesis</h1>
+<p>Photosynthesis is the process by which green plants turn light, water and carbon dioxide into sugar.</p>
+<p>Chlorophyll is the green pigment in chloroplasts that absorbs the light used to power photosynthesis.</p>
+<p>The Calvin cycle uses the energy captured in the light reactions to fix carbon dioxide into sugars.</p>
+</main></body></html>"""
+
+
+def test_fetch_web_page_extracts_main_text(web_site):
+    (web_site.root / 'article.html').write_text(ARTICLE)
+    meta, body = cardbase.fetch_web_page(web_site.url + '/article.html')
+    title, text = cardbase.extract_main_text(body, meta['charset'])
+    assert title == 'Photosynthesis'
+    assert 'Chlorophyll is the green pigment' in text
+    assert 'Home' not in text
+
+
+def test_fetch_follows_redirects_between_public_pages(web_site):
+    (web_site.root / 'article.html').write_text(ARTICLE)
+    web_site.redirects['/old'] = web_site.url + '/article.html'
+    meta, body = cardbase.fetch_web_page(web_site.url + '/old')
+    assert meta['final_url'] == web_site.url + '/article.html'
+    assert b'Calvin cycle' in body
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1/',
+    'http://localhost/',
+    'http://[::1]/',
+    'http://10.0.0.1/',
+    'http://192.168.1.1/',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://[::ffff:169.254.169.254]/',
+    'file:///etc/passwd',
+])
+def test_refuses_non_public_urls(app, url):
+    with pytest.raises(ValueError):
+        cardbase.fetch_web_page(url)
+
+
+def test_refuses_redirect_to_metadata_address(web_site):
+    web_site.redirects['/go'] = 'http://169.254.169.254/latest/meta-data/'
+    with pytest.raises(ValueError):
+        cardbase.fetch_web_page(web_site.url + '/go')
+    assert web_site.requests == ['/go']
+
+
+def test_refuses_loopback_unless_allowed(web_site, monkeypatch):
+    (web_site.root / 'secret.html').write_text('secret')
+    monkeypatch.setattr(cardbase, 'WEB_ALLOWED_NETWORKS', [])
+    with pytest.raises(ValueError):
+        cardbase.fetch_web_page(web_site.url + '/secret.html')
+    assert web_site.requests == []
+
+
+def test_create_with_web_page_refuses_private_url(client, user):
+    response = client.post('/create_with_web_page', data={'url': 'http://169.254.169.254/latest/meta-data/'})
+    assert response.status_code == 200
+    assert cardbase.FlashCardSet.query.filter_by(user_id=user.id).count() == 0